@@ -275,6 +275,141 @@ def create_app():
         db.session.commit()
         print(f"Success! Agency '{old_name}' renamed to '{new_name}'.")
 
+    @app.cli.command("recalculate-contracts")
+    @click.option("--agency-id", "agency_ids", type=int, multiple=True, help="Limit to this agency (repeatable).")
+    def recalculate_contracts(agency_ids):
+        """Recalculates ContractCalculations in bulk, per agency, with a timing report."""
+        from app.services.recalculation_engine import recalculate_agency_contracts
+        from app.services.response_cache import bump_data_version
+        from .models import Assignment
+
+        if not agency_ids:
+            agency_ids = [row[0] for row in db.session.query(Assignment.agency_id).distinct().order_by(Assignment.agency_id)]
+
+        total_assignments = total_records = 0
+        total_seconds = 0.0
+        for agency_id in agency_ids:
+            report = recalculate_agency_contracts(agency_id)
+            bump_data_version(agency_id)
+            total_assignments += report['assignments']
+            total_records += report['records']
+            total_seconds += report['total_seconds']
+            print(f"  - Agency {agency_id}: {report['assignments']} contracts, {report['records']} records "
+                  f"in {report['total_seconds']:.3f}s (load {report['load_seconds']:.3f}s, "
+                  f"compute {report['compute_seconds']:.3f}s, write {report['write_seconds']:.3f}s)")
+        print(f"Success! {total_assignments} contracts ({total_records} records) recalculated in {total_seconds:.3f}s.")
+
+    @app.cli.command("recalc")
+    @click.option("--agency-id", "agency_ids", type=int, multiple=True, help="Limit to this agency (repeatable).")
+    @click.option("--workers", type=int, default=None, help="Number of worker processes (default: CPU count).")
+    @click.option("--chunk-size", type=int, default=2000, show_default=True, help="Max assignments per partition.")
+    def recalc(agency_ids, workers, chunk_size):
+        """Recalculates ContractCalculations in parallel, partitioned by agency and id range."""
+        from app.services.recalculation_engine import recalculate_parallel
+        from app.services.response_cache import bump_data_version
+
+        report = recalculate_parallel(list(agency_ids) or None, workers=workers, chunk_size=chunk_size)
+        # Pages en cache des agences recalculées (toutes sans --agency-id), dans tous les processus
+        for agency_id in agency_ids or [None]:
+            bump_data_version(agency_id)
+        writer = "single serialized writer" if report['serialized_writer'] else "workers write"
+        print(f"  - {report['partitions']} partitions on {report['workers']} workers ({writer})")
+        print(f"  - Throughput: {report['assignments_per_second']:.0f} assignments/s, "
+              f"{report['records_per_second']:.0f} records/s")
+        print(f"Success! {report['assignments']} contracts ({report['records']} records) recalculated in {report['seconds']:.3f}s.")
+
+    @app.cli.command("rebuild-rollups")
+    @click.option("--agency-id", "agency_ids", type=int, multiple=True, help="Limit to this agency (repeatable).")
+    def rebuild_rollups(agency_ids):
+        """Rebuilds the daily rollup table (per agency, venue and day) from performance records."""
+        from app.services.response_cache import bump_data_version
+        from app.services.rollup_service import rebuild_daily_rollups
+        from .models import Assignment
+
+        if not agency_ids:
+            agency_ids = [row[0] for row in db.session.query(Assignment.agency_id).distinct().order_by(Assignment.agency_id)]
+
+        total_records = total_rows = 0
+        total_seconds = 0.0
+        for agency_id in agency_ids:
+            report = rebuild_daily_rollups(agency_id)
+            bump_data_version(agency_id)
+            total_records += report['records']
+            total_rows += report['rows']
+            total_seconds += report['seconds']
+            print(f"  - Agency {agency_id}: {report['records']} records -> {report['rows']} rollup rows in {report['seconds']:.3f}s")
+        print(f"Success! {total_rows} rollup rows rebuilt from {total_records} records in {total_seconds:.3f}s.")
+
+    @app.cli.command("rebuild-search-index")
+    def rebuild_search_index_command():
+        """Rebuilds the SQLite staff search index (FTS5) from the staff profiles."""
+        from app.services.staff_search import rebuild_search_index
+
+        indexed = rebuild_search_index()
+        if indexed is None:
+            print("Nothing to do: the pg_trgm index is maintained by the database.")
+        else:
+            print(f"Success! {indexed} staff profiles indexed.")
+
+    @app.cli.command("backfill-image-derivatives")
+    @click.option("--force", is_flag=True, help="Recreate derivatives that already exist.")
+    @click.option("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    def backfill_image_derivatives(force, workers):
+        """Creates the print and web derivatives of existing staff photos and venue logos, in parallel."""
+        import time
+        from app.models import StaffProfile, Venue
+        from app.services.image_derivatives import backfill_derivatives, venue_logo_folder
+        from app.services.response_cache import bump_data_version
+
+        targets = (
+            ("Staff photos", app.config['UPLOAD_FOLDER'], StaffProfile.__table__.c.photo_url,
+             StaffProfile.__table__.c.photo_placeholder, ''),
+            ("Venue logos", venue_logo_folder(), Venue.__table__.c.logo_url,
+             Venue.__table__.c.logo_placeholder, '/static/uploads/venues/'),
+        )
+        for label, folder, url_column, placeholder_column, url_prefix in targets:
+            start = time.perf_counter()
+            report = backfill_derivatives(folder, force=force, workers=workers)
+            # Aperçus des images traitées, reportés sur les profils et venues qui les utilisent
+            if report['placeholders']:
+                db.session.execute(
+                    db.update(url_column.table)
+                    .where(url_column == db.bindparam('image_url'))
+                    .values({placeholder_column.name: db.bindparam('image_placeholder')}),
+                    [{'image_url': url_prefix + filename, 'image_placeholder': placeholder}
+                     for filename, placeholder in report['placeholders'].items()]
+                )
+                db.session.commit()
+            print(f"  - {label}: {report['created']} created, {report['skipped']} already done, "
+                  f"{report['failed']} failed in {time.perf_counter() - start:.1f}s")
+        bump_data_version()
+        print("Success! Image derivatives are up to date.")
+
+    @app.cli.command("rekey-uploads")
+    def rekey_uploads_command():
+        """Moves existing uploads to content-addressed names, removing identical copies."""
+        from app.services.response_cache import bump_data_version
+        from app.services.upload_store import rekey_uploads
+
+        report = rekey_uploads()
+        bump_data_version()
+        print(f"  - {report['files']} files examined: {report['renamed']} renamed, {report['duplicates']} duplicates removed")
+        print(f"  - {report['references']} references created, {report['bytes_freed'] / (1024 * 1024):.1f} MB freed")
+        print("Success! Uploads are content-addressed.")
+
+    @app.cli.command("gc-uploads")
+    @click.option("--dry-run", is_flag=True, help="Report what would be removed without deleting anything.")
+    @click.option("--grace", type=int, default=None, help="Keep unreferenced files younger than this many seconds.")
+    def gc_uploads(dry_run, grace):
+        """Removes uploaded files no profile or venue references anymore."""
+        from app.services.upload_store import collect_garbage
+
+        report = collect_garbage(grace=grace, dry_run=dry_run)
+        verb = "Would remove" if dry_run else "Removed"
+        print(f"  - {verb} {report['blobs']} unreferenced blobs and {report['files']} orphan files "
+              f"({report['bytes'] / (1024 * 1024):.1f} MB), {report['references']} stale references")
+        print("Success! Upload garbage collection finished.")
+
     return app
 
 @login_manager.user_loader
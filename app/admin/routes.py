@@ -3,8 +3,10 @@
 from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, send_file, send_from_directory, current_app
 from flask_login import login_required, current_user
 from app.decorators import webdev_required, role_required, admin_required
-from app.models import Agency, User, UserRole, StaffProfile, Venue, AgencyPosition, AgencyContract, Assignment, PerformanceRecord, ContractCalculations
+from app.models import Agency, User, UserRole, StaffProfile, Venue, AgencyPosition, AgencyContract, Assignment, PerformanceRecord, ContractCalculations, DailyRollup
 from app.services.agency_management_service import AgencyManagementService
+from app.services.contract_rules import invalidate_contract_rules
+from app.services.response_cache import register_data_version_hook
 
 from app import db
 import subprocess
@@ -12,6 +14,7 @@ import time
 from sqlalchemy import func
 
 admin_bp = Blueprint('admin', __name__, template_folder='../templates', url_prefix='/admin')
+register_data_version_hook(admin_bp, all_agencies=True)
 
 @admin_bp.route('/manage_agencies')
 @login_required
@@ -395,6 +398,7 @@ def force_delete_agency(agency_id):
 
                 Assignment.query.filter_by(agency_id=agency_id).delete(synchronize_session=False)
 
+            DailyRollup.query.filter_by(agency_id=agency_id).delete(synchronize_session=False)
             StaffProfile.query.filter_by(agency_id=agency_id).delete(synchronize_session=False)
             Venue.query.filter_by(agency_id=agency_id).delete(synchronize_session=False)
             AgencyPosition.query.filter_by(agency_id=agency_id).delete(synchronize_session=False)
@@ -404,6 +408,7 @@ def force_delete_agency(agency_id):
             # Finally, delete the agency itself
             db.session.delete(agency)
             db.session.commit()
+            invalidate_contract_rules(agency_id)
 
             return jsonify({'status': 'success', 'message': f'Agency "{agency.name}" has been permanently deleted.'}), 200
         except Exception as e:
@@ -540,6 +545,14 @@ def reactivate_agency(agency_id):
         flash(f'Error reactivating agency: {str(e)}', 'error')
         return redirect(url_for('admin.manage_agencies'))
 
+@admin_bp.route('/api/pdf-queue')
+@login_required
+@admin_required
+def pdf_queue_vitals():
+    """Profondeur de la file de rendu PDF et temps de rendu récents."""
+    from app.services.pdf_queue import pdf_queue_stats
+    return jsonify(pdf_queue_stats())
+
 @admin_bp.route('/debug-vitals')
 @login_required
 @admin_required
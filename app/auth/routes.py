@@ -4,6 +4,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models import db, User, UserRole
 from app.decorators import admin_required, manager_required, super_admin_required, webdev_required, user_management_required
+from app.services.response_cache import read_only, register_data_version_hook
 
 # Imports for WTF-Forms
 from flask_wtf import FlaskForm
@@ -12,6 +13,7 @@ from wtforms.validators import DataRequired
 
 # Blueprint Definition
 auth_bp = Blueprint('auth', __name__, template_folder='../templates')
+register_data_version_hook(auth_bp)
 
 # --- Form Classes ---
 class LoginForm(FlaskForm):
@@ -273,6 +275,9 @@ def switch_agency():
 def manage_contracts():
     """API for managing agency contracts."""
     from app.models import AgencyContract
+    from app.services.payroll_service import mark_contract_calculations_stale
+    from app.services.contract_rules import invalidate_contract_rules
+    from app.services.recalculation_engine import enqueue_contract_rederivation
     from flask import session
     
     # Get current agency ID
@@ -329,10 +334,16 @@ def manage_contracts():
         )
         
         db.session.add(contract)
+        # Assignments already using this contract name now get its rules: their totals are stale
+        mark_contract_calculations_stale(agency_id, contract_types=[contract.name])
         db.session.commit()
+        invalidate_contract_rules(agency_id)
+        # Records, totaux et rollups sont recalculés en arrière-plan: la requête n'attend pas
+        job = enqueue_contract_rederivation(agency_id, [contract.name])
         
         return jsonify({
             'message': 'Contract created successfully',
+            'job_id': job.id,
             'contract': {
                 'id': contract.id,
                 'name': contract.name,
@@ -357,6 +368,8 @@ def manage_contracts():
         if not contract:
             return jsonify({'error': 'Contract not found'}), 404
         
+        previous_name = contract.name
+        
         # Update fields
         contract.name = data.get('name', contract.name)
         contract.days = data.get('days', contract.days)
@@ -366,10 +379,18 @@ def manage_contracts():
         contract.drink_price = data.get('drink_price', contract.drink_price)
         contract.staff_commission = data.get('staff_commission', contract.staff_commission)
         
+        # Rules changed: totals of assignments under the old and new name must be recomputed
+        mark_contract_calculations_stale(agency_id, contract_types={previous_name, contract.name})
         db.session.commit()
+        invalidate_contract_rules(agency_id)
+        # Records, totaux et rollups sont recalculés en arrière-plan: la requête n'attend pas.
+        # Après un renommage, les assignments de l'ancien nom gardent leurs records (seuls leurs
+        # totaux sont rafraîchis): le job ne réécrit que les records des contrats existants
+        job = enqueue_contract_rederivation(agency_id, {previous_name, contract.name})
         
         return jsonify({
             'message': 'Contract updated successfully',
+            'job_id': job.id,
             'contract': {
                 'id': contract.id,
                 'name': contract.name,
@@ -393,10 +414,94 @@ def manage_contracts():
         if not contract:
             return jsonify({'error': 'Contract not found'}), 404
         
+        contract_name = contract.name
+        mark_contract_calculations_stale(agency_id, contract_types=[contract_name])
         db.session.delete(contract)
         db.session.commit()
+        invalidate_contract_rules(agency_id)
+        # Sans règles, les valeurs journalières enregistrées sont conservées: seuls les totaux
+        # et les rollups sont recalculés, en arrière-plan
+        job = enqueue_contract_rederivation(agency_id, [contract_name], rederive_records=False)
         
-        return jsonify({'message': 'Contract deleted successfully'})
+        return jsonify({'message': 'Contract deleted successfully', 'job_id': job.id})
+
+@auth_bp.route('/auth/api/contracts/jobs/<int:job_id>', methods=['GET'])
+@login_required
+@super_admin_required
+def contract_job_status(job_id):
+    """Status and progress of a background re-derivation job started by a contract edit."""
+    from app.models import BackgroundJob
+    from flask import session
+    
+    # Get current agency ID
+    if current_user.role == UserRole.WEBDEV.value:
+        agency_id = session.get('current_agency_id', current_user.agency_id)
+    else:
+        agency_id = current_user.agency_id
+    
+    job = BackgroundJob.query.filter_by(id=job_id, agency_id=agency_id).first()
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job.to_dict())
+
+@auth_bp.route('/auth/api/contracts/simulate', methods=['POST'])
+@login_required
+@super_admin_required
+@read_only
+def simulate_contracts():
+    """
+    What-if: reprice the agency's history under proposed contract rules, without saving.
+    Body: {"contracts": {"<name>": {"drink_price": 250, ...}}, "start_date": "YYYY-MM-DD", "end_date": "YYYY-MM-DD"}
+    """
+    from app.services.recalculation_engine import simulate_contract_rules, SIMULATION_RULE_FIELDS
+    from app.models import Venue
+    from datetime import datetime
+    from flask import session
+    
+    # Get current agency ID
+    if current_user.role == UserRole.WEBDEV.value:
+        agency_id = session.get('current_agency_id', current_user.agency_id)
+    else:
+        agency_id = current_user.agency_id
+    
+    if not agency_id:
+        abort(403, "User not associated with an agency.")
+    
+    data = request.get_json() or {}
+    proposed = data.get('contracts')
+    if not isinstance(proposed, dict) or not proposed:
+        return jsonify({'error': 'contracts must map contract names to proposed rules'}), 400
+    
+    # Validate the proposed values the same way the contract form stores them
+    rules = {}
+    try:
+        for name, fields in proposed.items():
+            if not isinstance(fields, dict):
+                raise ValueError(f'Invalid rules for contract {name}')
+            unknown = set(fields) - set(SIMULATION_RULE_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown field(s): {', '.join(sorted(unknown))}")
+            rules[name] = {}
+            for field, value in fields.items():
+                if field == 'late_cutoff_time':
+                    datetime.strptime(value, '%H:%M')
+                    rules[name][field] = value
+                elif field == 'days':
+                    rules[name][field] = int(value)
+                else:
+                    rules[name][field] = float(value)
+        start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date() if data.get('start_date') else None
+        end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date() if data.get('end_date') else None
+        report = simulate_contract_rules(agency_id, rules, start_date, end_date)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    venue_names = dict(db.session.query(Venue.id, Venue.name).filter(Venue.agency_id == agency_id).all())
+    for row in report['by_venue']:
+        row['venue_name'] = venue_names.get(row['venue_id'])
+    
+    return jsonify(report)
 
 @auth_bp.route('/contracts')
 @login_required
@@ -523,6 +628,7 @@ def get_venues():
     """Get all venues for the current agency."""
     from app.models import Venue
     from flask import session
+    from app.services.image_derivatives import venue_logo_thumbnails
     
     # Get current agency ID
     if current_user.role == UserRole.WEBDEV.value:
@@ -539,6 +645,8 @@ def get_venues():
             'id': venue.id,
             'name': venue.name,
             'logo_url': venue.logo_url,
+            'logo_thumbnails': venue_logo_thumbnails(venue.logo_url),
+            'logo_placeholder': venue.logo_placeholder,
             'assignments_count': venue.assignments.count()
         } for venue in venues]
     })
@@ -550,8 +658,7 @@ def create_venue():
     """Create a new venue."""
     from app.models import Venue
     from flask import session
-    import os
-    from werkzeug.utils import secure_filename
+    from app.services.upload_store import VENUE_LOGO, VENUE_LOGO_STORE, VENUE_LOGO_URL_PREFIX, set_reference, store_image_upload
     
     # Get current agency ID
     if current_user.role == UserRole.WEBDEV.value:
@@ -567,19 +674,15 @@ def create_venue():
         return jsonify({'success': False, 'message': 'Venue name is required'}), 400
     
     # Handle logo upload
+    logo_blob = None
     logo_url = None
+    logo_placeholder = None
     if 'logo' in request.files:
         logo_file = request.files['logo']
         if logo_file and logo_file.filename:
-            # Create uploads directory if it doesn't exist
-            upload_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'uploads', 'venues')
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            # Save the file
-            filename = secure_filename(logo_file.filename)
-            filepath = os.path.join(upload_dir, filename)
-            logo_file.save(filepath)
-            logo_url = f'/static/uploads/venues/{filename}'
+            # Stored under its content hash: same-name logos no longer overwrite each other
+            logo_blob, logo_placeholder = store_image_upload(logo_file, VENUE_LOGO_STORE)
+            logo_url = VENUE_LOGO_URL_PREFIX + logo_blob.filename
     
     # Check if venue with same name already exists in this agency
     existing_venue = Venue.query.filter_by(name=name, agency_id=agency_id).first()
@@ -587,8 +690,11 @@ def create_venue():
         return jsonify({'success': False, 'message': f'Venue "{name}" already exists in this agency'}), 400
     
     # Create new venue
-    new_venue = Venue(name=name, logo_url=logo_url, agency_id=agency_id)
+    new_venue = Venue(name=name, logo_url=logo_url, logo_placeholder=logo_placeholder, agency_id=agency_id)
     db.session.add(new_venue)
+    if logo_blob is not None:
+        db.session.flush()
+        set_reference(VENUE_LOGO, new_venue.id, logo_blob)
     db.session.commit()
     
     return jsonify({
@@ -608,8 +714,7 @@ def update_venue(venue_id):
     """Update an existing venue."""
     from app.models import Venue
     from flask import session
-    import os
-    from werkzeug.utils import secure_filename
+    from app.services.upload_store import VENUE_LOGO, VENUE_LOGO_STORE, VENUE_LOGO_URL_PREFIX, set_reference, store_image_upload
     
     # Get current agency ID
     if current_user.role == UserRole.WEBDEV.value:
@@ -634,15 +739,10 @@ def update_venue(venue_id):
     if 'logo' in request.files:
         logo_file = request.files['logo']
         if logo_file and logo_file.filename:
-            # Create uploads directory if it doesn't exist
-            upload_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'uploads', 'venues')
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            # Save the file
-            filename = secure_filename(logo_file.filename)
-            filepath = os.path.join(upload_dir, filename)
-            logo_file.save(filepath)
-            venue.logo_url = f'/static/uploads/venues/{filename}'
+            # Stored under its content hash, the previous logo is collected by 'flask gc-uploads'
+            logo_blob, venue.logo_placeholder = store_image_upload(logo_file, VENUE_LOGO_STORE)
+            venue.logo_url = VENUE_LOGO_URL_PREFIX + logo_blob.filename
+            set_reference(VENUE_LOGO, venue.id, logo_blob)
     
     venue.name = name
     db.session.commit()
@@ -664,6 +764,7 @@ def delete_venue(venue_id):
     """Delete a venue."""
     from app.models import Venue, Assignment
     from flask import session
+    from app.services.upload_store import VENUE_LOGO, drop_reference
     
     # Get current agency ID
     if current_user.role == UserRole.WEBDEV.value:
@@ -681,13 +782,18 @@ def delete_venue(venue_id):
     
     # Keep assignments but set venue_id to NULL
     if linked_assignments:
+        # Les rollups de la venue sont reportés sur "sans venue"
+        from app.services.rollup_service import record_keys_for_assignments, refresh_rollup_keys
+        rollup_keys = record_keys_for_assignments([assignment.id for assignment in linked_assignments])
         for assignment in linked_assignments:
             assignment.venue_id = None
+        refresh_rollup_keys(agency_id, rollup_keys | {(None, record_date) for _, record_date in rollup_keys})
         message = f'Venue "{venue_name}" deleted successfully. {len(linked_assignments)} assignments were kept but are now unassigned.'
     else:
         message = f'Venue "{venue_name}" deleted successfully'
     
     # Delete the venue
+    drop_reference(VENUE_LOGO, venue_id)
     db.session.delete(venue)
     db.session.commit()
     
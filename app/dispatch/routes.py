@@ -5,16 +5,18 @@ from flask_login import login_required, current_user
 from app.models import db, StaffProfile, User, Assignment, Venue
 from app.decorators import admin_required, manager_required, super_admin_required, webdev_required, assignment_management_required, dispatch_view_required, dispatch_edit_required
 from datetime import datetime, date, timedelta
-from app.services.payroll_service import update_or_create_contract_calculations
+from app.services.payroll_service import refresh_stale_calculations
+from app.services.response_cache import register_data_version_hook
 
 dispatch_bp = Blueprint('dispatch', __name__, template_folder='../templates', url_prefix='/dispatch')
+register_data_version_hook(dispatch_bp)
 
 # --- Helper function ---
 def compute_end_date(start_date: date, contract_name: str, agency_id: int) -> date:
     """Compute end date based on contract name and agency."""
-    from app.models import AgencyContract
+    from app.services.contract_rules import get_contract_rules
     
-    contract = AgencyContract.query.filter_by(name=contract_name, agency_id=agency_id).first()
+    contract = get_contract_rules(agency_id, contract_name)
     if not contract:
         raise ValueError(f"Contract '{contract_name}' not found for this agency")
     
@@ -165,7 +167,7 @@ def create_assignment():
     db.session.add(new_a)
     db.session.commit()
     
-    update_or_create_contract_calculations(new_a.id)
+    refresh_stale_calculations([new_a])
     
     return jsonify({"status": "success", "assignment": new_a.to_dict()}), 201
 
@@ -202,7 +204,7 @@ def end_assignment_now(assignment_id):
 
     db.session.commit()
     
-    update_or_create_contract_calculations(a.id)
+    refresh_stale_calculations([a])
     
     return jsonify({
         "status": "success", 
@@ -223,7 +225,11 @@ def delete_assignment(assignment_id):
         agency_id = current_user.agency_id
     
     a = Assignment.query.filter_by(id=assignment_id, agency_id=agency_id).first_or_404()
+    # Les records sont supprimés en cascade: relever leurs jours pour recalculer les rollups
+    from app.services.rollup_service import record_keys_for_assignments, refresh_rollup_keys
+    rollup_keys = record_keys_for_assignments([a.id])
     db.session.delete(a)
+    refresh_rollup_keys(agency_id, rollup_keys)
     db.session.commit()
     return jsonify({"status": "success"}), 200
 
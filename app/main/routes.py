@@ -1,6 +1,6 @@
 # app/main/routes.py
-from flask import Blueprint, redirect, url_for
-from flask_login import login_required
+from flask import Blueprint, redirect, url_for, jsonify, abort, send_file
+from flask_login import login_required, current_user
 from app.decorators import admin_required, manager_required, super_admin_required, webdev_required
 
 main_bp = Blueprint('main', __name__)
@@ -11,3 +11,48 @@ main_bp = Blueprint('main', __name__)
 def index():
     # Redirige la page d'accueil vers la liste du staff
     return redirect(url_for('staff.staff_list'))
+
+
+def _pdf_job_or_404(job_id, kinds):
+    """Job PDF demandé par l'utilisateur courant (les documents sont propres à ses droits)."""
+    from app.models import BackgroundJob
+    from app.services.background_jobs import job_params
+
+    job = BackgroundJob.query.filter(BackgroundJob.id == job_id, BackgroundJob.kind.in_(kinds)).first()
+    if not job or job_params(job).get('user_id') != current_user.id:
+        abort(404)
+    return job
+
+@main_bp.route('/pdf/jobs/<int:job_id>')
+@login_required
+def pdf_job_status(job_id):
+    """Status of a queued PDF render (with the download URL once it is done) or of a ZIP export."""
+    from app.services.pdf_queue import PDF_RENDER_JOB, PDF_BATCH_JOB
+
+    job = _pdf_job_or_404(job_id, (PDF_RENDER_JOB, PDF_BATCH_JOB))
+    status = job.to_dict()
+    if job.status == 'done' and job.kind == PDF_RENDER_JOB:
+        status['download_url'] = url_for('main.pdf_job_download', job_id=job.id)
+    return jsonify(status)
+
+@main_bp.route('/pdf/jobs/<int:job_id>/download')
+@login_required
+def pdf_job_download(job_id):
+    """Serves the PDF produced by a finished render job."""
+    import os
+    from app.services.background_jobs import job_params
+    from app.services.pdf_queue import job_pdf_path, PDF_RENDER_JOB
+
+    job = _pdf_job_or_404(job_id, (PDF_RENDER_JOB,))
+    if job.status != 'done':
+        return jsonify({'status': job.status, 'message': 'PDF is not ready yet.'}), 409
+
+    pdf_path = job_pdf_path(job)
+    if not os.path.exists(pdf_path):
+        # Supprimé après PDF_JOB_RETENTION secondes
+        return jsonify({'status': 'expired', 'message': 'This PDF has expired, please generate it again.'}), 410
+
+    params = job_params(job)
+    return send_file(pdf_path, mimetype='application/pdf',
+                     as_attachment=params.get('disposition') == 'attachment',
+                     download_name=params['filename'])
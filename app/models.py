@@ -1,6 +1,7 @@
 # app/models.py
 
 import enum
+import json
 from app import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -42,6 +43,8 @@ class Venue(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     logo_url = db.Column(db.String(200), nullable=True)
+    # Aperçu flou du logo (data URI) affiché pendant le chargement de la dérivée
+    logo_placeholder = db.Column(db.Text, nullable=True)
     agency_id = db.Column(db.Integer, db.ForeignKey('agency.id'), nullable=False)
     
     # Relationships
@@ -165,6 +168,8 @@ class StaffProfile(db.Model):
     weight = db.Column(db.Float)
     status = db.Column(db.String(50), nullable=False, default='Screening')
     photo_url = db.Column(db.String(200), default='default_avatar.png')
+    # Aperçu flou de la photo (data URI) affiché pendant le chargement de la dérivée
+    photo_placeholder = db.Column(db.Text, nullable=True)
     admin_mama_name = db.Column(db.String(80))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     preferred_position = db.Column(db.String(80), nullable=True)
@@ -172,7 +177,11 @@ class StaffProfile(db.Model):
     
     assignments = db.relationship('Assignment', back_populates='staff', lazy=True)
 
-    __table_args__ = (db.UniqueConstraint('staff_id', 'agency_id', name='_staff_id_agency_uc'),)
+    # Liste du staff paginée par agence (tri par défaut sur created_at, filtre de statut)
+    __table_args__ = (db.UniqueConstraint('staff_id', 'agency_id', name='_staff_id_agency_uc'),
+                      db.Index('ix_staff_profile_agency_created_at', 'agency_id', 'created_at', 'id'),
+                      db.Index('ix_staff_profile_agency_status', 'agency_id', 'status'),
+                      db.Index('ix_staff_profile_agency_dob', 'agency_id', 'dob'))
 
     @property
     def age(self):
@@ -265,6 +274,10 @@ class ContractCalculations(db.Model):
     total_drinks = db.Column(db.Integer, default=0)
     total_special_comm = db.Column(db.Float, default=0.0)
     
+    # Staleness marker: set when performance records or contract rules change outside
+    # of the incremental delta path, cleared when the totals are recomputed
+    is_stale = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    
     # Timestamp
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -272,4 +285,104 @@ class ContractCalculations(db.Model):
     assignment = db.relationship('Assignment', back_populates='contract_calculations', uselist=False)
     
     def __repr__(self):
-        return f'<ContractCalculations for Assignment {self.assignment_id}>'
\ No newline at end of file
+        return f'<ContractCalculations for Assignment {self.assignment_id}>'
+
+
+class DailyRollup(db.Model):
+    __tablename__ = 'daily_rollup'
+    id = db.Column(db.Integer, primary_key=True)
+    agency_id = db.Column(db.Integer, db.ForeignKey('agency.id'), nullable=False)
+    # 0 for assignments without a venue: no NULL in the unique key so upserts can target it.
+    # Not a foreign key, rows of a deleted venue are folded into 0 by the rollup service.
+    venue_id = db.Column(db.Integer, nullable=False, default=0)
+    record_date = db.Column(db.Date, nullable=False)
+
+    # Materialized totals of the PerformanceRecords of that day, kept up to date by deltas
+    # on every write (app.services.rollup_service) and rebuilt by 'flask rebuild-rollups'
+    drinks = db.Column(db.Integer, nullable=False, default=0)
+    special_commissions = db.Column(db.Float, nullable=False, default=0.0)
+    salary = db.Column(db.Float, nullable=False, default=0.0)
+    commission = db.Column(db.Float, nullable=False, default=0.0)
+    profit = db.Column(db.Float, nullable=False, default=0.0)
+    headcount = db.Column(db.Integer, nullable=False, default=0)
+    lateness_minutes = db.Column(db.Integer, nullable=False, default=0)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __table_args__ = (db.UniqueConstraint('agency_id', 'venue_id', 'record_date', name='uq_rollup_agency_venue_date'),)
+
+    def to_dict(self):
+        return {
+            "agency_id": self.agency_id, "venue_id": self.venue_id or None,
+            "record_date": self.record_date.isoformat(),
+            "drinks": self.drinks, "special_commissions": self.special_commissions,
+            "salary": self.salary, "commission": self.commission, "profit": self.profit,
+            "headcount": self.headcount, "lateness_minutes": self.lateness_minutes,
+        }
+
+
+class BackgroundJob(db.Model):
+    __tablename__ = 'background_job'
+    id = db.Column(db.Integer, primary_key=True)
+    agency_id = db.Column(db.Integer, db.ForeignKey('agency.id'), nullable=True)
+    kind = db.Column(db.String(50), nullable=False)
+    # queued -> running -> done | failed
+    status = db.Column(db.String(20), nullable=False, default='queued')
+
+    # JSON encoded parameters and result, progress in units chosen by the job kind
+    params = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    progress_done = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            "id": self.id, "kind": self.kind, "status": self.status,
+            "progress_done": self.progress_done, "progress_total": self.progress_total,
+            "result": json.loads(self.result) if self.result else None,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_version'
+    # 0 holds the version of all agencies (admin writes), not a foreign key for that reason
+    agency_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    # Part of the response cache keys, incremented after every write of the agency so that
+    # every process (web workers, CLI, background jobs) sees the same invalidation
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class UploadBlob(db.Model):
+    __tablename__ = 'upload_blob'
+    id = db.Column(db.Integer, primary_key=True)
+    # Dossier de stockage ('photos', 'venue_logos', voir app.services.upload_store)
+    store = db.Column(db.String(20), nullable=False)
+    # Fichier nommé d'après son contenu: '<sha256>.<ext>', enregistré une seule fois par dossier
+    sha256 = db.Column(db.String(64), nullable=False)
+    filename = db.Column(db.String(80), nullable=False)
+    size = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    references = db.relationship('UploadReference', back_populates='blob', cascade='all, delete-orphan')
+    __table_args__ = (db.UniqueConstraint('store', 'sha256', name='uq_upload_blob_store_sha256'),)
+
+
+class UploadReference(db.Model):
+    __tablename__ = 'upload_reference'
+    id = db.Column(db.Integer, primary_key=True)
+    blob_id = db.Column(db.Integer, db.ForeignKey('upload_blob.id'), nullable=False, index=True)
+    # Propriétaire du fichier: ('staff_photo', StaffProfile.id) ou ('venue_logo', Venue.id)
+    owner_type = db.Column(db.String(30), nullable=False)
+    owner_id = db.Column(db.Integer, nullable=False)
+
+    blob = db.relationship('UploadBlob', back_populates='references')
+    __table_args__ = (db.UniqueConstraint('owner_type', 'owner_id', name='uq_upload_reference_owner'),)
@@ -1,16 +1,22 @@
 # app/payroll/routes.py
 
 import time
-from flask import Blueprint, render_template, request, flash, Response, jsonify, abort, redirect, url_for, current_app, session, make_response
+from types import SimpleNamespace
+from flask import Blueprint, render_template, request, flash, Response, jsonify, abort, redirect, url_for, current_app, session
 from flask_login import login_required, current_user
 from app.models import db, Assignment, StaffProfile, User, PerformanceRecord, Venue, AgencyContract, ContractCalculations
-from app.services.payroll_service import update_or_create_contract_calculations, process_assignments_batch
+from app.services.payroll_service import performance_contribution, apply_performance_delta, refresh_stale_calculations, list_payroll_page, payroll_status_order
+from app.services.staff_search import staff_search_ids
+from app.services.contract_rules import get_agency_rules, get_contract_rules
+from app.services.rollup_service import rollup_contribution, rollup_key, apply_rollup_deltas, get_venue_rollups
+from app.services.response_cache import cached_page, read_only, register_data_version_hook
 from app.decorators import admin_required, manager_required, super_admin_required, webdev_required, payroll_view_required
 from datetime import datetime, date, time as dt_time, timedelta
-from weasyprint import HTML
-from sqlalchemy.orm import joinedload
+from app.services.pdf_queue import pdf_response
+from sqlalchemy.orm import joinedload, contains_eager, selectinload
 
 payroll_bp = Blueprint('payroll', __name__, template_folder='../templates', url_prefix='/payroll')
+register_data_version_hook(payroll_bp)
 
 # --- Constants ---
 
@@ -23,18 +29,17 @@ def calc_lateness_penalty(arrival_time, agency_id):
     if not arrival_time:
         return 0
     
-    # Get contract rules from AgencyContract
+    # Get contract rules from the compiled contract cache
     # Get the first contract to use its rules (they should be the same for all contracts in an agency)
-    contract = AgencyContract.query.filter_by(agency_id=agency_id).first()
-    if not contract:
+    contract = next(iter(get_agency_rules(agency_id).values()), None)
+    if not contract or contract.cutoff_minutes is None:
         # Fallback to default values
         cutoff_time = dt_time(19, 30)
         first_minute_penalty = 0
         additional_minute_penalty = 5
     else:
-        # Parse cutoff time from string (format: "19:30")
-        hour, minute = map(int, contract.late_cutoff_time.split(':'))
-        cutoff_time = dt_time(hour, minute)
+        # Cutoff already converted to minutes when the contract was compiled
+        cutoff_time = dt_time(contract.cutoff_minutes // 60, contract.cutoff_minutes % 60)
         first_minute_penalty = contract.first_minute_penalty
         additional_minute_penalty = contract.additional_minute_penalty
     
@@ -51,19 +56,95 @@ def calc_lateness_penalty(arrival_time, agency_id):
         # First minute penalty + additional minutes penalty
         return first_minute_penalty + (minutes_late - 1) * additional_minute_penalty
 
-def _get_or_create_daily_record(assignment_id: int, ymd: date) -> 'PerformanceRecord':
+def _dashboard_assignments_query(agency_id, args):
+    """Assignment query of the agency with the dashboard filters applied (no eager loading, no ordering)."""
+    selected_venue_id = args.get('venue_id', type=int)
+    selected_contract_type = args.get('contract_type')
+    selected_status = args.get('status')
+    search_nickname = args.get('nickname')
+    selected_manager_id = args.get('manager_id', type=int)
+    start_date_str = args.get('start_date')
+    end_date_str = args.get('end_date')
+    
+    q = Assignment.query.filter_by(agency_id=agency_id)
+    if selected_venue_id:
+        q = q.filter(Assignment.venue_id == selected_venue_id)
+    if selected_contract_type and selected_contract_type != 'all':
+        q = q.filter(Assignment.contract_type == selected_contract_type)
+    if selected_status and selected_status != 'all':
+        q = q.filter(Assignment.status == selected_status)
+    # Recherche indexée sur surnom, noms, ID, téléphone, LINE et Instagram
+    matching_staff = staff_search_ids(agency_id, search_nickname)
+    if matching_staff is not None:
+        q = q.filter(Assignment.staff_id.in_(matching_staff))
+    if selected_manager_id:
+        q = q.filter(Assignment.managed_by_user_id == selected_manager_id)
+    
+    if start_date_str:
+        try:
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+            q = q.filter(Assignment.end_date >= start_date)
+        except ValueError:
+            pass  # Ignore invalid date format for dashboard
+    if end_date_str:
+        try:
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            q = q.filter(Assignment.start_date <= end_date)
+        except ValueError:
+            pass  # Ignore invalid date format for dashboard
+    return q
+
+def _get_or_create_daily_record(assignment_id: int, ymd: date) -> tuple:
+    """Returns (record, created). The new record is only added to the session, the caller commits."""
     rec = PerformanceRecord.query.filter_by(assignment_id=assignment_id, record_date=ymd).first()
-    if rec: return rec
+    if rec: return rec, False
     rec = PerformanceRecord(assignment_id=assignment_id, record_date=ymd)
     db.session.add(rec)
-    db.session.commit()
-    return rec
+    return rec, True
+
+
+# Taille maximale d'une page du listing paginé de la paie
+MAX_PAYROLL_PAGE_SIZE = 500
+
+
+def _payroll_row_view(row, contracts_dict):
+    """
+    Adapts a column row of list_payroll_page to the structure payroll.html renders
+    (row.assignment.staff.nickname, row.contract_stats...), without ORM entities.
+    """
+    staff = None
+    if row.staff_id is not None and row.staff_nickname is not None:
+        staff = SimpleNamespace(id=row.staff_id, nickname=row.staff_nickname,
+                                photo_url=row.staff_photo_url, photo_placeholder=row.staff_photo_placeholder,
+                                staff_id=row.staff_code)
+    assignment = SimpleNamespace(
+        id=row.id, staff_id=row.staff_id, staff=staff,
+        archived_staff_name=row.archived_staff_name, archived_staff_photo=row.archived_staff_photo,
+        venue=SimpleNamespace(name=row.venue_name) if row.venue_name is not None else None,
+        manager=SimpleNamespace(username=row.manager_username) if row.manager_username is not None else None,
+        contract_role=row.contract_role, contract_type=row.contract_type, status=row.status,
+        start_date=row.start_date, end_date=row.end_date, base_salary=row.base_salary
+    )
+    contract = contracts_dict.get(row.contract_type)
+    return {
+        "assignment": assignment,
+        "days_worked": row.days_worked,
+        "original_duration": contract.days if contract else 1,
+        "contract_stats": {
+            "drinks": row.total_drinks,
+            "special_comm": row.total_special_comm,
+            "salary": row.total_salary,
+            "commission": row.total_commission,
+            "profit": row.total_profit
+        }
+    }
 
 
 # --- VIEWS (HTML PAGES) ---
 @payroll_bp.route('/')
 @login_required
 @payroll_view_required
+@cached_page
 def payroll_page():
     """
     Page principale de la paie avec filtrage par défaut optimisé.
@@ -95,13 +176,9 @@ def payroll_page():
     start_date_str = request.args.get('start_date')
     end_date_str = request.args.get('end_date')
 
-    # Base query scoped to the user's agency with eager loading to prevent N+1 queries
-    q = Assignment.query.filter_by(agency_id=agency_id).options(
-        joinedload(Assignment.staff),
-        joinedload(Assignment.venue),
-        joinedload(Assignment.contract_calculations),
-        joinedload(Assignment.performance_records)
-    )
+    # Base query scoped to the user's agency, filters only: the paginated mode selects column rows,
+    # the full listing adds its eager loading options when it runs the query
+    q = Assignment.query.filter_by(agency_id=agency_id)
 
     # Apply filters
     if selected_venue_id:
@@ -113,8 +190,10 @@ def payroll_page():
     if selected_status and selected_status != 'all':
         q = q.filter(Assignment.status == selected_status)
     # Note: If status is 'all' or not provided, no status filter is applied (shows all statuses)
-    if search_nickname:
-        q = q.join(StaffProfile).filter(StaffProfile.nickname.ilike(f'%{search_nickname}%'))
+    # Recherche indexée sur surnom, noms, ID, téléphone, LINE et Instagram
+    matching_staff = staff_search_ids(agency_id, search_nickname)
+    if matching_staff is not None:
+        q = q.filter(Assignment.staff_id.in_(matching_staff))
     if selected_manager_id:
         q = q.filter(Assignment.managed_by_user_id == selected_manager_id)
 
@@ -131,77 +210,103 @@ def payroll_page():
         except ValueError:
             flash(f'Invalid end date format: {end_date_str}. Please use YYYY-MM-DD.', 'danger')
     
-    status_order = db.case((Assignment.status == 'active', 1), (Assignment.status == 'ended', 2), (Assignment.status == 'archived', 3), else_=4).label("status_order")
-    all_assignments = q.order_by(status_order, Assignment.start_date.asc()).all()
+    # Mode paginé (?page_size=N, puis ?after=<curseur>): curseur keyset sur (status_order, start_date, id),
+    # colonnes affichées uniquement, totaux par une requête d'agrégation séparée
+    page_size = request.args.get('page_size', type=int)
+    pagination = None
+    if page_size and page_size > 0:
+        page_size = min(page_size, MAX_PAYROLL_PAGE_SIZE)
+        try:
+            page = list_payroll_page(q, page_size, request.args.get('after'))
+        except ValueError:
+            flash('Invalid page cursor, showing the first page.', 'warning')
+            page = list_payroll_page(q, page_size)
+        
+        contracts_dict = get_agency_rules(agency_id)
+        rows = [_payroll_row_view(row, contracts_dict) for row in page['rows']]
+        summary_stats = {"total_profit": page['total_profit'], "total_days_worked": page['total_days_worked']}
+        
+        page_args = request.args.to_dict()
+        page_args.pop('after', None)
+        pagination = {
+            "page_size": page_size,
+            "total_count": page['total_count'],
+            "first_url": url_for('payroll.payroll_page', **page_args) if request.args.get('after') else None,
+            "next_url": url_for('payroll.payroll_page', **page_args, after=page['next_cursor']) if page['next_cursor'] else None
+        }
+        current_app.logger.info(f"[PERF] Paginated payroll rows ready in {(time.time() - start_time):.3f}s")
+    else:
+        status_order = payroll_status_order().label("status_order")
+        all_assignments = q.options(
+            joinedload(Assignment.staff),
+            joinedload(Assignment.venue),
+            joinedload(Assignment.contract_calculations)
+        ).order_by(status_order, Assignment.start_date.asc()).all()
     
-    # Log après récupération des assignments
-    current_app.logger.info(f"[PERF] Assignments retrieved: {len(all_assignments)} in {(time.time() - start_time):.3f}s")
+        # Log après récupération des assignments
+        current_app.logger.info(f"[PERF] Assignments retrieved: {len(all_assignments)} in {(time.time() - start_time):.3f}s")
     
-    # Process rows for display and calculation using optimized batch service
-    rows = []
-    total_profit = 0
-    total_days_worked = 0
+        # Process rows for display and calculation using optimized batch service
+        rows = []
+        total_profit = 0
+        total_days_worked = 0
     
-    # Début du traitement des calculs en lot
-    calc_start_time = time.time()
-    current_app.logger.info(f"[PERF] Starting batch processing for {len(all_assignments)} assignments")
+        # Début du traitement des calculs
+        calc_start_time = time.time()
     
-    # OPTIMISATION: Traitement par lots au lieu de boucle individuelle
-    try:
-        batch_results = process_assignments_batch(all_assignments)
-        current_app.logger.info(f"[PERF] Batch finished in {(time.time() - calc_start_time):.3f}s")
-    except Exception as e:
-        current_app.logger.error(f"Error in batch processing: {str(e)}")
-        # Fallback to individual processing if batch fails
-        batch_results = {}
+        # OPTIMISATION: ContractCalculations est maintenu par upsert_performance (delta à chaque écriture),
+        # seuls les totaux absents ou marqués is_stale sont recalculés. Si tout est à jour, la page
+        # n'ouvre aucune transaction d'écriture.
+        try:
+            batch_results = refresh_stale_calculations(all_assignments)
+            current_app.logger.info(f"[PERF] Totals ready in {(time.time() - calc_start_time):.3f}s")
+        except Exception as e:
+            current_app.logger.error(f"Error in batch processing: {str(e)}")
+            # Fallback: totals already stored, the stale ones are shown as missing
+            batch_results = {
+                a.id: a.contract_calculations for a in all_assignments
+                if a.contract_calculations and not a.contract_calculations.is_stale
+            }
+    
+        # Règles des contrats depuis le cache (éviter N requêtes dans la boucle)
+        contracts_dict = get_agency_rules(agency_id)
+    
+        # Construire les rows à partir des résultats batch
         for a in all_assignments:
-            try:
-                contract_calc = update_or_create_contract_calculations(a.id)
-                batch_results[a.id] = contract_calc
-            except Exception as calc_e:
-                current_app.logger.error(f"Error calculating contract {a.id}: {str(calc_e)}")
-                batch_results[a.id] = None
-    
-    # PRÉ-REQUÊTE pour les contrats (éviter N requêtes dans la boucle)
-    agency_contracts = AgencyContract.query.filter_by(agency_id=agency_id).all()
-    contracts_dict = {contract.name: contract for contract in agency_contracts}
-    
-    # Construire les rows à partir des résultats batch
-    for a in all_assignments:
-        contract_calc = batch_results.get(a.id)
+            contract_calc = batch_results.get(a.id)
         
-        # Get contract duration depuis le dictionnaire (pas de requête DB)
-        contract = contracts_dict.get(a.contract_type)
-        original_duration = contract.days if contract else 1
+            # Get contract duration depuis le dictionnaire (pas de requête DB)
+            contract = contracts_dict.get(a.contract_type)
+            original_duration = contract.days if contract else 1
         
-        # Use calculated values from ContractCalculations table
-        if contract_calc:
-            contract_stats = {
-                "drinks": contract_calc.total_drinks,
-                "special_comm": contract_calc.total_special_comm,
-                "salary": contract_calc.total_salary,
-                "commission": contract_calc.total_commission,
-                "profit": contract_calc.total_profit
-            }
-            days_worked = contract_calc.days_worked
-        else:
-            # Fallback to manual calculation if service failed
-            contract_stats = {"drinks": 0, "special_comm": 0, "salary": 0, "commission": 0, "profit": 0}
-            days_worked = len(a.performance_records)
+            # Use calculated values from ContractCalculations table
+            if contract_calc:
+                contract_stats = {
+                    "drinks": contract_calc.total_drinks,
+                    "special_comm": contract_calc.total_special_comm,
+                    "salary": contract_calc.total_salary,
+                    "commission": contract_calc.total_commission,
+                    "profit": contract_calc.total_profit
+                }
+                days_worked = contract_calc.days_worked
+            else:
+                # Refresh failed: no totals, days worked from the stored (possibly stale) row
+                contract_stats = {"drinks": 0, "special_comm": 0, "salary": 0, "commission": 0, "profit": 0}
+                days_worked = a.contract_calculations.days_worked if a.contract_calculations else 0
         
-        rows.append({
-            "assignment": a,
-            "days_worked": days_worked,
-            "original_duration": original_duration,
-            "contract_stats": contract_stats
-        })
-        total_profit += contract_stats["profit"]
-        total_days_worked += days_worked
+            rows.append({
+                "assignment": a,
+                "days_worked": days_worked,
+                "original_duration": original_duration,
+                "contract_stats": contract_stats
+            })
+            total_profit += contract_stats["profit"]
+            total_days_worked += days_worked
 
-    # Log après traitement des calculs
-    current_app.logger.info(f"[PERF] Calculations finished in {(time.time() - calc_start_time):.3f}s")
+        # Log après traitement des calculs
+        current_app.logger.info(f"[PERF] Calculations finished in {(time.time() - calc_start_time):.3f}s")
     
-    summary_stats = {"total_profit": total_profit, "total_days_worked": total_days_worked}
+        summary_stats = {"total_profit": total_profit, "total_days_worked": total_days_worked}
 
     # Fetch dynamic filter data, scoped to the agency
     agency_managers = User.query.filter_by(agency_id=agency_id).order_by(User.username).all()
@@ -226,7 +331,8 @@ def payroll_page():
     total_time = time.time() - start_time
     current_app.logger.info(f"[PERF] Payroll page ready to render in {total_time:.3f}s total (status filter: {selected_status})")
     
-    return render_template('payroll.html', assignments=rows, filters=filter_data, summary=summary_stats, status_filter=selected_status)
+    return render_template('payroll.html', assignments=rows, filters=filter_data, summary=summary_stats,
+                           status_filter=selected_status, pagination=pagination)
 
 # --- API Performance ---
 
@@ -279,7 +385,7 @@ def list_performance_for_assignment(assignment_id):
                                      .order_by(PerformanceRecord.record_date.desc()).all()
     
     # Get contract rules for penalty calculation
-    contract = AgencyContract.query.filter_by(name=a.contract_type, agency_id=agency_id).first()
+    contract = get_contract_rules(agency_id, a.contract_type)
     
     # Debug: Log contract lookup
     current_app.logger.info(f"Looking for contract: name='{a.contract_type}', agency_id={agency_id}")
@@ -340,7 +446,14 @@ def upsert_performance():
     if not (a.start_date <= ymd <= a.end_date):
         return jsonify({"status": "error", "message": "Date outside contract period."}), 400
     
-    rec = _get_or_create_daily_record(assignment_id, ymd)
+    # Récupérer les règles compilées du contrat d'agence (cache, pas de requête)
+    agency_contract = get_contract_rules(agency_id, a.contract_type)
+
+    rec, created = _get_or_create_daily_record(assignment_id, ymd)
+    # Contribution actuelle du record aux totaux du contrat et du jour (avant modification)
+    previous = performance_contribution(None if created else rec, agency_contract)
+    previous_rollup = rollup_contribution(None if created else rec, agency_contract)
+
     def time_or_none(s):
         if not s: return None
         try: return dt_time.fromisoformat(s)
@@ -356,39 +469,17 @@ def upsert_performance():
     
     # Utiliser le service de paie pour calculer les valeurs automatiquement
     try:
-        from app.services.payroll_service import calculate_lateness_penalty
+        from app.services.payroll_service import calculate_daily_performance
         
-        # Récupérer le contrat d'agence pour les règles de calcul
-        agency_contract = AgencyContract.query.filter_by(
-            name=a.contract_type,
-            agency_id=agency_id
-        ).first()
-        
-        # Calculer la pénalité de retard en utilisant le service
-        lateness_penalty = calculate_lateness_penalty(rec, agency_contract) if agency_contract else 0.0
+        daily = calculate_daily_performance(
+            a.base_salary, agency_contract, rec.arrival_time, rec.drinks_sold,
+            rec.special_commissions, rec.bonus, rec.malus
+        )
+        lateness_penalty = daily['lateness_penalty']
+        daily_salary = daily['daily_salary']
+        daily_profit = daily['daily_profit']
         rec.lateness_penalty = lateness_penalty
-        
-        # Calculer le salaire journalier
-        # Récupérer la durée du contrat depuis AgencyContract
-        contract_days = agency_contract.days if agency_contract else 1
-        base_daily_salary = (a.base_salary / contract_days) if contract_days > 0 else 0
-        
-        # Salaire journalier = salaire de base + bonus - malus - pénalité de retard
-        daily_salary = base_daily_salary + rec.bonus - rec.malus - lateness_penalty
         rec.daily_salary = daily_salary
-        
-        # Calculer le profit journalier
-        # Revenus = (boissons * prix des boissons) + commissions spéciales
-        drink_price = agency_contract.drink_price if agency_contract else 220  # Prix par défaut
-        daily_revenue = (rec.drinks_sold * drink_price) + rec.special_commissions
-        
-        # Coûts = salaire journalier + commission sur les boissons
-        staff_commission = agency_contract.staff_commission if agency_contract else 100  # Commission par défaut
-        daily_commission = rec.drinks_sold * staff_commission
-        daily_costs = daily_salary + daily_commission
-        
-        # Profit journalier = revenus - coûts
-        daily_profit = daily_revenue - daily_costs
         rec.daily_profit = daily_profit
         
         current_app.logger.info(f"Calculs automatiques pour assignment {assignment_id}, date {ymd}:")
@@ -403,6 +494,12 @@ def upsert_performance():
         rec.daily_salary = 0.0
         rec.daily_profit = 0.0
     
+    # Mettre à jour ContractCalculations dans la même transaction (delta, pas de recalcul complet)
+    apply_performance_delta(assignment_id, previous, performance_contribution(rec, agency_contract), agency_contract)
+    apply_rollup_deltas(agency_id, {
+        rollup_key(a.venue_id, ymd): (previous_rollup, rollup_contribution(rec, agency_contract))
+    })
+    
     db.session.commit()
     return jsonify({"status": "success", "record": rec.to_dict()}), 200
 
@@ -410,6 +507,7 @@ def upsert_performance():
 @payroll_bp.route('/api/performance/preview', methods=['POST'])
 @login_required
 @manager_required
+@read_only
 def preview_performance():
     """
     Endpoint pour prévisualiser les calculs de performance sans sauvegarder.
@@ -458,39 +556,22 @@ def preview_performance():
     )
 
     try:
-        from app.services.payroll_service import calculate_lateness_penalty
-        
-        # Récupérer le contrat d'agence pour les règles de calcul
-        agency_contract = AgencyContract.query.filter_by(
-            name=a.contract_type,
-            agency_id=agency_id
-        ).first()
-        
-        # Calculer la pénalité de retard en utilisant le service
-        lateness_penalty = calculate_lateness_penalty(temp_record, agency_contract) if agency_contract else 0.0
+        from app.services.payroll_service import calculate_daily_performance
         
-        # Calculer le salaire journalier
-        contract_days = agency_contract.days if agency_contract else 1
-        base_daily_salary = (a.base_salary / contract_days) if contract_days > 0 else 0
+        # Récupérer les règles compilées du contrat d'agence (cache, pas de requête)
+        agency_contract = get_contract_rules(agency_id, a.contract_type)
         
-        # Salaire journalier = salaire de base + bonus - malus - pénalité de retard
-        daily_salary = base_daily_salary + temp_record.bonus - temp_record.malus - lateness_penalty
+        daily = calculate_daily_performance(
+            a.base_salary, agency_contract, temp_record.arrival_time, temp_record.drinks_sold,
+            temp_record.special_commissions, temp_record.bonus, temp_record.malus
+        )
+        lateness_penalty = daily['lateness_penalty']
+        daily_salary = daily['daily_salary']
+        daily_profit = daily['daily_profit']
         
-        # Calculer le profit journalier
-        drink_price = agency_contract.drink_price if agency_contract else 220
-        daily_revenue = (temp_record.drinks_sold * drink_price) + temp_record.special_commissions
-        
-        staff_commission = agency_contract.staff_commission if agency_contract else 100
-        daily_commission = temp_record.drinks_sold * staff_commission
-        daily_costs = daily_salary + daily_commission
-        
-        daily_profit = daily_revenue - daily_costs
-        
-        # Calculer la commission payée
-        commission_paid = daily_commission
-        
-        # Calculer le salaire de base proratisé
-        prorated_base = base_daily_salary
+        # Commission payée et salaire de base proratisé
+        commission_paid = daily['daily_commission']
+        prorated_base = daily['base_daily_salary']
         
         return jsonify({
             "status": "success",
@@ -505,6 +586,152 @@ def preview_performance():
         current_app.logger.error(f"Erreur lors de la prévisualisation pour assignment {assignment_id}: {str(e)}")
         return jsonify({"status": "error", "message": "Failed to calculate preview"}), 500
 
+@payroll_bp.route('/api/performance/bulk', methods=['POST'])
+@login_required
+@manager_required
+def bulk_upsert_performance():
+    """
+    Saisie groupée d'une soirée: {"entries": [{assignment_id, record_date, ...}, ...]}.
+    Tout est validé puis enregistré en une seule transaction (rien n'est écrit si une entrée est invalide).
+    """
+    from app.services.payroll_service import upsert_performance_batch, MAX_PERFORMANCE_BATCH
+    
+    data = request.get_json(silent=True) or {}
+    entries = data.get('entries') if isinstance(data, dict) else None
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"status": "error", "message": "No entries provided"}), 400
+    if len(entries) > MAX_PERFORMANCE_BATCH:
+        return jsonify({"status": "error", "message": f"Too many entries (max {MAX_PERFORMANCE_BATCH})"}), 400
+    if not all(isinstance(entry, dict) for entry in entries):
+        return jsonify({"status": "error", "message": "Each entry must be an object"}), 400
+    
+    # Get current agency ID
+    if current_user.role == 'webdev':
+        agency_id = session.get('current_agency_id', current_user.agency_id)
+    else:
+        agency_id = current_user.agency_id
+    
+    try:
+        result = upsert_performance_batch(agency_id, entries)
+    except Exception as e:
+        current_app.logger.error(f"Erreur lors de la saisie groupée des performances: {str(e)}")
+        return jsonify({"status": "error", "message": "Failed to save performances"}), 500
+    
+    if result['errors']:
+        return jsonify({"status": "error", "message": "Invalid entries", "errors": result['errors']}), 400
+    
+    return jsonify({
+        "status": "success",
+        "created": result['created'],
+        "updated": result['updated'],
+        "records": [record.to_dict() for record in result['records']]
+    }), 200
+
+
+@payroll_bp.route('/api/night-sheet')
+@login_required
+@manager_required
+def night_sheet():
+    """
+    Feuille de soirée: tous les assignments actifs d'un venue à une date, avec leur
+    record existant (ou None), en deux requêtes. Paramètres: venue_id, date (YYYY-MM-DD).
+    """
+    try:
+        venue_id = int(request.args.get('venue_id'))
+        ymd = datetime.fromisoformat(request.args.get('date')).date()
+    except Exception:
+        return jsonify({"status": "error", "message": "Invalid venue_id or date"}), 400
+    
+    # Get current agency ID
+    if current_user.role == 'webdev':
+        agency_id = session.get('current_agency_id', current_user.agency_id)
+    else:
+        agency_id = current_user.agency_id
+    
+    assignments = Assignment.query.outerjoin(Assignment.staff).options(
+        contains_eager(Assignment.staff)
+    ).filter(
+        Assignment.agency_id == agency_id,
+        Assignment.venue_id == venue_id,
+        Assignment.status == 'active',
+        Assignment.start_date <= ymd,
+        Assignment.end_date >= ymd
+    ).order_by(StaffProfile.nickname, Assignment.id).all()
+    
+    records = {}
+    if assignments:
+        records = {
+            record.assignment_id: record
+            for record in PerformanceRecord.query.filter(
+                PerformanceRecord.assignment_id.in_([a.id for a in assignments]),
+                PerformanceRecord.record_date == ymd
+            ).all()
+        }
+    
+    rules = get_agency_rules(agency_id)
+    rows = []
+    for a in assignments:
+        contract = rules.get(a.contract_type)
+        record = records.get(a.id)
+        rows.append({
+            "assignment_id": a.id,
+            "staff_id": a.staff_id,
+            "staff_name": a.staff.nickname if a.staff else a.archived_staff_name,
+            "photo_url": a.staff.photo_url if a.staff else a.archived_staff_photo,
+            "contract_role": a.contract_role,
+            "contract_type": a.contract_type,
+            "start_date": a.start_date.isoformat(),
+            "end_date": a.end_date.isoformat(),
+            "base_salary": a.base_salary,
+            "contract_rules": {
+                "late_cutoff_time": contract.late_cutoff_time if contract else "19:30",
+                "first_minute_penalty": contract.first_minute_penalty if contract else 0,
+                "additional_minute_penalty": contract.additional_minute_penalty if contract else 5
+            },
+            "record": record.to_dict() if record else None
+        })
+    
+    return jsonify({
+        "status": "success",
+        "venue_id": venue_id,
+        "record_date": ymd.isoformat(),
+        "assignments": rows
+    }), 200
+
+
+@payroll_bp.route('/api/rollups/venues')
+@login_required
+@payroll_view_required
+def venue_rollups():
+    """
+    Totaux par venue sur une période, lus dans la table DailyRollup (une ligne par
+    venue et par jour). Paramètres optionnels: start_date, end_date (YYYY-MM-DD), venue_id.
+    """
+    try:
+        start_date = datetime.fromisoformat(request.args['start_date']).date() if request.args.get('start_date') else None
+        end_date = datetime.fromisoformat(request.args['end_date']).date() if request.args.get('end_date') else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid start_date or end_date"}), 400
+    venue_id = request.args.get('venue_id', type=int)
+    
+    # Get current agency ID
+    if current_user.role == 'webdev':
+        agency_id = session.get('current_agency_id', current_user.agency_id)
+    else:
+        agency_id = current_user.agency_id
+    
+    rows = get_venue_rollups(agency_id, start_date, end_date, venue_id)
+    venue_names = dict(db.session.query(Venue.id, Venue.name).filter(Venue.agency_id == agency_id).all())
+    for row in rows:
+        row['venue_name'] = venue_names.get(row['venue_id'])
+    
+    return jsonify({
+        "status": "success",
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+        "venues": rows
+    }), 200
+
 # --- Contract Summary API ---
 @payroll_bp.route('/api/summary/<int:assignment_id>')
 @login_required
@@ -597,13 +824,13 @@ def payroll_pdf():
     start_date_str = request.args.get('start_date')
     end_date_str = request.args.get('end_date')
 
-    # Base query scoped to the user's agency with eager loading to prevent N+1 queries
-    q = Assignment.query.filter_by(agency_id=agency_id).options(
+    # Base query scoped to the user's agency with eager loading of everything the PDF rows render
+    q = Assignment.query.options(
         joinedload(Assignment.staff),
         joinedload(Assignment.venue),
-        joinedload(Assignment.contract_calculations),
-        joinedload(Assignment.performance_records)
-    )
+        joinedload(Assignment.manager),
+        joinedload(Assignment.contract_calculations)
+    ).filter_by(agency_id=agency_id)
 
     # Apply filters (same logic as payroll_page)
     if selected_venue_id:
@@ -614,8 +841,10 @@ def payroll_pdf():
         q = q.filter(Assignment.status == selected_status)
     else:
         q = q.filter(Assignment.status.in_(['active', 'ended', 'archived']))
-    if search_nickname:
-        q = q.join(StaffProfile).filter(StaffProfile.nickname.ilike(f'%{search_nickname}%'))
+    # Recherche indexée sur surnom, noms, ID, téléphone, LINE et Instagram
+    matching_staff = staff_search_ids(agency_id, search_nickname)
+    if matching_staff is not None:
+        q = q.filter(Assignment.staff_id.in_(matching_staff))
     if selected_manager_id:
         q = q.filter(Assignment.managed_by_user_id == selected_manager_id)
 
@@ -635,9 +864,15 @@ def payroll_pdf():
     status_order = db.case((Assignment.status == 'active', 1), (Assignment.status == 'ended', 2), (Assignment.status == 'archived', 3), else_=4).label("status_order")
     all_assignments = q.order_by(status_order, Assignment.start_date.asc()).all()
     
-    # Récupérer tous les contrats de l'agence en une seule requête
-    agency_contracts = AgencyContract.query.filter_by(agency_id=agency_id).all()
-    contracts_dict = {contract.name: contract for contract in agency_contracts}
+    # Récupérer tous les contrats de l'agence depuis le cache des règles compilées
+    contracts_dict = get_agency_rules(agency_id)
+    
+    # Use ContractCalculations as single source of truth (seuls les totaux périmés sont recalculés)
+    try:
+        calculations = refresh_stale_calculations(all_assignments)
+    except Exception as e:
+        current_app.logger.error(f"Error refreshing contract calculations for PDF: {str(e)}")
+        calculations = {a.id: a.contract_calculations for a in all_assignments if a.contract_calculations}
     
     # Process rows for display and calculation using ContractCalculations as single source of truth
     rows = []
@@ -650,8 +885,7 @@ def payroll_pdf():
         
         # Use ContractCalculations as single source of truth
         try:
-            from app.services.payroll_service import update_or_create_contract_calculations, process_assignments_batch
-            contract_calc = update_or_create_contract_calculations(a.id)
+            contract_calc = calculations[a.id]
             
             contract_stats = {
                 "drinks": contract_calc.total_drinks,
@@ -692,15 +926,9 @@ def payroll_pdf():
                                        filters=request.args,
                                        report_date=date.today())
 
-        current_app.logger.info("Generating PDF from HTML")
-        pdf = HTML(string=html_for_pdf).write_pdf()
         filename = f"payroll_report_{date.today().strftime('%Y-%m-%d')}.pdf"
-
-        current_app.logger.info(f"PDF generated successfully, size: {len(pdf)} bytes")
-        response = Response(pdf, mimetype='application/pdf')
-        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
-        response.headers['Content-Length'] = len(pdf)
-        return response
+        # Gros rapports rendus par la file PDF, petits rapports directement
+        return pdf_response(html_for_pdf, filename, 'payroll', agency_id=agency_id)
         
     except Exception as e:
         current_app.logger.error(f"Error generating payroll PDF: {e}")
@@ -709,6 +937,41 @@ def payroll_pdf():
         return jsonify({'status': 'error', 'message': 'Failed to generate PDF. Please try again.'}), 500
 
 
+def _assignment_report_html(assignment, contract_calc):
+    """
+    Renders the assignment report template (staff, manager, venue and performance_records
+    must be loaded). Returns (html, filename).
+    """
+    # Get contract duration from the compiled contract rules
+    contract = get_contract_rules(assignment.agency_id, assignment.contract_type)
+    original_duration = contract.days if contract else 1
+
+    if contract_calc:
+        contract_stats = {
+            "drinks": contract_calc.total_drinks,
+            "special_comm": contract_calc.total_special_comm,
+            "salary": contract_calc.total_salary,
+            "commission": contract_calc.total_commission,
+            "profit": contract_calc.total_profit
+        }
+        days_worked = contract_calc.days_worked
+    else:
+        # Fallback de sécurité si aucun calcul n'a été pré-calculé
+        current_app.logger.warning(f"No pre-calculated ContractCalculations found for assignment {assignment.id}. Displaying zeros in PDF.")
+        contract_stats = {"drinks": 0, "special_comm": 0, "salary": 0, "commission": 0, "profit": 0}
+        days_worked = len(assignment.performance_records) # On se base sur les records s'ils existent
+
+    html_for_pdf = render_template('assignment_pdf.html',
+                                   assignments=[{'assignment': assignment, 'days_worked': days_worked, 'original_duration': original_duration}],
+                                   contract_stats=contract_stats,
+                                   report_date=date.today(),
+                                   timedelta=timedelta)
+
+    staff_name = assignment.staff.nickname if assignment.staff else assignment.archived_staff_name
+    filename = f"report_{staff_name}_{assignment.start_date.strftime('%Y-%m-%d')}.pdf"
+    return html_for_pdf, filename
+
+
 @payroll_bp.route('/assignment/<int:assignment_id>/pdf')
 @login_required
 def assignment_pdf(assignment_id):
@@ -727,51 +990,64 @@ def assignment_pdf(assignment_id):
         joinedload(Assignment.venue),
         joinedload(Assignment.performance_records)
     ).first_or_404()
-
-    # Get contract duration from AgencyContract table
-    contract = AgencyContract.query.filter_by(name=assignment.contract_type, agency_id=agency_id).first()
-    original_duration = contract.days if contract else 1
     
     # Use ContractCalculations as single source of truth
     contract_calc = ContractCalculations.query.filter_by(assignment_id=assignment_id).first()
-
-    if contract_calc:
-        contract_stats = {
-            "drinks": contract_calc.total_drinks,
-            "special_comm": contract_calc.total_special_comm,
-            "salary": contract_calc.total_salary,
-            "commission": contract_calc.total_commission,
-            "profit": contract_calc.total_profit
-        }
-        days_worked = contract_calc.days_worked
-    else:
-        # Fallback de sécurité si aucun calcul n'a été pré-calculé
-        current_app.logger.warning(f"No pre-calculated ContractCalculations found for assignment {assignment_id}. Displaying zeros in PDF.")
-        contract_stats = {"drinks": 0, "special_comm": 0, "salary": 0, "commission": 0, "profit": 0}
-        days_worked = len(assignment.performance_records) # On se base sur les records s'ils existent
     
     try:
-        html_for_pdf = render_template('assignment_pdf.html',
-                                       assignments=[{'assignment': assignment, 'days_worked': days_worked, 'original_duration': original_duration}],
-                                       contract_stats=contract_stats,
-                                       report_date=date.today(),
-                                       timedelta=timedelta)
-
-        pdf = HTML(string=html_for_pdf).write_pdf()
-
-        staff_name = assignment.staff.nickname if assignment.staff else assignment.archived_staff_name
-        filename = f"report_{staff_name}_{assignment.start_date.strftime('%Y-%m-%d')}.pdf"
-
-        response = Response(pdf, mimetype='application/pdf')
-        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
-        response.headers['Content-Length'] = len(pdf)
-        return response
+        html_for_pdf, filename = _assignment_report_html(assignment, contract_calc)
+        return pdf_response(html_for_pdf, filename, 'assignment', agency_id=agency_id)
         
     except Exception as e:
         current_app.logger.error(f"Error generating assignment PDF for assignment {assignment_id}: {e}")
         return jsonify({'status': 'error', 'message': 'Failed to generate PDF. Please try again.'}), 500
 
 
+@payroll_bp.route('/pdf/batch')
+@login_required
+@payroll_view_required
+def assignment_pdf_batch():
+    """
+    ZIP of the assignment reports matching the payroll filters (same arguments as the
+    payroll page; without ?status, active, ended and archived contracts). Reports are
+    rendered in parallel by the PDF worker processes and streamed into the archive as
+    each one finishes; progress is available at the X-Progress-Url of the response.
+    """
+    from app.services.pdf_queue import pdf_zip_response
+    
+    # Get current agency ID
+    if current_user.role == 'webdev':
+        agency_id = session.get('current_agency_id', current_user.agency_id)
+    else:
+        agency_id = current_user.agency_id
+    
+    if not agency_id:
+        abort(403, "User not associated with an agency.")
+    
+    q = _dashboard_assignments_query(agency_id, request.args)
+    if not request.args.get('status'):
+        q = q.filter(Assignment.status.in_(['active', 'ended', 'archived']))
+    # Totaux périmés recalculés avant le chargement complet (le commit expirerait les objets chargés)
+    refresh_stale_calculations(q.options(joinedload(Assignment.contract_calculations)).all())
+    assignments = q.options(
+        joinedload(Assignment.staff),
+        joinedload(Assignment.manager),
+        joinedload(Assignment.venue),
+        selectinload(Assignment.performance_records),
+        joinedload(Assignment.contract_calculations)
+    ).order_by(Assignment.start_date.asc(), Assignment.id.asc()).all()
+    
+    def documents():
+        # Les templates sont rendus au fur et à mesure que les workers se libèrent
+        for assignment in assignments:
+            html_for_pdf, filename = _assignment_report_html(assignment, assignment.contract_calculations)
+            yield f"{assignment.id}_{filename}", html_for_pdf
+    
+    current_app.logger.info(f"[PERF] PDF batch export: {len(assignments)} assignment reports queued")
+    return pdf_zip_response(documents(), f"assignment_reports_{date.today().isoformat()}.zip",
+                            len(assignments), 'assignment', agency_id=agency_id)
+
+
 @payroll_bp.route('/report/view/<int:assignment_id>')
 @login_required
 @manager_required
@@ -795,14 +1071,13 @@ def report_view(assignment_id):
         joinedload(Assignment.performance_records)
     ).first_or_404()
 
-    # Get contract duration from AgencyContract table
-    contract = AgencyContract.query.filter_by(name=assignment.contract_type, agency_id=agency_id).first()
+    # Get contract duration from the compiled contract rules
+    contract = get_contract_rules(agency_id, assignment.contract_type)
     original_duration = contract.days if contract else 1
     
-    # Use ContractCalculations as single source of truth
+    # Use ContractCalculations as single source of truth, recomputed only if missing or stale
     try:
-        from app.services.payroll_service import update_or_create_contract_calculations, process_assignments_batch
-        contract_calc = update_or_create_contract_calculations(assignment_id)
+        contract_calc = refresh_stale_calculations([assignment])[assignment.id]
         
         contract_stats = {
             "drinks": contract_calc.total_drinks,
@@ -833,7 +1108,7 @@ def report_view(assignment_id):
 def assignment_summary_api(assignment_id):
     """
     API endpoint pour récupérer le résumé des calculs d'un contrat.
-    Utilise le service de paie pour calculer les totaux en temps réel.
+    Lit les totaux de ContractCalculations (refresh_stale_calculations).
     """
     from flask import session
     
@@ -853,11 +1128,8 @@ def assignment_summary_api(assignment_id):
         return jsonify({'error': 'Assignment not found'}), 404
     
     try:
-        # Utiliser le service de paie pour calculer les totaux
-        from app.services.payroll_service import update_or_create_contract_calculations, process_assignments_batch
-        
-        # Calculer et sauvegarder les totaux
-        contract_calc = update_or_create_contract_calculations(assignment_id)
+        # Totaux maintenus à chaque écriture, recalculés seulement s'ils sont absents ou périmés
+        contract_calc = refresh_stale_calculations([assignment])[assignment.id]
         
         # Retourner les données au format JSON
         return jsonify({
@@ -879,6 +1151,7 @@ def assignment_summary_api(assignment_id):
 @payroll_bp.route('/dashboard')
 @login_required
 @super_admin_required
+@cached_page
 def payroll_dashboard():
     """
     Dashboard de performance pour analyser les données de paie avec des graphiques et statistiques.
@@ -894,57 +1167,26 @@ def payroll_dashboard():
     if not agency_id:
         abort(403, "User not associated with an agency.")
     
-    # Get filter arguments from request (same as payroll_page)
+    # Get filter arguments needed for the header (the query helper reads the others)
     selected_venue_id = request.args.get('venue_id', type=int)
-    selected_contract_type = request.args.get('contract_type')
-    selected_status = request.args.get('status')
-    search_nickname = request.args.get('nickname')
     selected_manager_id = request.args.get('manager_id', type=int)
-    start_date_str = request.args.get('start_date')
-    end_date_str = request.args.get('end_date')
     
-    # Base query scoped to the user's agency with eager loading to prevent N+1 queries
-    q = Assignment.query.filter_by(agency_id=agency_id).options(
+    # Filtered query scoped to the user's agency (same filters as payroll_page)
+    filtered_query = _dashboard_assignments_query(agency_id, request.args)
+    
+    # Récupérer les assignments filtrés avec ce que le template affiche (pas les performance_records)
+    filtered_assignments = filtered_query.options(
         joinedload(Assignment.staff),
         joinedload(Assignment.venue),
-        joinedload(Assignment.contract_calculations),
-        joinedload(Assignment.performance_records)
-    )
-    
-    # Apply filters (same logic as payroll_page)
-    if selected_venue_id:
-        q = q.filter(Assignment.venue_id == selected_venue_id)
-    if selected_contract_type and selected_contract_type != 'all':
-        q = q.filter(Assignment.contract_type == selected_contract_type)
-    
-    # Apply status filter
-    if selected_status and selected_status != 'all':
-        q = q.filter(Assignment.status == selected_status)
-    
-    if search_nickname:
-        q = q.join(StaffProfile).filter(StaffProfile.nickname.ilike(f'%{search_nickname}%'))
-    if selected_manager_id:
-        q = q.filter(Assignment.managed_by_user_id == selected_manager_id)
-    
-    if start_date_str:
-        try:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            q = q.filter(Assignment.end_date >= start_date)
-        except ValueError:
-            pass  # Ignore invalid date format for dashboard
-    if end_date_str:
-        try:
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-            q = q.filter(Assignment.start_date <= end_date)
-        except ValueError:
-            pass  # Ignore invalid date format for dashboard
+        joinedload(Assignment.contract_calculations)
+    ).order_by(Assignment.start_date.desc()).all()
     
-    # Récupérer les assignments filtrés
-    filtered_assignments = q.order_by(Assignment.start_date.desc()).all()
+    # Recalculer uniquement les totaux périmés avant de générer les statistiques
+    refresh_stale_calculations(filtered_assignments)
     
-    # Générer les statistiques de performance
+    # Générer les statistiques de performance (requêtes SQL groupées sur les mêmes filtres)
     from app.services.payroll_service import generate_performance_stats
-    performance_stats = generate_performance_stats(filtered_assignments)
+    performance_stats = generate_performance_stats(filtered_query)
     
     # Fetch dynamic filter data, scoped to the agency
     agency_managers = User.query.filter_by(agency_id=agency_id).order_by(User.username).all()
@@ -987,6 +1229,53 @@ def payroll_dashboard():
                            selected_venue=selected_venue)
 
 
+@payroll_bp.route('/api/dashboard/trend')
+@login_required
+@payroll_view_required
+def payroll_dashboard_trend():
+    """
+    Tendance du dashboard en JSON: profit, drinks, jours travaillés et retards par jour,
+    semaine ISO ou mois (?bucket=day|week|month), avec les mêmes filtres que payroll_dashboard.
+    Une ligne par période, quelle que soit la quantité de records.
+    """
+    from app.services.payroll_service import get_performance_trend, TREND_BUCKETS
+    
+    # Get current agency ID
+    if current_user.role == 'webdev':
+        agency_id = session.get('current_agency_id', current_user.agency_id)
+    else:
+        agency_id = current_user.agency_id
+    
+    if not agency_id:
+        abort(403, "User not associated with an agency.")
+    
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in TREND_BUCKETS:
+        return jsonify({"status": "error", "message": f"Invalid bucket, expected one of: {', '.join(TREND_BUCKETS)}"}), 400
+    
+    # La plage de dates filtre les contrats (comme le dashboard) et les records de la tendance
+    start_date = end_date = None
+    try:
+        if request.args.get('start_date'):
+            start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date()
+        if request.args.get('end_date'):
+            end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid start_date or end_date"}), 400
+    
+    trend_start = time.time()
+    trend = get_performance_trend(_dashboard_assignments_query(agency_id, request.args), bucket, start_date, end_date)
+    current_app.logger.info(f"[PERF] Dashboard trend ({bucket}): {len(trend)} buckets in {time.time() - trend_start:.3f}s")
+    
+    return jsonify({
+        "status": "success",
+        "bucket": bucket,
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+        "buckets": trend
+    }), 200
+
+
 @payroll_bp.route('/dashboard/pdf')
 @login_required
 @payroll_view_required
@@ -1002,48 +1291,22 @@ def payroll_dashboard_pdf():
     if not agency_id:
         abort(403)
 
-    q = Assignment.query.filter_by(agency_id=agency_id).options(
-        joinedload(Assignment.staff),
-        joinedload(Assignment.venue),
-        joinedload(Assignment.contract_calculations),
-        joinedload(Assignment.performance_records)
-    )
-
     # Apply all filters from the request args (same logic as main dashboard)
     selected_venue_id = request.args.get('venue_id', type=int)
     selected_contract_type = request.args.get('contract_type')
     selected_status = request.args.get('status')
-    search_nickname = request.args.get('nickname')
     selected_manager_id = request.args.get('manager_id', type=int)
     start_date_str = request.args.get('start_date')
     end_date_str = request.args.get('end_date')
+    filtered_query = _dashboard_assignments_query(agency_id, request.args)
 
-    if selected_venue_id:
-        q = q.filter(Assignment.venue_id == selected_venue_id)
-    if selected_contract_type and selected_contract_type != 'all':
-        q = q.filter(Assignment.contract_type == selected_contract_type)
-    if selected_status and selected_status != 'all':
-        q = q.filter(Assignment.status == selected_status)
-    if search_nickname:
-        q = q.join(StaffProfile).filter(StaffProfile.nickname.ilike(f'%{search_nickname}%'))
-    if selected_manager_id:
-        q = q.filter(Assignment.managed_by_user_id == selected_manager_id)
-    
-    if start_date_str:
-        try:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            q = q.filter(Assignment.end_date >= start_date)
-        except ValueError:
-            pass  # Ignore invalid date format for PDF
-    if end_date_str:
-        try:
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-            q = q.filter(Assignment.start_date <= end_date)
-        except ValueError:
-            pass  # Ignore invalid date format for PDF
-
-    filtered_assignments = q.order_by(Assignment.start_date.desc()).all()
-    performance_stats = generate_performance_stats(filtered_assignments)
+    filtered_assignments = filtered_query.options(
+        joinedload(Assignment.staff),
+        joinedload(Assignment.venue),
+        joinedload(Assignment.contract_calculations)
+    ).order_by(Assignment.start_date.desc()).all()
+    refresh_stale_calculations(filtered_assignments)
+    performance_stats = generate_performance_stats(filtered_query)
 
     # Prepare header data for PDF
     header_data = {
@@ -1062,10 +1325,5 @@ def payroll_dashboard_pdf():
         today_date=date.today().strftime('%Y-%m-%d')
     )
     
-    pdf = HTML(string=rendered_html, base_url=request.url_root).write_pdf()
-    
-    response = make_response(pdf)
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'inline; filename=performance_dashboard_{date.today().isoformat()}.pdf'
-    
-    return response
\ No newline at end of file
+    return pdf_response(rendered_html, f"performance_dashboard_{date.today().isoformat()}.pdf",
+                        'dashboard', disposition='inline', base_url=request.url_root, agency_id=agency_id)
\ No newline at end of file
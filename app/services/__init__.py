@@ -4,12 +4,20 @@ from .payroll_service import (
     process_assignments_batch,
     update_or_create_contract_calculations,  # OBSOLÈTE - conservé pour fallback
     get_contract_summary,
-    recalculate_all_contracts
+    recalculate_all_contracts,
+    performance_contribution,
+    apply_performance_delta,
+    refresh_stale_calculations,
+    mark_contract_calculations_stale
 )
 
 __all__ = [
     'process_assignments_batch',
     'update_or_create_contract_calculations',  # OBSOLÈTE
     'get_contract_summary', 
-    'recalculate_all_contracts'
+    'recalculate_all_contracts',
+    'performance_contribution',
+    'apply_performance_delta',
+    'refresh_stale_calculations',
+    'mark_contract_calculations_stale'
 ]
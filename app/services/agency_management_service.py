@@ -6,6 +6,9 @@ from datetime import datetime
 from flask import current_app
 from app.models import Agency, User, StaffProfile, Venue, AgencyPosition, AgencyContract, Assignment, PerformanceRecord, ContractCalculations
 from app import db
+from app.services.contract_rules import invalidate_contract_rules
+from app.services.payroll_service import mark_contract_calculations_stale
+from app.services.rollup_service import rebuild_daily_rollups
 
 class AgencyManagementService:
     """Service pour la gestion des agences et l'export des données"""
@@ -593,7 +596,15 @@ class AgencyManagementService:
                 except Exception as ce2:
                     warnings.append(f"Contract calculation import error (assignment_id={ccalc.get('assignment_id')}): {ce2}")
 
+            # Totaux exportés possiblement en retard sur les records importés (ou absents): les
+            # marquer périmés, refresh_stale_calculations les recalcule à la première lecture
+            db.session.flush()
+            mark_contract_calculations_stale(new_agency.id)
             db.session.commit()
+            # Un ID d'agence supprimée peut être réutilisé: ne pas servir ses anciennes règles
+            invalidate_contract_rules(new_agency.id)
+            # Les rollups ne sont pas exportés: les reconstruire à partir des records importés
+            rebuild_daily_rollups(new_agency.id)
 
             return {
                 'success': True,
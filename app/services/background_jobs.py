@@ -0,0 +1,137 @@
+# app/services/background_jobs.py
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import BackgroundJob
+
+
+# Fonctions exécutées par type de job: kind -> callable(job)
+_job_handlers = {}
+
+# File d'attente de chaque type de job: kind -> (nom de la file, clé de config du nombre de threads)
+_job_queues = {}
+
+# Exécuteurs par application (app.extensions['background_jobs'] = file -> exécuteur), créés au premier job
+_executor_lock = threading.Lock()
+
+
+def job_handler(kind, queue='default', workers_setting='BACKGROUND_JOB_WORKERS'):
+    """
+    Enregistre la fonction qui exécute les jobs d'un type (elle reçoit le BackgroundJob).
+    Chaque file a ses propres threads: des jobs longs n'en bloquent pas d'autres.
+    """
+    def register(handler):
+        _job_handlers[kind] = handler
+        _job_queues[kind] = (queue, workers_setting)
+        return handler
+    return register
+
+
+def _executor(kind):
+    queue, workers_setting = _job_queues[kind]
+    with _executor_lock:
+        executors = current_app.extensions.setdefault('background_jobs', {})
+        executor = executors.get(queue)
+        if executor is None:
+            workers = max(1, current_app.config.get(workers_setting, 1))
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'background-job-{queue}')
+            executors[queue] = executor
+        return executor
+
+
+def enqueue_job(kind, agency_id=None, params=None):
+    """
+    Crée un BackgroundJob (commit) et le confie à l'exécuteur en arrière-plan: la requête
+    qui l'a créé n'attend pas. Avec BACKGROUND_JOBS_INLINE (tests), le job est exécuté
+    immédiatement dans la requête.
+
+    Args:
+        kind (str): Type de job (voir job_handler)
+        agency_id (int, optional): Agence concernée
+        params (dict, optional): Paramètres, sérialisés en JSON
+
+    Returns:
+        BackgroundJob: Job créé (status 'queued', ou terminé en mode inline)
+    """
+    if kind not in _job_handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    job = BackgroundJob(kind=kind, agency_id=agency_id, status='queued',
+                        params=json.dumps(params or {}), progress_done=0, progress_total=0)
+    db.session.add(job)
+    db.session.commit()
+
+    if current_app.config.get('BACKGROUND_JOBS_INLINE'):
+        run_job(job.id)
+        db.session.refresh(job)
+        return job
+
+    app = current_app._get_current_object()
+    _executor(kind).submit(_run_in_app_context, app, job.id)
+    return job
+
+
+def _run_in_app_context(app, job_id):
+    with app.app_context():
+        try:
+            run_job(job_id)
+        finally:
+            db.session.remove()
+
+
+def run_job(job_id):
+    """
+    Exécute un job: passage en 'running', appel de son handler, puis 'done' (avec le
+    résultat retourné par le handler) ou 'failed' (avec le message d'erreur).
+
+    Args:
+        job_id (int): ID du BackgroundJob
+    """
+    job = db.session.get(BackgroundJob, job_id)
+    if job is None or job.status != 'queued':
+        return
+
+    job.status = 'running'
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+
+    try:
+        result = _job_handlers[job.kind](job)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Background job {job_id} ({job.kind}) failed: {e}", exc_info=True)
+        job = db.session.get(BackgroundJob, job_id)
+        job.status = 'failed'
+        job.error = str(e)
+    else:
+        job.status = 'done'
+        job.result = json.dumps(result) if result is not None else None
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def job_params(job):
+    """Paramètres décodés d'un BackgroundJob."""
+    return json.loads(job.params) if job.params else {}
+
+
+def update_job(job_id, **values):
+    """
+    Met à jour les colonnes d'un job (progression, statut) dans une session séparée,
+    commitée tout de suite: les objets chargés par la session courante ne sont pas expirés.
+
+    Args:
+        job_id (int): ID du BackgroundJob
+        **values: Colonnes à modifier
+    """
+    with Session(db.engine) as session:
+        session.execute(update(BackgroundJob).where(BackgroundJob.id == job_id).values(**values))
+        session.commit()
@@ -0,0 +1,225 @@
+# app/services/contract_rules.py
+
+import threading
+import time as time_module
+from dataclasses import dataclass
+
+import numpy as np
+from flask import current_app
+
+from app.models import AgencyContract
+
+
+@dataclass(frozen=True)
+class CompiledContract:
+    """
+    Règles d'un AgencyContract figées en mémoire: l'heure limite est déjà convertie
+    en minutes et les pénalités nulles sont résolues à 0. Expose les mêmes attributs
+    qu'AgencyContract, il peut donc être passé partout où un contrat est attendu.
+    """
+    id: int
+    name: str
+    agency_id: int
+    days: int
+    late_cutoff_time: str
+    cutoff_minutes: int  # None si late_cutoff_time est absent ou invalide
+    first_minute_penalty: float
+    additional_minute_penalty: float
+    drink_price: float
+    staff_commission: float
+
+    def late_minutes(self, arrival_time):
+        """
+        Nombre de minutes de retard pour une heure d'arrivée (0 si à l'heure ou inconnue).
+
+        Args:
+            arrival_time (time): Heure d'arrivée (ou None)
+
+        Returns:
+            int: Minutes après l'heure limite
+        """
+        return int(late_minutes_between(arrival_minutes(arrival_time),
+                                        -1 if self.cutoff_minutes is None else self.cutoff_minutes))
+
+    def lateness_penalty(self, arrival_time):
+        """
+        Calcule la pénalité de retard pour une heure d'arrivée.
+
+        Args:
+            arrival_time (time): Heure d'arrivée (ou None)
+
+        Returns:
+            float: Première minute fixe + minutes suivantes au tarif additionnel
+        """
+        return float(lateness_penalty_for(self.late_minutes(arrival_time), self.first_minute_penalty,
+                                          self.additional_minute_penalty))
+
+
+# Règles d'un assignment dont le contrat n'existe pas (renommé ou supprimé): salaire de
+# base versé en un jour, prix et commission des boissons par défaut, pas de pénalité de retard
+NO_CONTRACT = CompiledContract(
+    id=None, name=None, agency_id=None, days=1, late_cutoff_time=None, cutoff_minutes=None,
+    first_minute_penalty=0.0, additional_minute_penalty=0.0, drink_price=220.0, staff_commission=100.0
+)
+
+
+def arrival_minutes(arrival_time):
+    """Heure d'arrivée en minutes depuis minuit (secondes ignorées), -1 si inconnue."""
+    return arrival_time.hour * 60 + arrival_time.minute if arrival_time else -1
+
+
+# Règles de calcul des valeurs journalières, seule implémentation: écrites avec des opérations
+# NumPy, elles s'appliquent aussi bien à un record (scalaires, saisie unitaire) qu'à des
+# colonnes de records (arrays, moteur de recalcul vectorisé)
+
+def late_minutes_between(arrival, cutoff):
+    """Minutes de retard (0 si l'arrivée ou l'heure limite est inconnue, c'est-à-dire -1)."""
+    return np.where((arrival >= 0) & (cutoff >= 0), np.maximum(arrival - cutoff, 0), 0)
+
+
+def lateness_penalty_for(late_minutes, first_minute_penalty, additional_minute_penalty):
+    """Pénalité de retard: première minute fixe + minutes suivantes au tarif additionnel."""
+    return np.where(late_minutes > 0,
+                    first_minute_penalty + np.maximum(late_minutes - 1, 0) * additional_minute_penalty, 0.0)
+
+
+def daily_rule_values(base_salary, days, late_minutes, first_minute_penalty, additional_minute_penalty,
+                      drink_price, staff_commission, drinks_sold, special_commissions, bonus, malus):
+    """
+    Valeurs journalières d'une performance (ou de colonnes de performances).
+
+    Args:
+        base_salary: Salaire de base de l'assignment
+        days: Durée du contrat en jours (salaire de base journalier nul si <= 0)
+        late_minutes: Minutes de retard (late_minutes_between)
+        first_minute_penalty, additional_minute_penalty: Pénalités de retard du contrat
+        drink_price, staff_commission: Prix d'une boisson et commission du staff par boisson
+        drinks_sold, special_commissions, bonus, malus: Saisie du jour
+
+    Returns:
+        dict: 'lateness_penalty', 'base_daily_salary', 'daily_salary', 'daily_commission',
+              'daily_revenue', 'daily_profit' (arrays NumPy, de dimension 0 pour des scalaires)
+    """
+    lateness_penalty = lateness_penalty_for(late_minutes, first_minute_penalty, additional_minute_penalty)
+
+    # Salaire journalier = salaire de base proratisé + bonus - malus - pénalité de retard
+    base_daily_salary = np.where(days > 0, base_salary / np.where(days > 0, days, 1), 0.0)
+    daily_salary = base_daily_salary + bonus - malus - lateness_penalty
+
+    # Profit journalier = (boissons * prix + commissions spéciales) - (salaire + commission sur les boissons)
+    daily_commission = np.where(drinks_sold > 0, drinks_sold * staff_commission, 0.0)
+    daily_revenue = drinks_sold * drink_price + special_commissions
+    daily_profit = daily_revenue - daily_salary - daily_commission
+
+    return {
+        'lateness_penalty': lateness_penalty,
+        'base_daily_salary': base_daily_salary,
+        'daily_salary': daily_salary,
+        'daily_commission': daily_commission,
+        'daily_revenue': daily_revenue,
+        'daily_profit': daily_profit,
+    }
+
+
+def compile_contract(contract):
+    """
+    Construit le CompiledContract d'un AgencyContract (retourné tel quel s'il est déjà compilé).
+
+    Args:
+        contract: AgencyContract ou CompiledContract
+
+    Returns:
+        CompiledContract: Règles immuables du contrat
+    """
+    if isinstance(contract, CompiledContract):
+        return contract
+
+    try:
+        hour, minute = map(int, contract.late_cutoff_time.split(':'))
+        cutoff_minutes = hour * 60 + minute
+    except (ValueError, AttributeError):
+        cutoff_minutes = None
+
+    return CompiledContract(
+        id=contract.id,
+        name=contract.name,
+        agency_id=contract.agency_id,
+        days=contract.days,
+        late_cutoff_time=contract.late_cutoff_time,
+        cutoff_minutes=cutoff_minutes,
+        first_minute_penalty=contract.first_minute_penalty if contract.first_minute_penalty is not None else 0.0,
+        additional_minute_penalty=contract.additional_minute_penalty if contract.additional_minute_penalty is not None else 0.0,
+        drink_price=contract.drink_price,
+        staff_commission=contract.staff_commission
+    )
+
+
+# Cache par application (app.extensions['contract_rules']):
+# 'agencies' = agency_id -> (chargé à, {nom du contrat: CompiledContract}),
+# 'generation' = incrémenté à chaque invalidation, pour ne pas remettre en cache
+# des règles lues avant une invalidation concurrente
+_rules_lock = threading.Lock()
+
+
+def _rules_cache():
+    return current_app.extensions.setdefault('contract_rules', {'generation': 0, 'agencies': {}})
+
+
+def get_agency_rules(agency_id):
+    """
+    Retourne les contrats compilés d'une agence, chargés en une requête puis gardés
+    en cache jusqu'à invalidation (ou expiration de CONTRACT_RULES_CACHE_TTL, pour
+    les autres processus qui ne voient pas l'invalidation).
+
+    Args:
+        agency_id (int): ID de l'agence
+
+    Returns:
+        dict: {nom du contrat: CompiledContract}, dans l'ordre des IDs
+    """
+    ttl = current_app.config.get('CONTRACT_RULES_CACHE_TTL', 300)
+    now = time_module.monotonic()
+
+    cache = _rules_cache()
+    cached = cache['agencies'].get(agency_id)
+    if cached and now - cached[0] < ttl:
+        return cached[1]
+
+    generation = cache['generation']
+    contracts = AgencyContract.query.filter_by(agency_id=agency_id).order_by(AgencyContract.id).all()
+    rules = {contract.name: compile_contract(contract) for contract in contracts}
+    with _rules_lock:
+        if cache['generation'] == generation:
+            cache['agencies'][agency_id] = (now, rules)
+    return rules
+
+
+def get_contract_rules(agency_id, contract_name):
+    """
+    Retourne le contrat compilé (contract_name, agency_id), ou None s'il n'existe pas.
+
+    Args:
+        agency_id (int): ID de l'agence
+        contract_name (str): Nom du contrat (Assignment.contract_type)
+
+    Returns:
+        CompiledContract: Règles du contrat ou None
+    """
+    return get_agency_rules(agency_id).get(contract_name)
+
+
+def invalidate_contract_rules(agency_id=None):
+    """
+    Vide le cache des règles d'une agence (ou de toutes les agences).
+    À appeler après le commit qui crée, modifie ou supprime un contrat.
+
+    Args:
+        agency_id (int, optional): ID de l'agence, None pour tout vider
+    """
+    cache = _rules_cache()
+    with _rules_lock:
+        cache['generation'] += 1
+        if agency_id is None:
+            cache['agencies'].clear()
+        else:
+            cache['agencies'].pop(agency_id, None)
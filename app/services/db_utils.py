@@ -0,0 +1,65 @@
+# app/services/db_utils.py
+
+from app import db
+from sqlalchemy import insert, update, select, tuple_
+
+
+def bulk_upsert(model, rows, conflict_columns, update_columns):
+    """
+    Insère ou met à jour un lot de lignes en une seule instruction
+    INSERT ... ON CONFLICT DO UPDATE (SQLite, PostgreSQL) ou
+    INSERT ... ON DUPLICATE KEY UPDATE (MySQL). Pas de commit ici.
+
+    Args:
+        model: Modèle SQLAlchemy cible
+        rows (list): Liste de dictionnaires {colonne: valeur}
+        conflict_columns (list): Colonnes de la contrainte d'unicité
+        update_columns (list): Colonnes à mettre à jour si la ligne existe déjà
+
+    Returns:
+        int: Nombre de lignes envoyées
+    """
+    if not rows:
+        return 0
+
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict_columns,
+            set_={column: stmt.excluded[column] for column in update_columns}
+        )
+        db.session.execute(stmt, rows)
+    elif dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in update_columns})
+        db.session.execute(stmt, rows)
+    else:
+        # Fallback générique: une requête pour les clés existantes, puis INSERT et UPDATE groupés
+        key_columns = [table.c[column] for column in conflict_columns]
+        keys = [tuple(row[column] for column in conflict_columns) for row in rows]
+        existing = {
+            tuple(found[1:]): found[0]
+            for found in db.session.execute(
+                select(table.c.id, *key_columns).where(tuple_(*key_columns).in_(keys))
+            )
+        }
+        to_insert, to_update = [], []
+        for key, row in zip(keys, rows):
+            if key in existing:
+                to_update.append({'id': existing[key], **{column: row[column] for column in update_columns}})
+            else:
+                to_insert.append(row)
+        if to_insert:
+            db.session.execute(insert(model), to_insert)
+        if to_update:
+            db.session.execute(update(model), to_update)
+
+    return len(rows)
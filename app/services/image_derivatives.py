@@ -0,0 +1,309 @@
+# app/services/image_derivatives.py
+
+import base64
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from PIL import Image, ImageOps
+
+
+# Dossier des dérivées, à côté des fichiers originaux: <dossier>/derivatives/<nom de dérivée>/
+DERIVATIVES_DIRNAME = 'derivatives'
+
+# Extensions traitées comme images (les autres fichiers sont ignorés par le backfill)
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff'}
+
+# Dérivées web, carrées et recadrées au centre (photos et logos sont affichés en object-fit: cover):
+# nom -> côté en pixels, le double de la taille d'affichage (liste 40px, carte 120px, fiche 200px)
+WEB_DERIVATIVES = {'thumb': 80, 'card': 240, 'detail': 400}
+
+# Formats de chaque dérivée web: extension -> (format Pillow, options d'enregistrement)
+WEB_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Aperçu flou affiché pendant le chargement: côté en pixels, embarqué en data URI dans la page
+PLACEHOLDER_SIZE = 16
+
+
+def venue_logo_folder():
+    """Dossier des logos de venue (servis sous /static/uploads/venues)."""
+    return os.path.join(current_app.root_path, 'static', 'uploads', 'venues')
+
+
+def venue_logo_thumbnails(logo_url):
+    """
+    URLs des dérivées 'thumb' d'un logo de venue (affiché en 40px dans la liste des venues).
+
+    Args:
+        logo_url (str): URL du logo, '/static/uploads/venues/<fichier>'
+
+    Returns:
+        dict: {extension: URL} des dérivées existantes, vide sans dérivée
+    """
+    if not logo_url:
+        return {}
+    filename = logo_url.split('/')[-1]
+    source_path = os.path.join(venue_logo_folder(), filename)
+    stem = os.path.splitext(filename)[0]
+    return {
+        ext: f"/static/uploads/venues/{DERIVATIVES_DIRNAME}/thumb/{stem}.{ext}"
+        for ext in WEB_FORMATS if os.path.exists(derivative_path(source_path, 'thumb', ext))
+    }
+
+
+def derivative_path(source_path, name, ext='jpg'):
+    """Chemin d'une dérivée ('print', 'thumb', 'card', 'detail') d'une image, qu'elle existe ou non."""
+    folder, filename = os.path.split(source_path)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(folder, DERIVATIVES_DIRNAME, name, f"{stem}.{ext}")
+
+
+def print_derivative_path(source_path):
+    """Chemin de la dérivée d'impression (JPEG) d'une image, qu'elle existe ou non."""
+    return derivative_path(source_path, 'print', 'jpg')
+
+
+def web_derivative_paths(source_path):
+    """Chemins de toutes les dérivées web d'une image."""
+    return [derivative_path(source_path, name, ext) for name in WEB_DERIVATIVES for ext in WEB_FORMATS]
+
+
+def _flatten(image):
+    """Image en RVB pour JPEG: orientation EXIF appliquée, transparence posée sur fond blanc."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _open(source_path, size):
+    """Image aplatie, décodée directement réduite par le codec JPEG quand c'est possible (au moins size px)."""
+    with Image.open(source_path) as image:
+        image.draft('RGB', (size, size))
+        return _flatten(image)
+
+
+def _save(image, target, image_format, **options):
+    """Écriture atomique: un lecteur ne voit jamais une dérivée à moitié écrite."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    image.save(tmp_path, image_format, **options)
+    os.replace(tmp_path, target)
+
+
+def _write_print(image, source_path, size, quality):
+    scale = size / min(image.size)
+    if scale < 1:
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                             Image.LANCZOS)
+    target = print_derivative_path(source_path)
+    _save(image, target, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return target
+
+
+def _write_web(image, source_path):
+    """Écrit les dérivées web, de la plus grande à la plus petite (chacune réduite depuis la précédente)."""
+    for name, side in sorted(WEB_DERIVATIVES.items(), key=lambda item: -item[1]):
+        side = min(side, *image.size)
+        image = ImageOps.fit(image, (side, side), Image.LANCZOS)
+        for ext, (image_format, options) in WEB_FORMATS.items():
+            _save(image, derivative_path(source_path, name, ext), image_format, **options)
+    return _placeholder(image)
+
+
+def _placeholder(image):
+    """Aperçu minuscule de l'image en data URI WebP (moins de 300 octets, contre ~1 Ko en JPEG)."""
+    image = ImageOps.fit(image, (PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, 'WEBP', quality=40)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def _thumb_placeholder(source_path):
+    with Image.open(derivative_path(source_path, 'thumb', 'jpg')) as thumb:
+        return _placeholder(thumb.convert('RGB'))
+
+
+def generate_derivatives(source_path, print_size, print_quality):
+    """
+    Crée toutes les dérivées d'une image en la décodant une seule fois: impression
+    (JPEG, plus petit côté à print_size) et web (WEB_DERIVATIVES x WEB_FORMATS).
+    Sans contexte d'application, pour tourner dans les processus du backfill.
+
+    Args:
+        source_path (str): Image originale
+        print_size (int): Plus petit côté de la dérivée d'impression
+        print_quality (int): Qualité JPEG de la dérivée d'impression
+
+    Returns:
+        str: Aperçu de l'image (data URI)
+    """
+    image = _open(source_path, max(print_size, *WEB_DERIVATIVES.values()))
+    _write_print(image, source_path, print_size, print_quality)
+    return _write_web(image, source_path)
+
+
+def create_print_derivative(source_path, size=None, quality=None):
+    """
+    Crée la dérivée d'impression d'une image: JPEG dont le plus petit côté est ramené à
+    PRINT_IMAGE_SIZE pixels (jamais agrandi), assez pour une photo recadrée à 300 dpi
+    dans les PDF, sans faire décoder à WeasyPrint un original de plusieurs mégapixels.
+
+    Args:
+        source_path (str): Image originale
+        size (int, optional): Plus petit côté en pixels (défaut: PRINT_IMAGE_SIZE)
+        quality (int, optional): Qualité JPEG (défaut: PRINT_IMAGE_QUALITY)
+
+    Returns:
+        str: Chemin de la dérivée
+    """
+    size = size or current_app.config.get('PRINT_IMAGE_SIZE', 400)
+    quality = quality or current_app.config.get('PRINT_IMAGE_QUALITY', 85)
+    return _write_print(_open(source_path, size), source_path, size, quality)
+
+
+def create_derivatives(source_path):
+    """
+    Crée les dérivées d'une image qui vient d'être enregistrée. Une image illisible
+    n'empêche pas l'upload: l'erreur est journalisée et l'original reste utilisé.
+
+    Args:
+        source_path (str): Image originale
+
+    Returns:
+        str: Aperçu de l'image (data URI), ou None si l'image n'a pas pu être traitée
+    """
+    try:
+        return generate_derivatives(source_path, current_app.config.get('PRINT_IMAGE_SIZE', 400),
+                                    current_app.config.get('PRINT_IMAGE_QUALITY', 85))
+    except Exception as e:
+        current_app.logger.warning(f"Could not create image derivatives for {source_path}: {e}")
+        return None
+
+
+def image_placeholder(source_path):
+    """
+    Aperçu d'une image déjà traitée, recalculé depuis sa petite dérivée (upload d'un
+    fichier déjà stocké), ou créé avec toutes ses dérivées si elles manquent.
+
+    Args:
+        source_path (str): Image originale
+
+    Returns:
+        str: Aperçu de l'image (data URI), ou None si l'image n'a pas pu être traitée
+    """
+    try:
+        return _thumb_placeholder(source_path)
+    except OSError:
+        return create_derivatives(source_path)
+
+
+def print_image_path(source_path):
+    """
+    Image à embarquer dans un PDF: la dérivée d'impression, créée si elle manque
+    (original antérieur au backfill), ou l'original si l'image ne peut pas être réduite.
+
+    Args:
+        source_path (str): Image originale
+
+    Returns:
+        str: Chemin de la dérivée, ou de l'original
+    """
+    target = print_derivative_path(source_path)
+    if os.path.exists(target):
+        return target
+    try:
+        return create_print_derivative(source_path)
+    except Exception as e:
+        current_app.logger.warning(f"Using original image in PDF, no print derivative for {source_path}: {e}")
+        return source_path
+
+
+def web_image_path(source_path, name, ext):
+    """
+    Dérivée web à servir pour une image, créée avec les autres si elle manque
+    (original antérieur au backfill).
+
+    Args:
+        source_path (str): Image originale
+        name (str): Taille dans WEB_DERIVATIVES
+        ext (str): Extension dans WEB_FORMATS
+
+    Returns:
+        str: Chemin de la dérivée, ou None si l'original est absent ou illisible
+    """
+    target = derivative_path(source_path, name, ext)
+    if os.path.exists(target):
+        return target
+    if not os.path.isfile(source_path):
+        return None
+    create_derivatives(source_path)
+    return target if os.path.exists(target) else None
+
+
+def _backfill_one(source_path, print_size, print_quality, force):
+    """Traite une image du backfill (processus de travail): (statut, aperçu)."""
+    targets = [print_derivative_path(source_path)] + web_derivative_paths(source_path)
+    try:
+        if not force and all(os.path.exists(target) for target in targets):
+            # Aperçu recalculé depuis la petite dérivée, pour renseigner les profils existants
+            return 'skipped', _thumb_placeholder(source_path)
+        return 'created', generate_derivatives(source_path, print_size, print_quality)
+    except Exception as e:
+        return 'failed', str(e)
+
+
+def backfill_derivatives(folder, force=False, workers=None):
+    """
+    Crée les dérivées manquantes (ou toutes avec force) des images d'un dossier,
+    sans descendre dans les sous-dossiers, réparties sur plusieurs processus.
+
+    Args:
+        folder (str): Dossier des originaux
+        force (bool): Recréer les dérivées existantes
+        workers (int, optional): Nombre de processus (défaut: nombre de CPU, 1 = sans processus)
+
+    Returns:
+        dict: Nombre d'images 'created', 'skipped' (déjà faites) et 'failed', et
+              'placeholders' {nom de fichier: aperçu} des images traitées
+    """
+    report = {'created': 0, 'skipped': 0, 'failed': 0, 'placeholders': {}}
+    if not os.path.isdir(folder):
+        return report
+
+    filenames = [
+        filename for filename in sorted(os.listdir(folder))
+        if os.path.isfile(os.path.join(folder, filename))
+        and os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS
+    ]
+    if not filenames:
+        return report
+
+    print_size = current_app.config.get('PRINT_IMAGE_SIZE', 400)
+    print_quality = current_app.config.get('PRINT_IMAGE_QUALITY', 85)
+    args = ([os.path.join(folder, filename) for filename in filenames], [print_size] * len(filenames),
+            [print_quality] * len(filenames), [force] * len(filenames))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(filenames) == 1:
+        _collect(report, folder, filenames, map(_backfill_one, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(filenames))) as pool:
+            _collect(report, folder, filenames, pool.map(_backfill_one, *args, chunksize=4))
+    return report
+
+
+def _collect(report, folder, filenames, results):
+    for filename, (status, value) in zip(filenames, results):
+        report[status] += 1
+        if status == 'failed':
+            current_app.logger.warning(f"Could not create image derivatives for {os.path.join(folder, filename)}: {value}")
+        else:
+            report['placeholders'][filename] = value
@@ -2,9 +2,13 @@
 
 import time as time_module
 from app import db
-from app.models import Assignment, PerformanceRecord, ContractCalculations, AgencyContract, StaffProfile
-from datetime import datetime, time
-from sqlalchemy import func
+from app.models import Assignment, PerformanceRecord, ContractCalculations, AgencyContract, StaffProfile, Venue, User
+from app.services.contract_rules import (NO_CONTRACT, arrival_minutes, compile_contract, daily_rule_values,
+                                         get_agency_rules, get_contract_rules, late_minutes_between)
+from app.services.db_utils import bulk_upsert
+from app.services.rollup_service import ROLLUP_FIELDS, rollup_contribution, rollup_key, apply_rollup_deltas
+from datetime import date, datetime, time
+from sqlalchemy import func, case, and_, or_, cast, Date
 from sqlalchemy.orm import joinedload
 from flask import current_app
 
@@ -15,46 +19,310 @@ def calculate_lateness_penalty(record, agency_contract):
     
     Args:
         record: PerformanceRecord avec arrival_time
-        agency_contract: AgencyContract avec les paramètres de pénalité
+        agency_contract: AgencyContract (ou CompiledContract) avec les paramètres de pénalité
         
     Returns:
         float: Montant de la pénalité de retard
     """
-    if not record.arrival_time or not agency_contract.late_cutoff_time:
-        return 0.0
+    # Première minute: pénalité fixe (first_minute_penalty)
+    # Minutes suivantes: pénalité par minute (additional_minute_penalty)
+    return compile_contract(agency_contract).lateness_penalty(record.arrival_time)
+
+
+def calculate_daily_performance(base_salary, agency_contract, arrival_time, drinks_sold,
+                                special_commissions, bonus, malus):
+    """
+    Calcule les valeurs journalières d'une performance avec les règles de contract_rules
+    (daily_rule_values), partagées avec le moteur de recalcul vectorisé.
     
-    # Convertir l'heure limite en objet time
+    Args:
+        base_salary (float): Salaire de base de l'assignment
+        agency_contract: CompiledContract (ou AgencyContract) de l'assignment, ou None
+        arrival_time (time): Heure d'arrivée (ou None)
+        drinks_sold (int): Boissons vendues
+        special_commissions (float): Commissions spéciales
+        bonus (float): Bonus du jour
+        malus (float): Malus du jour
+        
+    Returns:
+        dict: 'lateness_penalty', 'base_daily_salary', 'daily_salary', 'daily_commission', 'daily_profit'
+    """
+    # Mêmes règles et mêmes valeurs par défaut (NO_CONTRACT) que le moteur de recalcul vectorisé
+    contract = compile_contract(agency_contract) if agency_contract else NO_CONTRACT
+    values = daily_rule_values(
+        base_salary, contract.days,
+        late_minutes_between(arrival_minutes(arrival_time),
+                             -1 if contract.cutoff_minutes is None else contract.cutoff_minutes),
+        contract.first_minute_penalty, contract.additional_minute_penalty,
+        contract.drink_price, contract.staff_commission,
+        drinks_sold, special_commissions, bonus, malus
+    )
+    return {key: float(values[key]) for key in
+            ('lateness_penalty', 'base_daily_salary', 'daily_salary', 'daily_commission', 'daily_profit')}
+
+
+# Champs de ContractCalculations alimentés par chaque PerformanceRecord
+CONTRIBUTION_FIELDS = ('days_worked', 'total_drinks', 'total_special_comm',
+                       'total_salary', 'total_commission', 'total_profit')
+
+
+def performance_contribution(record, agency_contract):
+    """
+    Calcule la contribution d'un PerformanceRecord aux totaux de ContractCalculations.
+    Mêmes règles que process_assignments_batch (valeurs journalières comme source de vérité).
+
+    Args:
+        record: PerformanceRecord (ou None si aucun enregistrement)
+        agency_contract: AgencyContract de l'assignment (ou None)
+
+    Returns:
+        dict: {champ: valeur} pour chaque champ de CONTRIBUTION_FIELDS
+    """
+    if record is None:
+        return dict.fromkeys(CONTRIBUTION_FIELDS, 0)
+
+    drinks = record.drinks_sold or 0
+    commission = 0.0
+    if agency_contract and drinks > 0:
+        commission = drinks * agency_contract.staff_commission
+
+    return {
+        'days_worked': 1,
+        'total_drinks': drinks,
+        'total_special_comm': record.special_commissions or 0.0,
+        'total_salary': record.daily_salary or 0.0,
+        'total_commission': commission,
+        'total_profit': record.daily_profit or 0.0
+    }
+
+
+def apply_performance_delta(assignment_id, previous, current, agency_contract=None):
+    """
+    Répercute la modification d'un PerformanceRecord sur la ligne ContractCalculations
+    correspondante, dans la transaction en cours (pas de commit ici).
+
+    La mise à jour est faite en SQL (colonne = colonne + delta) pour rester correcte
+    si deux managers saisissent en même temps sur le même contrat.
+
+    Args:
+        assignment_id (int): ID de l'assignment
+        previous (dict): Contribution avant modification (performance_contribution)
+        current (dict): Contribution après modification (performance_contribution)
+        agency_contract: AgencyContract, utilisé seulement si la ligne doit être créée
+
+    Returns:
+        bool: True si un delta a été appliqué, False si la ligne a été (re)créée
+    """
+    # S'assurer que le record modifié est visible par les requêtes SQL qui suivent
+    db.session.flush()
+
+    values = {
+        getattr(ContractCalculations, field): func.coalesce(getattr(ContractCalculations, field), 0) + (current[field] - previous[field])
+        for field in CONTRIBUTION_FIELDS
+    }
+    values[ContractCalculations.last_updated] = datetime.utcnow()
+
+    updated = ContractCalculations.query.filter_by(assignment_id=assignment_id).update(
+        values, synchronize_session=False
+    )
+    if updated:
+        return True
+
+    # Pas encore de ligne: on l'initialise à partir de tous les records existants
+    _seed_contract_calculations(assignment_id, agency_contract)
+    return False
+
+
+def _seed_contract_calculations(assignment_id, agency_contract):
+    """Crée la ligne ContractCalculations d'un assignment à partir d'une agrégation SQL."""
+    totals = db.session.query(
+        func.count(PerformanceRecord.id),
+        func.sum(PerformanceRecord.drinks_sold),
+        func.sum(PerformanceRecord.special_commissions),
+        func.sum(PerformanceRecord.daily_salary),
+        func.sum(PerformanceRecord.daily_profit)
+    ).filter(PerformanceRecord.assignment_id == assignment_id).one()
+
+    days_worked, total_drinks, total_special_comm, total_salary, total_profit = totals
+    total_drinks = total_drinks or 0
+    total_commission = total_drinks * agency_contract.staff_commission if agency_contract else 0.0
+
+    contract_calc = ContractCalculations(
+        assignment_id=assignment_id,
+        total_salary=total_salary or 0.0,
+        total_commission=total_commission,
+        total_profit=total_profit or 0.0,
+        days_worked=days_worked or 0,
+        total_drinks=total_drinks,
+        total_special_comm=total_special_comm or 0.0,
+        last_updated=datetime.utcnow()
+    )
+    db.session.add(contract_calc)
+    return contract_calc
+
+
+# Colonnes de PerformanceRecord réécrites quand la soirée est saisie à nouveau
+PERFORMANCE_UPSERT_COLUMNS = ['arrival_time', 'departure_time', 'drinks_sold', 'special_commissions',
+                              'bonus', 'malus', 'lateness_penalty', 'daily_salary', 'daily_profit']
+
+# Nombre maximum d'entrées acceptées par saisie groupée
+MAX_PERFORMANCE_BATCH = 500
+
+
+def _parse_time(value):
+    """Convertit "HH:MM" en time (None si vide ou invalide, comme la saisie unitaire)."""
+    if not value:
+        return None
     try:
-        cutoff_hour, cutoff_minute = map(int, agency_contract.late_cutoff_time.split(':'))
-        cutoff_time = time(cutoff_hour, cutoff_minute)
-    except (ValueError, AttributeError):
-        return 0.0
+        return time.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def upsert_performance_batch(agency_id, entries):
+    """
+    Enregistre les performances d'une soirée en une seule transaction: validation contre
+    les assignments actifs en une requête, calcul des valeurs journalières en une passe,
+    un seul INSERT ... ON CONFLICT (assignment_id, record_date) puis les deltas sur
+    ContractCalculations et DailyRollup. Rien n'est écrit si une entrée est invalide.
+    
+    Args:
+        agency_id (int): ID de l'agence courante
+        entries (list): Liste de dictionnaires {assignment_id, record_date, arrival_time,
+            departure_time, drinks_sold, special_commissions, bonus, malus}
+        
+    Returns:
+        dict: 'errors' (liste de {index, message}), 'created', 'updated' et 'records'
+              (PerformanceRecord enregistrés, dans l'ordre des entrées)
+    """
+    batch_start = time_module.time()
+    errors = []
+    parsed = []
+    
+    for index, entry in enumerate(entries):
+        try:
+            assignment_id = int(entry.get('assignment_id'))
+            ymd = datetime.fromisoformat(entry.get('record_date')).date()
+        except Exception:
+            errors.append({'index': index, 'message': 'Invalid assignment_id or record_date'})
+            continue
+        try:
+            values = {
+                'arrival_time': _parse_time(entry.get('arrival_time')),
+                'departure_time': _parse_time(entry.get('departure_time')),
+                'drinks_sold': int(entry.get('drinks_sold') or 0),
+                'special_commissions': float(entry.get('special_commissions') or 0.0),
+                'bonus': float(entry.get('bonus') or 0.0),
+                'malus': float(entry.get('malus') or 0.0)
+            }
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'message': 'Invalid numeric value'})
+            continue
+        parsed.append((index, assignment_id, ymd, values))
     
-    # Si l'arrivée est avant l'heure limite, pas de pénalité
-    if record.arrival_time <= cutoff_time:
-        return 0.0
+    # REQUÊTE 1: tous les assignments concernés de l'agence
+    assignment_ids = {assignment_id for _, assignment_id, _, _ in parsed}
+    assignments = {
+        row.id: row for row in db.session.query(
+            Assignment.id, Assignment.status, Assignment.start_date, Assignment.end_date,
+            Assignment.base_salary, Assignment.contract_type, Assignment.venue_id
+        ).filter(Assignment.agency_id == agency_id, Assignment.id.in_(assignment_ids)).all()
+    } if assignment_ids else {}
     
-    # Calculer les minutes de retard
-    arrival_minutes = record.arrival_time.hour * 60 + record.arrival_time.minute
-    cutoff_minutes = cutoff_time.hour * 60 + cutoff_time.minute
-    late_minutes = arrival_minutes - cutoff_minutes
+    seen = set()
+    for index, assignment_id, ymd, _ in parsed:
+        a = assignments.get(assignment_id)
+        if not a or a.status != 'active':
+            errors.append({'index': index, 'message': 'Performance can only be added to active assignments.'})
+        elif not (a.start_date <= ymd <= a.end_date):
+            errors.append({'index': index, 'message': 'Date outside contract period.'})
+        elif (assignment_id, ymd) in seen:
+            errors.append({'index': index, 'message': 'Duplicate entry for this assignment and date.'})
+        seen.add((assignment_id, ymd))
     
-    if late_minutes <= 0:
-        return 0.0
+    if errors:
+        return {'errors': sorted(errors, key=lambda error: error['index']), 'created': 0, 'updated': 0, 'records': []}
     
-    # Calculer la pénalité
-    # Première minute: pénalité fixe (first_minute_penalty)
-    # Minutes suivantes: pénalité par minute (additional_minute_penalty)
-    first_minute_penalty = agency_contract.first_minute_penalty if agency_contract.first_minute_penalty is not None else 0.0
-    additional_minute_penalty = agency_contract.additional_minute_penalty if agency_contract.additional_minute_penalty is not None else 0.0
+    # REQUÊTE 2: records existants (contribution actuelle aux totaux), lus en colonnes
+    record_dates = {ymd for _, _, ymd, _ in parsed}
+    existing = {
+        (row.assignment_id, row.record_date): row for row in db.session.query(
+            PerformanceRecord.assignment_id, PerformanceRecord.record_date, PerformanceRecord.arrival_time,
+            PerformanceRecord.drinks_sold, PerformanceRecord.special_commissions,
+            PerformanceRecord.daily_salary, PerformanceRecord.daily_profit
+        ).filter(
+            PerformanceRecord.assignment_id.in_(assignment_ids),
+            PerformanceRecord.record_date.in_(record_dates)
+        ).all()
+    }
+    
+    # Calcul des valeurs journalières et des deltas (par assignment et par venue/jour) en une passe
+    rules = get_agency_rules(agency_id)
+    rows = []
+    deltas = {}
+    rollup_deltas = {}
+    for _, assignment_id, ymd, values in parsed:
+        a = assignments[assignment_id]
+        agency_contract = rules.get(a.contract_type)
+        daily = calculate_daily_performance(
+            a.base_salary, agency_contract, values['arrival_time'], values['drinks_sold'],
+            values['special_commissions'], values['bonus'], values['malus']
+        )
+        row = dict(values, assignment_id=assignment_id, record_date=ymd,
+                   lateness_penalty=daily['lateness_penalty'],
+                   daily_salary=daily['daily_salary'],
+                   daily_profit=daily['daily_profit'])
+        rows.append(row)
+        
+        existing_record = existing.get((assignment_id, ymd))
+        new_record = PerformanceRecord(**row)
+        previous = performance_contribution(existing_record, agency_contract)
+        current = performance_contribution(new_record, agency_contract)
+        if assignment_id not in deltas:
+            deltas[assignment_id] = (dict.fromkeys(CONTRIBUTION_FIELDS, 0), dict.fromkeys(CONTRIBUTION_FIELDS, 0), agency_contract)
+        for field in CONTRIBUTION_FIELDS:
+            deltas[assignment_id][0][field] += previous[field]
+            deltas[assignment_id][1][field] += current[field]
+        
+        previous = rollup_contribution(existing_record, agency_contract)
+        current = rollup_contribution(new_record, agency_contract)
+        key = rollup_key(a.venue_id, ymd)
+        if key not in rollup_deltas:
+            rollup_deltas[key] = (dict.fromkeys(ROLLUP_FIELDS, 0), dict.fromkeys(ROLLUP_FIELDS, 0))
+        for field in ROLLUP_FIELDS:
+            rollup_deltas[key][0][field] += previous[field]
+            rollup_deltas[key][1][field] += current[field]
     
-    penalty = first_minute_penalty
+    try:
+        bulk_upsert(PerformanceRecord, rows, ['assignment_id', 'record_date'], PERFORMANCE_UPSERT_COLUMNS)
+        for assignment_id, (previous, current, agency_contract) in deltas.items():
+            apply_performance_delta(assignment_id, previous, current, agency_contract)
+        apply_rollup_deltas(agency_id, rollup_deltas)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
     
-    if late_minutes > 1:
-        additional_minutes = late_minutes - 1
-        penalty += additional_minutes * additional_minute_penalty
+    # Relire les records enregistrés (IDs compris) pour la réponse
+    saved = {
+        (record.assignment_id, record.record_date): record
+        for record in PerformanceRecord.query.filter(
+            PerformanceRecord.assignment_id.in_(assignment_ids),
+            PerformanceRecord.record_date.in_(record_dates)
+        ).all()
+    }
+    updated = sum(1 for row in rows if (row['assignment_id'], row['record_date']) in existing)
     
-    return penalty
+    current_app.logger.info(
+        f"[PERF] Bulk performance upsert: {len(rows)} records ({len(rows) - updated} created, {updated} updated) "
+        f"in {time_module.time() - batch_start:.3f}s"
+    )
+    return {
+        'errors': [],
+        'created': len(rows) - updated,
+        'updated': updated,
+        'records': [saved[(row['assignment_id'], row['record_date'])] for row in rows]
+    }
 
 
 def process_assignments_batch(assignments):
@@ -75,16 +343,12 @@ def process_assignments_batch(assignments):
     assignment_ids = [a.id for a in assignments]
     agency_ids = list(set(a.agency_id for a in assignments))
     
-    # PRÉ-REQUÊTE 1: Récupérer tous les AgencyContract nécessaires
-    agency_contracts_query = AgencyContract.query.filter(
-        AgencyContract.agency_id.in_(agency_ids)
-    ).all()
-    
-    # Créer un dictionnaire pour accès rapide: (contract_type, agency_id) -> AgencyContract
+    # PRÉ-REQUÊTE 1: Règles compilées des contrats nécessaires (cache, sans requête si déjà chargées)
+    # Dictionnaire pour accès rapide: (contract_type, agency_id) -> CompiledContract
     contracts_dict = {}
-    for contract in agency_contracts_query:
-        key = (contract.name, contract.agency_id)
-        contracts_dict[key] = contract
+    for agency_id in agency_ids:
+        for contract in get_agency_rules(agency_id).values():
+            contracts_dict[(contract.name, contract.agency_id)] = contract
     
     # PRÉ-REQUÊTE 2: Récupérer tous les ContractCalculations existants
     existing_calculations = ContractCalculations.query.filter(
@@ -150,6 +414,7 @@ def process_assignments_batch(assignments):
             contract_calc.days_worked = days_worked
             contract_calc.total_drinks = total_drinks
             contract_calc.total_special_comm = total_special_comm
+            contract_calc.is_stale = False
             contract_calc.last_updated = datetime.utcnow()
         else:
             # Créer un nouveau calcul
@@ -179,10 +444,75 @@ def process_assignments_batch(assignments):
         raise Exception(f"Erreur lors de la sauvegarde batch: {str(e)}")
 
 
+def refresh_stale_calculations(assignments):
+    """
+    Retourne les ContractCalculations d'une liste d'assignments en ne recalculant que
+    ceux qui sont absents ou marqués is_stale. Si tout est à jour, aucune écriture
+    (donc aucune transaction d'écriture) n'est faite.
+
+    Args:
+        assignments (list): Liste d'Assignment avec contract_calculations préchargés
+
+    Returns:
+        dict: Dictionnaire {assignment_id: ContractCalculations}
+    """
+    results = {}
+    stale_assignments = []
+    for assignment in assignments:
+        contract_calc = assignment.contract_calculations
+        if contract_calc is None or contract_calc.is_stale:
+            stale_assignments.append(assignment)
+        else:
+            results[assignment.id] = contract_calc
+
+    if stale_assignments:
+        results.update(calculate_totals_with_aggregation([a.id for a in stale_assignments]))
+
+    current_app.logger.info(
+        f"[PERF] ContractCalculations: {len(stale_assignments)} recomputed, {len(results) - len(stale_assignments)} skipped (fresh)"
+    )
+    return results
+
+
+def mark_contract_calculations_stale(agency_id, contract_types=None, assignment_ids=None):
+    """
+    Marque comme périmés les ContractCalculations d'une agence, éventuellement limités
+    à certains types de contrat ou assignments. Pas de commit: l'appelant valide la
+    transaction avec sa propre modification.
+
+    Args:
+        agency_id (int): ID de l'agence
+        contract_types (iterable, optional): Noms de contrat (Assignment.contract_type)
+        assignment_ids (iterable, optional): IDs d'assignments
+
+    Returns:
+        int: Nombre de lignes marquées
+    """
+    assignments_query = db.session.query(Assignment.id).filter(Assignment.agency_id == agency_id)
+    if contract_types is not None:
+        assignments_query = assignments_query.filter(Assignment.contract_type.in_(list(contract_types)))
+    if assignment_ids is not None:
+        assignments_query = assignments_query.filter(Assignment.id.in_(list(assignment_ids)))
+
+    return ContractCalculations.query.filter(
+        ContractCalculations.assignment_id.in_(assignments_query.scalar_subquery())
+    ).update({ContractCalculations.is_stale: True}, synchronize_session=False)
+
+
 def calculate_totals_with_aggregation(assignment_ids):
     """
     Calcule les totaux pour une liste d'assignment_ids en utilisant une seule
     requête d'agrégation SQL pour une performance maximale.
+    
+    La commission est calculée côté serveur en joignant AgencyContract sur
+    (contract_type, agency_id): aucun PerformanceRecord n'est chargé en Python.
+    Remplaçant direct de process_assignments_batch (même valeur de retour).
+    
+    Args:
+        assignment_ids (list): Liste d'IDs d'assignments
+        
+    Returns:
+        dict: Dictionnaire {assignment_id: ContractCalculations} des calculs mis à jour
     """
     if not assignment_ids:
         return {}
@@ -190,17 +520,30 @@ def calculate_totals_with_aggregation(assignment_ids):
     batch_start = time_module.time()
 
     # ÉTAPE 1: Requête d'agrégation pour calculer tous les totaux en une seule fois.
+    # Partir d'Assignment (outer join) garantit une ligne même sans performance.
+    drink_commission = case(
+        (PerformanceRecord.drinks_sold > 0, PerformanceRecord.drinks_sold * AgencyContract.staff_commission),
+        else_=0.0
+    )
     totals_by_assignment = db.session.query(
-        PerformanceRecord.assignment_id,
+        Assignment.id.label('assignment_id'),
         func.sum(PerformanceRecord.daily_salary).label('total_salary'),
         func.sum(PerformanceRecord.daily_profit).label('total_profit'),
         func.sum(PerformanceRecord.drinks_sold).label('total_drinks'),
         func.sum(PerformanceRecord.special_commissions).label('total_special_comm'),
+        func.sum(drink_commission).label('total_commission'),
         func.count(PerformanceRecord.id).label('days_worked')
+    ).outerjoin(
+        PerformanceRecord, PerformanceRecord.assignment_id == Assignment.id
+    ).outerjoin(
+        AgencyContract, and_(
+            AgencyContract.name == Assignment.contract_type,
+            AgencyContract.agency_id == Assignment.agency_id
+        )
     ).filter(
-        PerformanceRecord.assignment_id.in_(assignment_ids)
+        Assignment.id.in_(assignment_ids)
     ).group_by(
-        PerformanceRecord.assignment_id
+        Assignment.id
     ).all()
 
     # Transformer les résultats en un dictionnaire pour un accès facile.
@@ -210,6 +553,7 @@ def calculate_totals_with_aggregation(assignment_ids):
             'total_profit': res.total_profit or 0.0,
             'total_drinks': res.total_drinks or 0,
             'total_special_comm': res.total_special_comm or 0.0,
+            'total_commission': res.total_commission or 0.0,
             'days_worked': res.days_worked or 0
         }
         for res in totals_by_assignment
@@ -220,49 +564,35 @@ def calculate_totals_with_aggregation(assignment_ids):
         ContractCalculations.assignment_id.in_(assignment_ids)
     ).all()
     calcs_dict = {calc.assignment_id: calc for calc in existing_calcs}
-    
-    assignments_to_process = Assignment.query.options(joinedload(Assignment.staff)).filter(Assignment.id.in_(assignment_ids)).all()
-    assignments_dict = {a.id: a for a in assignments_to_process}
-
-    for assignment_id in assignment_ids:
-        totals = totals_dict.get(assignment_id, {})
-        
-        # Le calcul de la commission doit encore se faire en Python car il dépend des règles du contrat
-        total_commission = 0.0
-        # assignment = assignments_dict.get(assignment_id)
-        # if assignment:
-        #     # Note: This part still requires the contract rules. For this optimization, 
-        #     # we'll simplify and assume a fixed commission rate if contract isn't pre-loaded.
-        #     # A full optimization would involve pre-loading contracts as well.
-        #     # This logic should be adapted if commission rules are complex.
-        #     contract = assignment.get_contract() # Assuming a helper method exists
-        #     if contract and totals.get('total_drinks', 0) > 0:
-        #         total_commission = totals.get('total_drinks', 0) * contract.staff_commission
 
+    for assignment_id in totals_dict:
+        totals = totals_dict[assignment_id]
 
         if assignment_id in calcs_dict:
             # Mise à jour
             calc = calcs_dict[assignment_id]
-            calc.total_salary = totals.get('total_salary', 0.0)
-            calc.total_profit = totals.get('total_profit', 0.0)
-            calc.total_drinks = totals.get('total_drinks', 0)
-            calc.total_special_comm = totals.get('total_special_comm', 0.0)
-            calc.days_worked = totals.get('days_worked', 0)
-            calc.total_commission = total_commission
+            calc.total_salary = totals['total_salary']
+            calc.total_profit = totals['total_profit']
+            calc.total_drinks = totals['total_drinks']
+            calc.total_special_comm = totals['total_special_comm']
+            calc.days_worked = totals['days_worked']
+            calc.total_commission = totals['total_commission']
+            calc.is_stale = False
             calc.last_updated = datetime.utcnow()
         else:
             # Création
-            new_calc = ContractCalculations(
+            calc = ContractCalculations(
                 assignment_id=assignment_id,
-                total_salary=totals.get('total_salary', 0.0),
-                total_profit=totals.get('total_profit', 0.0),
-                total_drinks=totals.get('total_drinks', 0),
-                total_special_comm=totals.get('total_special_comm', 0.0),
-                days_worked=totals.get('days_worked', 0),
-                total_commission=total_commission,
+                total_salary=totals['total_salary'],
+                total_profit=totals['total_profit'],
+                total_drinks=totals['total_drinks'],
+                total_special_comm=totals['total_special_comm'],
+                days_worked=totals['days_worked'],
+                total_commission=totals['total_commission'],
                 last_updated=datetime.utcnow()
             )
-            db.session.add(new_calc)
+            db.session.add(calc)
+            calcs_dict[assignment_id] = calc
 
     try:
         db.session.commit()
@@ -273,7 +603,7 @@ def calculate_totals_with_aggregation(assignment_ids):
         current_app.logger.error(f"Error during aggregate batch save: {str(e)}")
         raise
 
-    return ContractCalculations.query.filter(ContractCalculations.assignment_id.in_(assignment_ids)).all()
+    return {assignment_id: calcs_dict[assignment_id] for assignment_id in totals_dict}
 
 
 def update_or_create_contract_calculations(assignment_id):
@@ -371,6 +701,7 @@ def update_or_create_contract_calculations(assignment_id):
         contract_calc.days_worked = days_worked
         contract_calc.total_drinks = total_drinks
         contract_calc.total_special_comm = total_special_comm
+        contract_calc.is_stale = False
         contract_calc.last_updated = datetime.utcnow()
     else:
         # Créer un nouveau calcul
@@ -426,26 +757,34 @@ def get_contract_summary(assignment_id):
     }
 
 
-def get_staff_performance_summary(staff_id, start_date=None, end_date=None):
+def get_staff_performance_summary(staff_id, start_date=None, end_date=None, staff=None):
     """
     Agrège les données de ContractCalculations et PerformanceRecord pour un staff donné
     et retourne un dictionnaire contenant les totaux et l'historique détaillé.
     
+    Le nombre de requêtes est fixe, quelle que soit la longueur de l'historique:
+    assignments (avec venue et calculs), records filtrés par date, règles de contrat (cache).
+    
     Args:
         staff_id (int): ID du staff profile
         start_date (date, optional): Date de début pour filtrer les données
         end_date (date, optional): Date de fin pour filtrer les données
+        staff (StaffProfile, optional): Profil déjà chargé par l'appelant (évite une requête)
         
     Returns:
-        dict: Dictionnaire contenant les totaux et l'historique détaillé
+        dict: Dictionnaire contenant les totaux, l'historique détaillé et les assignments chargés
     """
     # Vérifier que le staff existe
-    staff = StaffProfile.query.get(staff_id)
+    if staff is None:
+        staff = StaffProfile.query.get(staff_id)
     if not staff:
         raise ValueError(f"Staff avec l'ID {staff_id} n'existe pas")
     
-    # Récupérer tous les assignments du staff
-    assignments_query = Assignment.query.filter_by(staff_id=staff_id)
+    # REQUÊTE 1: tous les assignments du staff, avec venue et calculs de contrat
+    assignments_query = Assignment.query.filter_by(staff_id=staff_id).options(
+        joinedload(Assignment.venue),
+        joinedload(Assignment.contract_calculations)
+    )
     
     # Appliquer les filtres de date si fournis
     if start_date:
@@ -453,7 +792,21 @@ def get_staff_performance_summary(staff_id, start_date=None, end_date=None):
     if end_date:
         assignments_query = assignments_query.filter(Assignment.start_date <= end_date)
     
-    assignments = assignments_query.all()
+    assignments = assignments_query.order_by(Assignment.id).all()
+    
+    # REQUÊTE 2: tous les enregistrements de performance de ces assignments, filtrés par date
+    records_by_assignment = {}
+    if assignments:
+        performance_query = PerformanceRecord.query.filter(
+            PerformanceRecord.assignment_id.in_([assignment.id for assignment in assignments])
+        )
+        if start_date:
+            performance_query = performance_query.filter(PerformanceRecord.record_date >= start_date)
+        if end_date:
+            performance_query = performance_query.filter(PerformanceRecord.record_date <= end_date)
+        
+        for record in performance_query.order_by(PerformanceRecord.assignment_id, PerformanceRecord.record_date):
+            records_by_assignment.setdefault(record.assignment_id, []).append(record)
     
     # Initialiser les totaux globaux
     total_days_worked = 0
@@ -468,11 +821,8 @@ def get_staff_performance_summary(staff_id, start_date=None, end_date=None):
     
     # Traiter chaque assignment
     for assignment in assignments:
-        # Récupérer le contrat d'agence pour les règles de calcul
-        agency_contract = AgencyContract.query.filter_by(
-            name=assignment.contract_type,
-            agency_id=assignment.agency_id
-        ).first()
+        # Récupérer le contrat d'agence pour les règles de calcul (cache des règles compilées)
+        agency_contract = get_contract_rules(assignment.agency_id, assignment.contract_type)
         
         # Calculer le salaire de base par jour
         if agency_contract and agency_contract.days > 0:
@@ -482,19 +832,10 @@ def get_staff_performance_summary(staff_id, start_date=None, end_date=None):
             contract_days = {"1day": 1, "10days": 10, "1month": 30}.get(assignment.contract_type, 1)
             base_daily_salary = assignment.base_salary / contract_days if contract_days > 0 else assignment.base_salary
         
-        # Récupérer les enregistrements de performance pour cet assignment
-        performance_query = PerformanceRecord.query.filter_by(assignment_id=assignment.id)
-        
-        # Appliquer les filtres de date aux enregistrements
-        if start_date:
-            performance_query = performance_query.filter(PerformanceRecord.record_date >= start_date)
-        if end_date:
-            performance_query = performance_query.filter(PerformanceRecord.record_date <= end_date)
-        
-        performance_records = performance_query.order_by(PerformanceRecord.record_date).all()
+        venue_name = assignment.venue.name if assignment.venue else 'N/A'
         
         # Traiter chaque enregistrement de performance
-        for record in performance_records:
+        for record in records_by_assignment.get(assignment.id, []):
             # Calculer la pénalité de retard
             lateness_penalty = calculate_lateness_penalty(record, agency_contract) if agency_contract else 0.0
             
@@ -504,14 +845,9 @@ def get_staff_performance_summary(staff_id, start_date=None, end_date=None):
             # Calculer la commission quotidienne
             if agency_contract:
                 daily_commission = (record.drinks_sold or 0) * agency_contract.staff_commission
-                bar_revenue = ((record.drinks_sold or 0) * agency_contract.drink_price) + (record.special_commissions or 0)
             else:
                 # Fallback avec les valeurs par défaut
                 daily_commission = (record.drinks_sold or 0) * 100  # 100 THB par boisson
-                bar_revenue = ((record.drinks_sold or 0) * 120) + (record.special_commissions or 0)  # 120 THB par boisson
-            
-            # Calculer le profit quotidien
-            daily_profit = bar_revenue - daily_salary
             
             # Ajouter aux totaux
             total_salary_paid += daily_salary
@@ -526,7 +862,7 @@ def get_staff_performance_summary(staff_id, start_date=None, end_date=None):
             # Ajouter à l'historique détaillé
             detailed_history.append({
                 'assignment_id': assignment.id,
-                'venue_name': assignment.venue.name if assignment.venue else 'N/A',
+                'venue_name': venue_name,
                 'contract_role': assignment.contract_role,
                 'contract_type': assignment.contract_type,
                 'record_date': record.record_date.isoformat(),
@@ -542,10 +878,10 @@ def get_staff_performance_summary(staff_id, start_date=None, end_date=None):
                 'departure_time': record.departure_time.strftime('%H:%M') if record.departure_time else None
             })
     
-    # Récupérer les calculs de contrat agrégés (si disponibles)
+    # Calculs de contrat agrégés (si disponibles), déjà chargés avec les assignments
     contract_calculations = []
     for assignment in assignments:
-        calc = ContractCalculations.query.filter_by(assignment_id=assignment.id).first()
+        calc = assignment.contract_calculations
         if calc:
             contract_calculations.append({
                 'assignment_id': assignment.id,
@@ -582,6 +918,7 @@ def get_staff_performance_summary(staff_id, start_date=None, end_date=None):
         },
         'detailed_history': detailed_history,
         'contract_calculations': contract_calculations,
+        'assignments': assignments,
         'filter_period': {
             'start_date': start_date.isoformat() if start_date else None,
             'end_date': end_date.isoformat() if end_date else None
@@ -589,137 +926,96 @@ def get_staff_performance_summary(staff_id, start_date=None, end_date=None):
     }
 
 
-def recalculate_all_contracts():
+def recalculate_all_contracts(agency_ids=None):
     """
-    Recalcule tous les contrats existants.
+    Recalcule tous les contrats existants avec le moteur vectorisé
+    (un chargement, un upsert et un commit par agence).
     Utile pour les migrations ou corrections de données.
     
+    Args:
+        agency_ids (list, optional): Limiter le recalcul à ces agences
+    
     Returns:
         int: Nombre de contrats recalculés
     """
-    assignments = Assignment.query.all()
-    count = 0
+    from app.services.recalculation_engine import recalculate_agency_contracts
     
-    for assignment in assignments:
+    if agency_ids is None:
+        agency_ids = [row[0] for row in db.session.query(Assignment.agency_id).distinct().all()]
+    
+    count = 0
+    for agency_id in agency_ids:
         try:
-            update_or_create_contract_calculations(assignment.id)
-            count += 1
+            count += recalculate_agency_contracts(agency_id)['assignments']
         except Exception as e:
-            print(f"Erreur lors du recalcul du contrat {assignment.id}: {str(e)}")
+            print(f"Erreur lors du recalcul des contrats de l'agence {agency_id}: {str(e)}")
             continue
     
     return count
 
 
-def generate_performance_stats(assignments):
+def generate_performance_stats(assignments_query):
     """
-    Generates performance statistics based on filtered contracts.
-    Analyzes actual work history (PerformanceRecord) for each contract.
+    Generates performance statistics based on filtered contracts, with two grouped
+    SQL queries whatever the number of contracts: one per contract type (totals,
+    complete vs incomplete against AgencyContract.days) and one for unique staff.
+    ContractCalculations is the single source of truth: the routes refresh stale or
+    missing rows (refresh_stale_calculations) before calling this.
     
     Args:
-        assignments (list): List of Assignment objects with preloaded performance_records
+        assignments_query: Filtered Assignment query built by the route (eager loading
+            and ordering are ignored)
         
     Returns:
         dict: Dictionary containing performance statistics
     """
-    if not assignments:
-        return {
-            'total_profit': 0,
-            'total_days_worked': 0,
-            'unique_staff_count': 0,
-            'contract_breakdown': {
-                'by_type': {},
-                'by_status': {'complete': 0, 'incomplete': 0}
-            }
-        }
+    filtered_ids = assignments_query.order_by(None).with_entities(Assignment.id)
     
-    # Initialize counters
-    total_profit = 0
-    total_days_worked = 0
-    unique_staff_ids = set()
+    # Expected duration from AgencyContract (1 day if the contract no longer exists)
+    days_worked = func.coalesce(ContractCalculations.days_worked, 0)
+    is_complete = case((days_worked >= func.coalesce(AgencyContract.days, 1), 1), else_=0)
+    
+    by_type_rows = db.session.query(
+        Assignment.contract_type,
+        func.count(Assignment.id).label('count'),
+        func.sum(func.coalesce(ContractCalculations.total_profit, 0.0)).label('total_profit'),
+        func.sum(days_worked).label('total_days'),
+        func.sum(is_complete).label('complete')
+    ).outerjoin(
+        ContractCalculations, ContractCalculations.assignment_id == Assignment.id
+    ).outerjoin(
+        AgencyContract, and_(
+            AgencyContract.name == Assignment.contract_type,
+            AgencyContract.agency_id == Assignment.agency_id
+        )
+    ).filter(
+        Assignment.id.in_(filtered_ids)
+    ).group_by(
+        Assignment.contract_type
+    ).all()
+    
+    # Unique staff: staff profile, or archived name for deleted staff
+    staff_count, archived_count = db.session.query(
+        func.count(func.distinct(Assignment.staff_id)),
+        func.count(func.distinct(case((Assignment.staff_id.is_(None), Assignment.archived_staff_name))))
+    ).filter(Assignment.id.in_(filtered_ids)).one()
     
-    # Dictionaries for breakdown
     contract_type_counts = {}
     contract_status_counts = {'complete': 0, 'incomplete': 0}
-    
-    # Process each assignment
-    for assignment in assignments:
-        # Count unique staff
-        if assignment.staff:
-            unique_staff_ids.add(assignment.staff.id)
-        elif assignment.archived_staff_name:
-            # For deleted staff, use unique identifier based on name
-            unique_staff_ids.add(f"archived_{assignment.archived_staff_name}")
-        
-        # Get contract calculations (single source of truth)
-        contract_calc = ContractCalculations.query.filter_by(assignment_id=assignment.id).first()
-        
-        if contract_calc:
-            # Use pre-calculated data
-            total_profit += contract_calc.total_profit or 0
-            total_days_worked += contract_calc.days_worked or 0
-            
-            # Count by contract type
-            contract_type = assignment.contract_type
-            if contract_type not in contract_type_counts:
-                contract_type_counts[contract_type] = {
-                    'count': 0,
-                    'total_profit': 0,
-                    'total_days': 0
-                }
-            contract_type_counts[contract_type]['count'] += 1
-            contract_type_counts[contract_type]['total_profit'] += contract_calc.total_profit or 0
-            contract_type_counts[contract_type]['total_days'] += contract_calc.days_worked or 0
-            
-            # Determine if contract is complete or incomplete
-            # Get expected duration from AgencyContract
-            agency_contract = AgencyContract.query.filter_by(
-                name=assignment.contract_type,
-                agency_id=assignment.agency_id
-            ).first()
-            
-            expected_days = agency_contract.days if agency_contract else 1
-            actual_days = contract_calc.days_worked or 0
-            
-            if actual_days >= expected_days:
-                contract_status_counts['complete'] += 1
-            else:
-                contract_status_counts['incomplete'] += 1
-                
-        else:
-            # Fallback: calculate manually if no ContractCalculations
-            days_worked = len(assignment.performance_records)
-            total_days_worked += days_worked
-            
-            # Calculate profit manually
-            daily_profit = 0
-            for record in assignment.performance_records:
-                daily_profit += record.daily_profit or 0
-            total_profit += daily_profit
-            
-            # Count by contract type
-            contract_type = assignment.contract_type
-            if contract_type not in contract_type_counts:
-                contract_type_counts[contract_type] = {
-                    'count': 0,
-                    'total_profit': 0,
-                    'total_days': 0
-                }
-            contract_type_counts[contract_type]['count'] += 1
-            contract_type_counts[contract_type]['total_profit'] += daily_profit
-            contract_type_counts[contract_type]['total_days'] += days_worked
-            
-            # Determine status
-            agency_contract = AgencyContract.query.filter_by(
-                name=assignment.contract_type,
-                agency_id=assignment.agency_id
-            ).first()
-            
-            expected_days = agency_contract.days if agency_contract else 1
-            if days_worked >= expected_days:
-                contract_status_counts['complete'] += 1
-            else:
-                contract_status_counts['incomplete'] += 1
+    total_profit = 0
+    total_days_worked = 0
+    total_contracts = 0
+    for row in by_type_rows:
+        contract_type_counts[row.contract_type] = {
+            'count': row.count,
+            'total_profit': row.total_profit or 0,
+            'total_days': row.total_days or 0
+        }
+        total_profit += row.total_profit or 0
+        total_days_worked += row.total_days or 0
+        total_contracts += row.count
+        contract_status_counts['complete'] += row.complete or 0
+        contract_status_counts['incomplete'] += row.count - (row.complete or 0)
     
     # Build contract type breakdown
     contract_breakdown = {
@@ -730,7 +1026,216 @@ def generate_performance_stats(assignments):
     return {
         'total_profit': total_profit,
         'total_days_worked': total_days_worked,
-        'unique_staff_count': len(unique_staff_ids),
-        'total_contracts': len(assignments),
+        'unique_staff_count': staff_count + archived_count,
+        'total_contracts': total_contracts,
         'contract_breakdown': contract_breakdown
     }
+
+
+# Trend granularities accepted by get_performance_trend
+TREND_BUCKETS = ('day', 'week', 'month')
+
+
+def _date_bucket(column, bucket):
+    """SQL expression truncating a date column to the first day of its day, ISO week (Monday) or month."""
+    if bucket == 'day':
+        return column
+    
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return cast(func.date_trunc(bucket, column), Date)
+    if dialect == 'mysql':
+        if bucket == 'week':
+            return func.subdate(column, func.weekday(column))
+        return func.date_format(column, '%Y-%m-01')
+    # SQLite: 'weekday 0' moves to the next Sunday (or stays on Sunday), -6 days gives the Monday
+    if bucket == 'week':
+        return func.date(column, 'weekday 0', '-6 days')
+    return func.date(column, 'start of month')
+
+
+def get_performance_trend(assignments_query, bucket='day', start_date=None, end_date=None):
+    """
+    Profit, drinks, days worked and lateness of the filtered contracts, bucketed by
+    day, ISO week or month with one grouped SQL query. The result size depends on
+    the number of buckets, not on the number of performance records.
+    
+    Args:
+        assignments_query: Filtered Assignment query built by the route (eager loading
+            and ordering are ignored)
+        bucket (str): 'day', 'week' or 'month'
+        start_date (date, optional): First record date included
+        end_date (date, optional): Last record date included
+        
+    Returns:
+        list: One dict per non-empty bucket, in chronological order: period_start,
+              label, profit, drinks, days_worked, lateness_penalty, late_days
+    """
+    if bucket not in TREND_BUCKETS:
+        raise ValueError(f"Invalid bucket '{bucket}', expected one of {', '.join(TREND_BUCKETS)}")
+    
+    filtered_ids = assignments_query.order_by(None).with_entities(Assignment.id)
+    period = _date_bucket(PerformanceRecord.record_date, bucket).label('period')
+    
+    query = db.session.query(
+        period,
+        func.sum(func.coalesce(PerformanceRecord.daily_profit, 0.0)).label('profit'),
+        func.sum(func.coalesce(PerformanceRecord.drinks_sold, 0)).label('drinks'),
+        func.count(PerformanceRecord.id).label('days_worked'),
+        func.sum(func.coalesce(PerformanceRecord.lateness_penalty, 0.0)).label('lateness_penalty'),
+        func.sum(case((PerformanceRecord.lateness_penalty > 0, 1), else_=0)).label('late_days')
+    ).filter(PerformanceRecord.assignment_id.in_(filtered_ids))
+    if start_date:
+        query = query.filter(PerformanceRecord.record_date >= start_date)
+    if end_date:
+        query = query.filter(PerformanceRecord.record_date <= end_date)
+    
+    trend = []
+    for row in query.group_by(period).order_by(period).all():
+        # SQLite and MySQL return the truncated date as a string
+        period_start = row.period if isinstance(row.period, date) else date.fromisoformat(str(row.period)[:10])
+        if bucket == 'week':
+            iso_year, iso_week, _ = period_start.isocalendar()
+            label = f"{iso_year}-W{iso_week:02d}"
+        elif bucket == 'month':
+            label = period_start.strftime('%Y-%m')
+        else:
+            label = period_start.isoformat()
+        trend.append({
+            'period_start': period_start.isoformat(),
+            'label': label,
+            'profit': row.profit or 0,
+            'drinks': row.drinks or 0,
+            'days_worked': row.days_worked,
+            'lateness_penalty': row.lateness_penalty or 0,
+            'late_days': row.late_days or 0
+        })
+    return trend
+
+
+# Sort order of the payroll listing: active, then ended, then archived contracts
+PAYROLL_STATUS_ORDER = ('active', 'ended', 'archived')
+
+
+def payroll_status_order():
+    """SQL expression ranking Assignment.status like the payroll page (unknown statuses last)."""
+    return case(
+        *[(Assignment.status == status, rank) for rank, status in enumerate(PAYROLL_STATUS_ORDER, start=1)],
+        else_=len(PAYROLL_STATUS_ORDER) + 1
+    )
+
+
+def encode_payroll_cursor(row):
+    """Keyset cursor "status_order:start_date:id" of the last row of a page."""
+    return f"{row.status_order}:{row.start_date.isoformat()}:{row.id}"
+
+
+def decode_payroll_cursor(cursor):
+    """
+    Parses a cursor built by encode_payroll_cursor.
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    status_order, start_date, assignment_id = cursor.split(':')
+    return int(status_order), date.fromisoformat(start_date), int(assignment_id)
+
+
+def list_payroll_page(assignments_query, page_size, after=None):
+    """
+    One page of the payroll listing with keyset pagination on (status_order, start_date, id).
+    Only the columns the payroll template renders are selected, as plain rows (no ORM
+    entities, no performance records); the selection totals come from a separate
+    aggregate query. Missing or stale ContractCalculations of the selection are
+    recomputed first so that rows and totals agree.
+    
+    Args:
+        assignments_query: Filtered Assignment query built by the route (eager loading
+            and ordering are ignored)
+        page_size (int): Number of rows per page
+        after (str, optional): Cursor of the previous page (encode_payroll_cursor)
+        
+    Returns:
+        dict: 'rows' (Row objects), 'next_cursor' (None on the last page), 'total_count',
+              'total_profit', 'total_days_worked'
+        
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    page_start = time_module.time()
+    keyset = decode_payroll_cursor(after) if after else None
+    filtered_ids = assignments_query.order_by(None).with_entities(Assignment.id)
+    
+    # QUERY 1: contracts of the selection whose totals must be recomputed
+    stale_ids = [
+        assignment_id for (assignment_id,) in db.session.query(Assignment.id).outerjoin(
+            ContractCalculations, ContractCalculations.assignment_id == Assignment.id
+        ).filter(
+            Assignment.id.in_(filtered_ids),
+            or_(ContractCalculations.id.is_(None), ContractCalculations.is_stale.is_(True))
+        )
+    ]
+    if stale_ids:
+        calculate_totals_with_aggregation(stale_ids)
+    
+    # QUERY 2: the page, as column tuples
+    status_order = payroll_status_order()
+    page_query = db.session.query(
+        status_order.label('status_order'),
+        Assignment.id, Assignment.staff_id, Assignment.archived_staff_name, Assignment.archived_staff_photo,
+        Assignment.contract_role, Assignment.contract_type, Assignment.status,
+        Assignment.start_date, Assignment.end_date, Assignment.base_salary,
+        StaffProfile.nickname.label('staff_nickname'),
+        StaffProfile.photo_url.label('staff_photo_url'),
+        StaffProfile.photo_placeholder.label('staff_photo_placeholder'),
+        StaffProfile.staff_id.label('staff_code'),
+        Venue.name.label('venue_name'),
+        User.username.label('manager_username'),
+        func.coalesce(ContractCalculations.total_drinks, 0).label('total_drinks'),
+        func.coalesce(ContractCalculations.total_special_comm, 0.0).label('total_special_comm'),
+        func.coalesce(ContractCalculations.total_salary, 0.0).label('total_salary'),
+        func.coalesce(ContractCalculations.total_commission, 0.0).label('total_commission'),
+        func.coalesce(ContractCalculations.total_profit, 0.0).label('total_profit'),
+        func.coalesce(ContractCalculations.days_worked, 0).label('days_worked')
+    ).select_from(Assignment).outerjoin(
+        StaffProfile, StaffProfile.id == Assignment.staff_id
+    ).outerjoin(
+        Venue, Venue.id == Assignment.venue_id
+    ).outerjoin(
+        User, User.id == Assignment.managed_by_user_id
+    ).outerjoin(
+        ContractCalculations, ContractCalculations.assignment_id == Assignment.id
+    ).filter(Assignment.id.in_(filtered_ids))
+    
+    if keyset:
+        last_status, last_start, last_id = keyset
+        page_query = page_query.filter(or_(
+            status_order > last_status,
+            and_(status_order == last_status, Assignment.start_date > last_start),
+            and_(status_order == last_status, Assignment.start_date == last_start, Assignment.id > last_id)
+        ))
+    
+    rows = page_query.order_by(status_order, Assignment.start_date, Assignment.id).limit(page_size + 1).all()
+    next_cursor = encode_payroll_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    rows = rows[:page_size]
+    
+    # QUERY 3: totals of the whole selection
+    total_count, total_profit, total_days_worked = db.session.query(
+        func.count(Assignment.id),
+        func.sum(func.coalesce(ContractCalculations.total_profit, 0.0)),
+        func.sum(func.coalesce(ContractCalculations.days_worked, 0))
+    ).outerjoin(
+        ContractCalculations, ContractCalculations.assignment_id == Assignment.id
+    ).filter(Assignment.id.in_(filtered_ids)).one()
+    
+    current_app.logger.info(
+        f"[PERF] Payroll page: {len(rows)}/{total_count} rows ({len(stale_ids)} totals recomputed) "
+        f"in {time_module.time() - page_start:.3f}s"
+    )
+    return {
+        'rows': rows,
+        'next_cursor': next_cursor,
+        'total_count': total_count,
+        'total_profit': total_profit or 0,
+        'total_days_worked': total_days_worked or 0
+    }
@@ -0,0 +1,145 @@
+# app/services/pdf_cache.py
+
+import hashlib
+import os
+import threading
+import uuid
+
+from flask import current_app, send_file
+
+from app.services.pdf_renderer import stylesheet_version
+
+
+# Compteurs par processus, pour les logs [PERF]
+_cache_stats = {'hits': 0, 'misses': 0}
+_eviction_lock = threading.Lock()
+
+
+def pdf_cache_key(html, stylesheet=None, base_url=None):
+    """
+    Clé d'un PDF rendu: hash SHA-256 du HTML complet, de la feuille de style appliquée
+    et de l'URL de base des ressources. Le HTML contient déjà toutes les données du
+    document et l'empreinte du CSS suit ses modifications: tout changement change la clé.
+
+    Args:
+        html (str): Document HTML complet
+        stylesheet (str, optional): Nom de la feuille de style (pdf_renderer.PDF_STYLESHEETS)
+        base_url (str, optional): URL de base passée à WeasyPrint
+
+    Returns:
+        str: Empreinte hexadécimale, utilisée comme nom de fichier et ETag
+    """
+    digest = hashlib.sha256()
+    digest.update(stylesheet_version(stylesheet).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update((base_url or '').encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(html.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _cache_folder():
+    folder = current_app.config['PDF_CACHE_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _cache_path(key):
+    return os.path.join(_cache_folder(), f"{key}.pdf")
+
+
+def cached_pdf_path(key):
+    """
+    Chemin du PDF en cache pour cette clé, ou None. Un accès met à jour la date de
+    modification du fichier, qui sert d'ordre LRU pour l'éviction.
+    """
+    if not current_app.config.get('PDF_CACHE_MAX_BYTES'):
+        return None
+    path = _cache_path(key)
+    try:
+        os.utime(path)
+    except OSError:
+        _cache_stats['misses'] += 1
+        return None
+    _cache_stats['hits'] += 1
+    return path
+
+
+def store_pdf(key, pdf=None, source_path=None):
+    """
+    Enregistre un PDF dans le cache (écriture atomique), puis évince les fichiers les
+    moins récemment utilisés au-delà de PDF_CACHE_MAX_BYTES.
+
+    Args:
+        key (str): Clé de pdf_cache_key
+        pdf (bytes, optional): Contenu du PDF
+        source_path (str, optional): Ou fichier PDF déjà écrit à copier
+    """
+    max_bytes = current_app.config.get('PDF_CACHE_MAX_BYTES')
+    if not max_bytes:
+        return
+    if pdf is None:
+        with open(source_path, 'rb') as source:
+            pdf = source.read()
+    if len(pdf) > max_bytes:
+        return
+
+    path = _cache_path(key)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as cache_file:
+        cache_file.write(pdf)
+    os.replace(tmp_path, path)
+    _evict(max_bytes)
+
+
+def _evict(max_bytes):
+    with _eviction_lock:
+        folder = _cache_folder()
+        entries = []
+        for name in os.listdir(folder):
+            if not name.endswith('.pdf'):
+                continue
+            try:
+                stat = os.stat(os.path.join(folder, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, name in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        if evicted:
+            current_app.logger.info(f"[PERF] PDF cache: evicted {evicted} files, {total} bytes kept")
+
+
+def send_cached_pdf(path, key, filename, disposition='attachment'):
+    """
+    Sert un PDF du cache directement depuis le disque, avec l'ETag de sa clé:
+    If-None-Match correspondant -> 304 sans corps.
+
+    Args:
+        path (str): Fichier du cache
+        key (str): Clé du PDF (ETag fort)
+        filename (str): Nom de téléchargement
+        disposition (str): 'attachment' ou 'inline'
+
+    Returns:
+        Response: PDF ou 304
+    """
+    current_app.logger.info(
+        f"[PERF] PDF cache hit {filename}: hits={_cache_stats['hits']} misses={_cache_stats['misses']}"
+    )
+    response = send_file(path, mimetype='application/pdf', as_attachment=disposition == 'attachment',
+                         download_name=filename, etag=key, conditional=True, max_age=0)
+    # Le contenu dépend des droits de l'utilisateur: pas de cache partagé, revalidation à chaque fois
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,411 @@
+# app/services/pdf_queue.py
+
+import json
+import multiprocessing
+import os
+import threading
+import time as time_module
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from flask import current_app, request, jsonify, render_template, url_for, Response, stream_with_context
+from flask_login import current_user
+from sqlalchemy import func
+
+from app import db
+from app.models import BackgroundJob
+from app.services.background_jobs import enqueue_job, job_handler, job_params, update_job
+from app.services.pdf_cache import pdf_cache_key, cached_pdf_path, store_pdf, send_cached_pdf
+from app.services.pdf_renderer import preload, render_pdf
+
+
+# Type de BackgroundJob qui rend un PDF dans un processus de rendu
+PDF_RENDER_JOB = 'pdf_render'
+
+# Type de BackgroundJob qui suit la progression d'un export ZIP (rendu pendant la réponse)
+PDF_BATCH_JOB = 'pdf_batch'
+
+# Processus de rendu par application (app.extensions['pdf_renderers']), créés et préchauffés au premier job
+_pool_lock = threading.Lock()
+
+# Rendus faits directement dans la requête, par processus: nombre et secondes cumulées
+_inline_stats = {'count': 0, 'seconds': 0.0}
+
+
+def _warm_renderer():
+    """
+    Initialisation d'un processus de rendu: polices découvertes et feuilles de style
+    analysées (pdf_renderer.preload), puis un document minimal rendu pour charger WeasyPrint.
+    """
+    preload()
+    render_pdf('<p>warm-up</p>')
+
+
+def _ping():
+    return os.getpid()
+
+
+def _render_to_file(html_path, pdf_path, stylesheet, base_url):
+    """Tâche d'un processus de rendu: HTML du fichier de spool -> PDF sur disque. Retourne (taille, secondes)."""
+    start = time_module.time()
+    with open(html_path, encoding='utf-8') as html_file:
+        pdf = render_pdf(html_file.read(), stylesheet, base_url)
+    with open(pdf_path, 'wb') as pdf_file:
+        pdf_file.write(pdf)
+    return len(pdf), time_module.time() - start
+
+
+def _render_bytes(html, stylesheet, base_url):
+    """Tâche d'un processus de rendu: HTML -> octets du PDF."""
+    return render_pdf(html, stylesheet, base_url)
+
+
+def renderer_pool():
+    """
+    Pool de PDF_RENDER_WORKERS processus de rendu (None si 0: rendu dans le thread du job).
+    Les processus sont lancés en 'spawn' (le serveur web a des threads et des connexions
+    ouvertes) et préchauffés dès la création du pool.
+    """
+    workers = current_app.config.get('PDF_RENDER_WORKERS', 2)
+    if not workers:
+        return None
+    with _pool_lock:
+        pool = current_app.extensions.get('pdf_renderers')
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_warm_renderer)
+            for _ in range(workers):
+                pool.submit(_ping)
+            current_app.extensions['pdf_renderers'] = pool
+        return pool
+
+
+def _pdf_folder():
+    folder = current_app.config['PDF_JOB_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _purge_expired_files(folder):
+    """Supprime les PDF et fichiers de spool plus vieux que PDF_JOB_RETENTION secondes."""
+    limit = time_module.time() - current_app.config.get('PDF_JOB_RETENTION', 3600)
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            if os.path.getmtime(path) < limit:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def job_pdf_path(job):
+    """Chemin du PDF produit par un job PDF_RENDER_JOB."""
+    return os.path.join(current_app.config['PDF_JOB_FOLDER'], f"job_{job.id}.pdf")
+
+
+@job_handler(PDF_RENDER_JOB, queue='pdf', workers_setting='PDF_RENDER_WORKERS')
+def render_pdf_job(job):
+    """
+    Handler du job PDF_RENDER_JOB: confie le HTML mis en spool à un processus de rendu
+    et attend le PDF, écrit dans PDF_JOB_FOLDER.
+
+    Args:
+        job: BackgroundJob (params: html_path, stylesheet, base_url, filename, disposition, cache_key, user_id)
+
+    Returns:
+        dict: 'filename', 'size', 'render_seconds' et 'wait_seconds' (attente dans la file)
+    """
+    params = job_params(job)
+    wait_seconds = (job.started_at - job.created_at).total_seconds()
+    job.progress_total = 1
+    db.session.commit()
+
+    pdf_path = job_pdf_path(job)
+    try:
+        pool = renderer_pool()
+        if pool is None:
+            size, render_seconds = _render_to_file(params['html_path'], pdf_path, params.get('stylesheet'),
+                                                   params.get('base_url'))
+        else:
+            try:
+                size, render_seconds = pool.submit(
+                    _render_to_file, params['html_path'], pdf_path, params.get('stylesheet'), params.get('base_url')
+                ).result()
+            except BrokenProcessPool:
+                # Processus de rendu tué (mémoire, crash natif): le prochain job recrée le pool
+                with _pool_lock:
+                    if current_app.extensions.get('pdf_renderers') is pool:
+                        del current_app.extensions['pdf_renderers']
+                raise
+    finally:
+        try:
+            os.remove(params['html_path'])
+        except OSError:
+            pass
+
+    if params.get('cache_key'):
+        store_pdf(params['cache_key'], source_path=pdf_path)
+
+    job.progress_done = 1
+    current_app.logger.info(
+        f"[PERF] PDF job {job.id} ({params['filename']}): {size} bytes rendered in {render_seconds:.3f}s "
+        f"after {wait_seconds:.3f}s in queue"
+    )
+    return {'filename': params['filename'], 'size': size, 'render_seconds': render_seconds,
+            'wait_seconds': wait_seconds}
+
+
+def enqueue_pdf(html, filename, stylesheet=None, disposition='attachment', base_url=None, agency_id=None,
+                cache_key=None):
+    """
+    Met un document en file de rendu: le HTML est écrit dans un fichier de spool,
+    le BackgroundJob ne garde que son chemin.
+
+    Args:
+        html (str): Document HTML complet, déjà rendu par Jinja
+        filename (str): Nom du fichier proposé au téléchargement
+        stylesheet (str, optional): Feuille de style (pdf_renderer.PDF_STYLESHEETS)
+        disposition (str): 'attachment' ou 'inline'
+        base_url (str, optional): URL de base des ressources relatives
+        agency_id (int, optional): Agence du document
+        cache_key (str, optional): Clé sous laquelle mettre le PDF en cache une fois rendu
+
+    Returns:
+        BackgroundJob: Job créé
+    """
+    folder = _pdf_folder()
+    _purge_expired_files(folder)
+    html_path = os.path.join(folder, f"spool_{uuid.uuid4().hex}.html")
+    with open(html_path, 'w', encoding='utf-8') as html_file:
+        html_file.write(html)
+
+    return enqueue_job(PDF_RENDER_JOB, agency_id, {
+        'html_path': html_path,
+        'stylesheet': stylesheet,
+        'base_url': base_url,
+        'filename': filename,
+        'disposition': disposition,
+        'cache_key': cache_key,
+        'user_id': current_user.id if current_user.is_authenticated else None
+    })
+
+
+def pdf_response(html, filename, stylesheet=None, disposition='attachment', base_url=None, agency_id=None):
+    """
+    Réponse d'une route PDF. Un PDF déjà rendu pour ce HTML est servi depuis le cache
+    disque (ETag = clé du cache, 304 si le navigateur l'a déjà). Sinon, un petit document
+    (HTML d'au plus PDF_INLINE_MAX_BYTES octets) est rendu directement et mis en cache;
+    un gros document, ou ?async=1, passe par la file de rendu: réponse 202 avec l'ID du
+    job (JSON si demandé, sinon une page d'attente qui suit le statut puis lance le
+    téléchargement).
+
+    Args:
+        html (str): Document HTML complet
+        filename (str): Nom du fichier PDF
+        stylesheet (str, optional): Feuille de style (pdf_renderer.PDF_STYLESHEETS)
+        disposition (str): 'attachment' ou 'inline'
+        base_url (str, optional): URL de base des ressources relatives
+        agency_id (int, optional): Agence du document
+
+    Returns:
+        Response: PDF (200 ou 304), ou 202 avec le job
+    """
+    cache_key = pdf_cache_key(html, stylesheet, base_url)
+    cached_path = cached_pdf_path(cache_key)
+    if cached_path:
+        return send_cached_pdf(cached_path, cache_key, filename, disposition)
+
+    small = len(html.encode('utf-8')) <= current_app.config.get('PDF_INLINE_MAX_BYTES', 200 * 1024)
+    if small and request.args.get('async') != '1':
+        start = time_module.time()
+        pdf = render_pdf(html, stylesheet, base_url)
+        seconds = time_module.time() - start
+        _inline_stats['count'] += 1
+        _inline_stats['seconds'] += seconds
+        current_app.logger.info(f"[PERF] PDF {filename} rendered inline: {len(pdf)} bytes in {seconds:.3f}s")
+        store_pdf(cache_key, pdf)
+
+        response = Response(pdf, mimetype='application/pdf')
+        response.headers['Content-Disposition'] = f'{disposition}; filename="{filename}"'
+        response.headers['Content-Length'] = len(pdf)
+        response.set_etag(cache_key)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    job = enqueue_pdf(html, filename, stylesheet, disposition, base_url, agency_id, cache_key)
+    payload = {
+        'status': 'queued',
+        'job_id': job.id,
+        'status_url': url_for('main.pdf_job_status', job_id=job.id),
+        'download_url': url_for('main.pdf_job_download', job_id=job.id)
+    }
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(payload), 202
+    return render_template('pdf_job.html', filename=filename, **payload), 202
+
+
+def render_pdfs(documents, stylesheet=None, base_url=None):
+    """
+    Rend une suite de documents sur les processus de rendu et produit les PDF dans
+    l'ordre où ils sont terminés. Au plus deux documents par worker sont en cours à la
+    fois: les documents sont consommés (donc leur HTML rendu) au fur et à mesure, la
+    mémoire reste bornée quel que soit leur nombre. Les PDF déjà en cache ne sont pas rendus.
+
+    Args:
+        documents (iterable): Couples (nom du fichier, HTML), consommés à la demande
+        stylesheet (str, optional): Feuille de style commune des documents
+        base_url (str, optional): URL de base des ressources relatives
+
+    Yields:
+        tuple: (nom du fichier, octets du PDF)
+    """
+    pool = renderer_pool()
+    window = 2 * (current_app.config.get('PDF_RENDER_WORKERS', 2) if pool else 1)
+    documents = iter(documents)
+    pending = {}
+    exhausted = False
+
+    try:
+        while pending or not exhausted:
+            while not exhausted and len(pending) < window:
+                try:
+                    filename, html = next(documents)
+                except StopIteration:
+                    exhausted = True
+                    break
+                cache_key = pdf_cache_key(html, stylesheet, base_url)
+                cached_path = cached_pdf_path(cache_key)
+                if cached_path:
+                    with open(cached_path, 'rb') as cached_file:
+                        yield filename, cached_file.read()
+                elif pool is None:
+                    pdf = _render_bytes(html, stylesheet, base_url)
+                    store_pdf(cache_key, pdf)
+                    yield filename, pdf
+                else:
+                    pending[pool.submit(_render_bytes, html, stylesheet, base_url)] = (filename, cache_key)
+
+            if pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    filename, cache_key = pending.pop(future)
+                    pdf = future.result()
+                    store_pdf(cache_key, pdf)
+                    yield filename, pdf
+    finally:
+        # Export interrompu (client parti, erreur): les rendus pas encore commencés sont annulés
+        for future in pending:
+            future.cancel()
+
+
+class _ZipChunks:
+    """Sortie non positionnable de zipfile: les octets écrits sont repris après chaque fichier."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def pdf_zip_response(documents, zip_filename, total, stylesheet=None, base_url=None, agency_id=None):
+    """
+    Export ZIP de plusieurs PDF, envoyé en flux: chaque PDF est ajouté à l'archive dès
+    que son rendu est terminé (render_pdfs), les premiers octets partent avant la fin
+    des rendus. La progression est suivie par un BackgroundJob PDF_BATCH_JOB dont
+    l'URL de statut est donnée dans l'en-tête X-Progress-Url.
+
+    Args:
+        documents (iterable): Couples (nom du fichier dans l'archive, HTML), consommés à la demande
+        zip_filename (str): Nom de l'archive
+        total (int): Nombre de documents (progression)
+        stylesheet (str, optional): Feuille de style commune des documents
+        base_url (str, optional): URL de base des ressources relatives
+        agency_id (int, optional): Agence des documents
+
+    Returns:
+        Response: application/zip en flux
+    """
+    job = BackgroundJob(kind=PDF_BATCH_JOB, agency_id=agency_id, status='running', progress_done=0,
+                        progress_total=total, started_at=datetime.utcnow(),
+                        params=json.dumps({'filename': zip_filename, 'user_id': current_user.id}))
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.id
+
+    def generate():
+        start = time_module.time()
+        output = _ZipChunks()
+        done = 0
+        try:
+            # Les PDF sont déjà compressés: stockés tels quels dans l'archive
+            with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archive:
+                for filename, pdf in render_pdfs(documents, stylesheet, base_url):
+                    archive.writestr(filename, pdf)
+                    done += 1
+                    update_job(job_id, progress_done=done)
+                    yield output.pop()
+            yield output.pop()
+        except BaseException as e:
+            update_job(job_id, status='failed', error=str(e) or type(e).__name__, finished_at=datetime.utcnow())
+            raise
+
+        seconds = time_module.time() - start
+        update_job(job_id, status='done', finished_at=datetime.utcnow(),
+                   result=json.dumps({'filename': zip_filename, 'documents': done, 'seconds': seconds}))
+        current_app.logger.info(f"[PERF] PDF batch {zip_filename}: {done} documents zipped in {seconds:.3f}s")
+
+    response = Response(stream_with_context(generate()), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{zip_filename}"'
+    response.headers['X-Job-Id'] = str(job_id)
+    response.headers['X-Progress-Url'] = url_for('main.pdf_job_status', job_id=job_id)
+    return response
+
+
+def pdf_queue_stats(recent=50):
+    """
+    Profondeur de la file de rendu et temps des derniers rendus, pour les admins.
+
+    Args:
+        recent (int): Nombre de jobs terminés pris en compte pour les temps
+
+    Returns:
+        dict: Jobs par statut, workers, moyenne/maximum des temps de rendu et d'attente, rendus directs
+    """
+    counts = dict(
+        db.session.query(BackgroundJob.status, func.count(BackgroundJob.id))
+        .filter(BackgroundJob.kind == PDF_RENDER_JOB).group_by(BackgroundJob.status).all()
+    )
+    finished = BackgroundJob.query.filter_by(kind=PDF_RENDER_JOB, status='done') \
+        .order_by(BackgroundJob.finished_at.desc()).limit(recent).all()
+    results = [job.to_dict()['result'] for job in finished]
+    render_times = [result['render_seconds'] for result in results if result]
+    wait_times = [result['wait_seconds'] for result in results if result]
+
+    return {
+        'queued': counts.get('queued', 0),
+        'running': counts.get('running', 0),
+        'done': counts.get('done', 0),
+        'failed': counts.get('failed', 0),
+        'workers': current_app.config.get('PDF_RENDER_WORKERS', 2),
+        'pool_started': 'pdf_renderers' in current_app.extensions,
+        'recent_jobs': len(render_times),
+        'avg_render_seconds': sum(render_times) / len(render_times) if render_times else None,
+        'max_render_seconds': max(render_times) if render_times else None,
+        'avg_wait_seconds': sum(wait_times) / len(wait_times) if wait_times else None,
+        'inline_renders': _inline_stats['count'],
+        'avg_inline_seconds': _inline_stats['seconds'] / _inline_stats['count'] if _inline_stats['count'] else None
+    }
@@ -0,0 +1,89 @@
+# app/services/pdf_renderer.py
+
+import hashlib
+import os
+import threading
+
+from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
+
+
+# Feuilles de style des PDF (app/static/css/pdf), par nom de document
+PDF_STYLESHEETS = {
+    'payroll': 'payroll.css',
+    'assignment': 'assignment.css',
+    'profile': 'profile.css',
+    'dashboard': 'dashboard.css',
+}
+
+STYLESHEET_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'css', 'pdf')
+
+# État par processus: configuration des polices et feuilles de style déjà analysées,
+# partagées par tous les rendus (requêtes, threads des jobs, processus de rendu)
+_lock = threading.Lock()
+_font_config = None
+_stylesheets = {}
+_stylesheet_versions = {}
+
+
+def font_config():
+    """Configuration des polices du processus, créée au premier appel."""
+    global _font_config
+    with _lock:
+        if _font_config is None:
+            _font_config = FontConfiguration()
+        return _font_config
+
+
+def stylesheet(name):
+    """
+    Feuille de style analysée d'un document de PDF_STYLESHEETS, lue et analysée une
+    seule fois par processus.
+
+    Args:
+        name (str): Nom du document ('payroll', 'assignment', 'profile', 'dashboard')
+
+    Returns:
+        CSS: Feuille de style WeasyPrint
+    """
+    fonts = font_config()
+    with _lock:
+        if name not in _stylesheets:
+            path = os.path.join(STYLESHEET_FOLDER, PDF_STYLESHEETS[name])
+            _stylesheets[name] = CSS(filename=path, font_config=fonts)
+        return _stylesheets[name]
+
+
+def stylesheet_version(name):
+    """Empreinte du fichier CSS d'un document (clé du cache des PDF), '' sans feuille de style."""
+    if not name:
+        return ''
+    with _lock:
+        if name not in _stylesheet_versions:
+            with open(os.path.join(STYLESHEET_FOLDER, PDF_STYLESHEETS[name]), 'rb') as css_file:
+                _stylesheet_versions[name] = hashlib.sha256(css_file.read()).hexdigest()
+        return _stylesheet_versions[name]
+
+
+def preload():
+    """Charge les polices et analyse toutes les feuilles de style (démarrage d'un processus de rendu)."""
+    for name in PDF_STYLESHEETS:
+        stylesheet(name)
+        stylesheet_version(name)
+
+
+def render_pdf(html, stylesheet_name=None, base_url=None):
+    """
+    Rend un document HTML en PDF avec la configuration des polices et la feuille de
+    style partagées du processus.
+
+    Args:
+        html (str): Document HTML complet
+        stylesheet_name (str, optional): Nom du document dans PDF_STYLESHEETS
+        base_url (str, optional): URL de base des ressources relatives
+
+    Returns:
+        bytes: Contenu du PDF
+    """
+    stylesheets = [stylesheet(stylesheet_name)] if stylesheet_name else []
+    return HTML(string=html, base_url=base_url).write_pdf(stylesheets=stylesheets, font_config=font_config())
@@ -0,0 +1,571 @@
+# app/services/recalculation_engine.py
+
+import os
+import time as time_module
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+from sqlalchemy import update
+from flask import current_app
+
+from app import db
+from app.models import Assignment, PerformanceRecord, ContractCalculations, AgencyContract
+from app.services.background_jobs import enqueue_job, job_handler, job_params
+from app.services.contract_rules import NO_CONTRACT, compile_contract, daily_rule_values, late_minutes_between
+from app.services.db_utils import bulk_upsert
+
+
+# Colonnes de ContractCalculations réécrites par le moteur
+CALCULATION_COLUMNS = ['total_salary', 'total_commission', 'total_profit', 'days_worked',
+                       'total_drinks', 'total_special_comm', 'is_stale', 'last_updated']
+
+
+def build_rule_table(contracts):
+    """
+    Construit la table des règles de contrat sous forme de colonnes NumPy, à partir des
+    contrats compilés (même lecture de l'heure limite que la saisie unitaire).
+
+    Args:
+        contracts (list): Liste d'AgencyContract (ou objets ayant les mêmes attributs)
+
+    Returns:
+        dict: {'index': {nom_contrat: position}, 'days': array, 'cutoff_minutes': array, ...}
+    """
+    compiled = [compile_contract(contract) for contract in contracts]
+    return {
+        'index': {contract.name: position for position, contract in enumerate(compiled)},
+        'days': np.array([contract.days for contract in compiled], dtype=np.int64),
+        'cutoff_minutes': np.array([-1 if contract.cutoff_minutes is None else contract.cutoff_minutes
+                                    for contract in compiled], dtype=np.int64),
+        'first_minute_penalty': np.array([contract.first_minute_penalty for contract in compiled], dtype=np.float64),
+        'additional_minute_penalty': np.array([contract.additional_minute_penalty for contract in compiled], dtype=np.float64),
+        'drink_price': np.array([contract.drink_price for contract in compiled], dtype=np.float64),
+        'staff_commission': np.array([contract.staff_commission for contract in compiled], dtype=np.float64),
+    }
+
+
+def load_agency_columns(agency_id, assignment_ids=None, id_range=None, start_date=None, end_date=None):
+    """
+    Charge les assignments et les PerformanceRecord d'une agence en colonnes NumPy
+    (deux requêtes, aucun objet ORM matérialisé).
+
+    Args:
+        agency_id (int): ID de l'agence
+        assignment_ids (list, optional): Restreindre à ces assignments
+        id_range (tuple, optional): Restreindre aux IDs d'assignment (premier, dernier) inclus
+        start_date (date, optional): Ignorer les records antérieurs
+        end_date (date, optional): Ignorer les records postérieurs
+
+    Returns:
+        dict: Colonnes 'assignment_ids', 'contract_types', 'venue_ids', 'base_salary' (une entrée
+              par assignment) et 'record_ids', 'record_position', 'arrival_minutes', 'drinks',
+              'special_comm', 'bonus', 'malus' (une entrée par record)
+    """
+    assignments_query = db.session.query(
+        Assignment.id, Assignment.contract_type, Assignment.venue_id, Assignment.base_salary
+    ).filter(Assignment.agency_id == agency_id)
+    if assignment_ids is not None:
+        assignments_query = assignments_query.filter(Assignment.id.in_(assignment_ids))
+    if id_range is not None:
+        assignments_query = assignments_query.filter(Assignment.id.between(*id_range))
+    assignments = assignments_query.order_by(Assignment.id).all()
+
+    position_by_id = {row.id: position for position, row in enumerate(assignments)}
+
+    records_query = db.session.query(
+        PerformanceRecord.id,
+        PerformanceRecord.assignment_id,
+        PerformanceRecord.arrival_time,
+        PerformanceRecord.drinks_sold,
+        PerformanceRecord.special_commissions,
+        PerformanceRecord.bonus,
+        PerformanceRecord.malus
+    ).join(Assignment, Assignment.id == PerformanceRecord.assignment_id).filter(Assignment.agency_id == agency_id)
+    if assignment_ids is not None:
+        records_query = records_query.filter(PerformanceRecord.assignment_id.in_(assignment_ids))
+    if id_range is not None:
+        records_query = records_query.filter(PerformanceRecord.assignment_id.between(*id_range))
+    if start_date is not None:
+        records_query = records_query.filter(PerformanceRecord.record_date >= start_date)
+    if end_date is not None:
+        records_query = records_query.filter(PerformanceRecord.record_date <= end_date)
+    records = records_query.all()
+
+    count = len(records)
+    return {
+        'assignment_ids': np.array([row.id for row in assignments], dtype=np.int64),
+        'contract_types': [row.contract_type for row in assignments],
+        'venue_ids': [row.venue_id for row in assignments],
+        'base_salary': np.array([row.base_salary or 0.0 for row in assignments], dtype=np.float64),
+        'record_ids': np.fromiter((r.id for r in records), dtype=np.int64, count=count),
+        'record_position': np.fromiter((position_by_id[r.assignment_id] for r in records), dtype=np.int64, count=count),
+        'arrival_minutes': np.fromiter(
+            (r.arrival_time.hour * 60 + r.arrival_time.minute if r.arrival_time else -1 for r in records),
+            dtype=np.int64, count=count
+        ),
+        'drinks': np.fromiter((r.drinks_sold or 0 for r in records), dtype=np.int64, count=count),
+        'special_comm': np.fromiter((r.special_commissions or 0.0 for r in records), dtype=np.float64, count=count),
+        'bonus': np.fromiter((r.bonus or 0.0 for r in records), dtype=np.float64, count=count),
+        'malus': np.fromiter((r.malus or 0.0 for r in records), dtype=np.float64, count=count),
+    }
+
+
+def compute_daily_values(columns, rules):
+    """
+    Calcule en une passe vectorisée la pénalité de retard, le salaire, la commission
+    et le profit journaliers de chaque record, avec les règles de la saisie unitaire
+    (contract_rules.daily_rule_values) et les mêmes valeurs par défaut sans contrat
+    (NO_CONTRACT).
+
+    Args:
+        columns (dict): Résultat de load_agency_columns
+        rules (dict): Résultat de build_rule_table
+
+    Returns:
+        dict: Arrays 'lateness_penalty', 'daily_salary', 'daily_commission', 'daily_revenue',
+              'daily_profit' et 'has_contract' (le contrat de l'assignment existe)
+    """
+    # Contrat de chaque assignment (-1 si le contrat n'existe pas), puis de chaque record
+    assignment_rule = np.array(
+        [rules['index'].get(contract_type, -1) for contract_type in columns['contract_types']], dtype=np.int64
+    )
+    position = columns['record_position']
+    rule = assignment_rule[position]
+    has_contract = rule >= 0
+    safe_rule = np.where(has_contract, rule, 0)
+
+    def rule_column(name, default):
+        if not len(rules[name]):
+            return np.full(len(rule), default)
+        return np.where(has_contract, rules[name][safe_rule], default)
+
+    cutoff = rule_column('cutoff_minutes', -1 if NO_CONTRACT.cutoff_minutes is None else NO_CONTRACT.cutoff_minutes)
+    daily = daily_rule_values(
+        columns['base_salary'][position],
+        rule_column('days', NO_CONTRACT.days),
+        late_minutes_between(columns['arrival_minutes'], cutoff),
+        rule_column('first_minute_penalty', NO_CONTRACT.first_minute_penalty),
+        rule_column('additional_minute_penalty', NO_CONTRACT.additional_minute_penalty),
+        rule_column('drink_price', NO_CONTRACT.drink_price),
+        rule_column('staff_commission', NO_CONTRACT.staff_commission),
+        columns['drinks'], columns['special_comm'], columns['bonus'], columns['malus']
+    )
+    daily['has_contract'] = has_contract
+    return daily
+
+
+def aggregate_by_assignment(columns, daily):
+    """Somme les valeurs journalières par assignment (np.bincount, un total par assignment chargé)."""
+    position = columns['record_position']
+    size = len(columns['assignment_ids'])
+
+    def total(weights):
+        return np.bincount(position, weights=weights, minlength=size)
+
+    return {
+        'days_worked': np.bincount(position, minlength=size),
+        'total_drinks': total(columns['drinks']),
+        'total_special_comm': total(columns['special_comm']),
+        'total_salary': total(daily['daily_salary']),
+        # Comme performance_contribution et calculate_totals_with_aggregation: la commission des
+        # totaux n'est comptée que si le contrat existe (le profit journalier la déduit toujours)
+        'total_commission': total(np.where(daily['has_contract'], daily['daily_commission'], 0.0)),
+        'total_profit': total(daily['daily_profit']),
+    }
+
+
+def compute_contract_rows(agency_id, assignment_ids=None, id_range=None):
+    """
+    Calcule, sans rien écrire, les lignes ContractCalculations d'une agence
+    (ou d'une tranche d'IDs d'assignment).
+
+    Args:
+        agency_id (int): ID de l'agence
+        assignment_ids (list, optional): Restreindre à ces assignments
+        id_range (tuple, optional): Restreindre aux IDs d'assignment (premier, dernier) inclus
+
+    Returns:
+        tuple: (lignes prêtes pour bulk_upsert, nombre de records lus, secondes de chargement)
+    """
+    start = time_module.time()
+
+    contracts = AgencyContract.query.filter_by(agency_id=agency_id).all()
+    rules = build_rule_table(contracts)
+    columns = load_agency_columns(agency_id, assignment_ids, id_range)
+    loaded = time_module.time()
+
+    totals = aggregate_by_assignment(columns, compute_daily_values(columns, rules))
+    now = datetime.utcnow()
+    rows = [
+        {
+            'assignment_id': int(assignment_id),
+            'total_salary': float(totals['total_salary'][i]),
+            'total_commission': float(totals['total_commission'][i]),
+            'total_profit': float(totals['total_profit'][i]),
+            'days_worked': int(totals['days_worked'][i]),
+            'total_drinks': int(totals['total_drinks'][i]),
+            'total_special_comm': float(totals['total_special_comm'][i]),
+            'is_stale': False,
+            'last_updated': now,
+        }
+        for i, assignment_id in enumerate(columns['assignment_ids'])
+    ]
+    return rows, len(columns['record_position']), loaded - start
+
+
+def write_contract_rows(rows, commit=True):
+    """Écrit des lignes calculées par compute_contract_rows en un seul upsert groupé."""
+    try:
+        bulk_upsert(ContractCalculations, rows, ['assignment_id'], CALCULATION_COLUMNS)
+        if commit:
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def recalculate_agency_contracts(agency_id, assignment_ids=None, commit=True):
+    """
+    Recalcule tous les ContractCalculations d'une agence en bloc: chargement en colonnes,
+    calcul vectorisé, puis un seul upsert groupé et un seul commit.
+
+    Args:
+        agency_id (int): ID de l'agence
+        assignment_ids (list, optional): Restreindre à ces assignments
+        commit (bool): Valider la transaction à la fin
+
+    Returns:
+        dict: Rapport (nombre d'assignments et de records, temps de chaque étape en secondes)
+    """
+    start = time_module.time()
+    rows, record_count, load_seconds = compute_contract_rows(agency_id, assignment_ids)
+    computed = time_module.time()
+
+    write_contract_rows(rows, commit)
+    written = time_module.time()
+
+    report = {
+        'agency_id': agency_id,
+        'assignments': len(rows),
+        'records': record_count,
+        'load_seconds': load_seconds,
+        'compute_seconds': computed - start - load_seconds,
+        'write_seconds': written - computed,
+        'total_seconds': written - start,
+    }
+    current_app.logger.info(
+        f"[PERF] Bulk recalculation agency {agency_id}: {report['assignments']} assignments, "
+        f"{report['records']} records in {report['total_seconds']:.3f}s "
+        f"(load {report['load_seconds']:.3f}s, compute {report['compute_seconds']:.3f}s, write {report['write_seconds']:.3f}s)"
+    )
+    return report
+
+
+def partition_assignments(agency_ids=None, chunk_size=2000):
+    """
+    Découpe les assignments en tranches (agency_id, premier ID, dernier ID) d'au plus
+    chunk_size assignments, jamais à cheval sur deux agences.
+
+    Args:
+        agency_ids (list, optional): Limiter aux assignments de ces agences
+        chunk_size (int): Nombre maximum d'assignments par tranche
+
+    Returns:
+        list: Liste de tuples (agency_id, premier ID, dernier ID)
+    """
+    query = db.session.query(Assignment.agency_id, Assignment.id)
+    if agency_ids:
+        query = query.filter(Assignment.agency_id.in_(agency_ids))
+
+    ids_by_agency = {}
+    for agency_id, assignment_id in query.order_by(Assignment.agency_id, Assignment.id):
+        ids_by_agency.setdefault(agency_id, []).append(assignment_id)
+
+    partitions = []
+    for agency_id, ids in ids_by_agency.items():
+        for offset in range(0, len(ids), chunk_size):
+            chunk = ids[offset:offset + chunk_size]
+            partitions.append((agency_id, chunk[0], chunk[-1]))
+    return partitions
+
+
+# Application Flask propre à chaque processus worker (donc son propre engine et ses connexions)
+_worker_app = None
+
+
+def _init_worker():
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app()
+
+
+def _recalculate_partition(partition, write):
+    """
+    Tâche exécutée dans un worker: calcule une tranche et l'écrit (write=True) ou
+    renvoie les lignes au processus parent, seul écrivain sur SQLite.
+    """
+    agency_id, first_id, last_id = partition
+    with _worker_app.app_context():
+        rows, record_count, _ = compute_contract_rows(agency_id, id_range=(first_id, last_id))
+        if write:
+            write_contract_rows(rows)
+        db.session.remove()
+    return {
+        'partition': partition,
+        'assignments': len(rows),
+        'records': record_count,
+        'rows': None if write else rows,
+    }
+
+
+def recalculate_parallel(agency_ids=None, workers=None, chunk_size=2000):
+    """
+    Recalcule les ContractCalculations en parallèle: les tranches (agence, plage d'IDs)
+    sont réparties sur un ProcessPoolExecutor. Sur SQLite (un seul écrivain possible),
+    les workers ne font que le calcul et le processus parent écrit chaque tranche.
+
+    Args:
+        agency_ids (list, optional): Limiter le recalcul à ces agences
+        workers (int, optional): Nombre de processus (défaut: nombre de cœurs)
+        chunk_size (int): Nombre maximum d'assignments par tranche
+
+    Returns:
+        dict: Rapport (tranches, workers, assignments, records, secondes et débits par seconde)
+    """
+    start = time_module.time()
+    partitions = partition_assignments(agency_ids, chunk_size)
+    serialized_writer = db.engine.dialect.name == 'sqlite'
+    workers = max(1, min(workers or os.cpu_count() or 1, len(partitions) or 1))
+    if db.engine.url.database in (None, '', ':memory:'):
+        # Une base SQLite en mémoire n'est pas visible depuis les autres processus
+        workers = 1
+
+    total_assignments = total_records = 0
+    if workers == 1:
+        # Pas de parallélisme utile (ou base en mémoire): tout dans le processus courant
+        for agency_id, first_id, last_id in partitions:
+            rows, record_count, _ = compute_contract_rows(agency_id, id_range=(first_id, last_id))
+            write_contract_rows(rows)
+            total_assignments += len(rows)
+            total_records += record_count
+    else:
+        # Ne pas partager les connexions du parent avec les processus forkés
+        db.session.remove()
+        db.engine.dispose()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = [pool.submit(_recalculate_partition, partition, not serialized_writer) for partition in partitions]
+            for future in as_completed(futures):
+                result = future.result()
+                if result['rows'] is not None:
+                    write_contract_rows(result['rows'])
+                total_assignments += result['assignments']
+                total_records += result['records']
+
+    seconds = time_module.time() - start
+    report = {
+        'partitions': len(partitions),
+        'workers': workers,
+        'serialized_writer': serialized_writer,
+        'assignments': total_assignments,
+        'records': total_records,
+        'seconds': seconds,
+        'assignments_per_second': total_assignments / seconds if seconds > 0 else 0.0,
+        'records_per_second': total_records / seconds if seconds > 0 else 0.0,
+    }
+    current_app.logger.info(
+        f"[PERF] Parallel recalculation: {total_assignments} assignments, {total_records} records, "
+        f"{len(partitions)} partitions on {workers} workers in {seconds:.3f}s "
+        f"({report['assignments_per_second']:.0f} assignments/s, {report['records_per_second']:.0f} records/s)"
+    )
+    return report
+
+
+# Champs d'AgencyContract qu'une simulation peut modifier
+SIMULATION_RULE_FIELDS = ('days', 'late_cutoff_time', 'first_minute_penalty', 'additional_minute_penalty',
+                          'drink_price', 'staff_commission')
+
+# Totaux comparés par la simulation (clé du rapport -> valeur journalière de compute_daily_values)
+SIMULATION_TOTALS = {'salary': 'daily_salary', 'commission': 'daily_commission',
+                     'lateness_penalty': 'lateness_penalty', 'revenue': 'daily_revenue', 'profit': 'daily_profit'}
+
+
+def _grouped_totals(record_groups, group_count, current, proposed):
+    """Somme les valeurs actuelles et proposées par groupe (np.bincount), avec l'écart."""
+    records = np.bincount(record_groups, minlength=group_count)
+    totals = [{'records': int(records[group])} for group in range(group_count)]
+    for name, column in SIMULATION_TOTALS.items():
+        before = np.bincount(record_groups, weights=current[column], minlength=group_count)
+        after = np.bincount(record_groups, weights=proposed[column], minlength=group_count)
+        for group in range(group_count):
+            totals[group][name] = {'current': float(before[group]), 'proposed': float(after[group]),
+                                   'delta': float(after[group] - before[group])}
+    return totals
+
+
+def simulate_contract_rules(agency_id, proposed_rules, start_date=None, end_date=None):
+    """
+    Reprix de l'historique d'une agence avec des règles de contrat hypothétiques, sans
+    rien écrire: les records sont chargés une fois en colonnes, puis calculés deux fois
+    en passe vectorisée (règles actuelles et proposées).
+
+    Args:
+        agency_id (int): ID de l'agence
+        proposed_rules (dict): {nom du contrat: {champ de SIMULATION_RULE_FIELDS: valeur}},
+            les champs absents gardent leur valeur actuelle
+        start_date (date, optional): Premier jour d'historique inclus
+        end_date (date, optional): Dernier jour d'historique inclus
+
+    Returns:
+        dict: 'records', 'seconds', 'totals', 'by_contract_type' et 'by_venue' (listes de
+              {contract_type ou venue_id, records, salary, commission, lateness_penalty,
+              revenue, profit}, chaque total sous la forme {current, proposed, delta})
+
+    Raises:
+        ValueError: Si un contrat proposé n'existe pas dans l'agence
+    """
+    start = time_module.time()
+
+    contracts = AgencyContract.query.filter_by(agency_id=agency_id).order_by(AgencyContract.id).all()
+    unknown = set(proposed_rules) - {contract.name for contract in contracts}
+    if unknown:
+        raise ValueError(f"Unknown contract(s): {', '.join(sorted(unknown))}")
+
+    proposed_contracts = [
+        SimpleNamespace(id=contract.id, name=contract.name, agency_id=contract.agency_id, **{
+            field: proposed_rules.get(contract.name, {}).get(field, getattr(contract, field))
+            for field in SIMULATION_RULE_FIELDS
+        })
+        for contract in contracts
+    ]
+
+    columns = load_agency_columns(agency_id, start_date=start_date, end_date=end_date)
+    current = compute_daily_values(columns, build_rule_table(contracts))
+    proposed = compute_daily_values(columns, build_rule_table(proposed_contracts))
+    position = columns['record_position']
+
+    report = {'records': len(position)}
+    for report_key, group_key, values in (('by_contract_type', 'contract_type', columns['contract_types']),
+                                          ('by_venue', 'venue_id', columns['venue_ids'])):
+        # Groupe de chaque assignment, puis de chaque record
+        group_index = {}
+        assignment_groups = np.array([group_index.setdefault(value, len(group_index)) for value in values],
+                                     dtype=np.int64)
+        record_groups = assignment_groups[position]
+        totals = _grouped_totals(record_groups, len(group_index), current, proposed)
+        report[report_key] = [
+            dict(totals[group], **{group_key: value})
+            for value, group in group_index.items() if totals[group]['records']
+        ]
+
+    report['totals'] = _grouped_totals(np.zeros(len(position), dtype=np.int64), 1, current, proposed)[0]
+    report['seconds'] = time_module.time() - start
+    current_app.logger.info(
+        f"[PERF] Contract rules simulation agency {agency_id}: {report['records']} records repriced "
+        f"in {report['seconds']:.3f}s"
+    )
+    return report
+
+
+# Type de BackgroundJob qui re-dérive les valeurs journalières après une modification de contrat
+CONTRACT_REDERIVATION_JOB = 'contract_rederivation'
+
+
+def enqueue_contract_rederivation(agency_id, contract_types, rederive_records=True):
+    """
+    Planifie en arrière-plan le recalcul des records et des totaux des contrats modifiés.
+
+    Args:
+        agency_id (int): ID de l'agence
+        contract_types (iterable): Noms de contrat (Assignment.contract_type) concernés
+        rederive_records (bool): Recalculer lateness_penalty, daily_salary et daily_profit des
+            records (False après une suppression de contrat: seuls les totaux sont rafraîchis).
+            Les noms qui ne correspondent plus à un contrat (ancien nom d'un contrat renommé)
+            n'ont jamais leurs records réécrits, seulement leurs totaux
+
+    Returns:
+        BackgroundJob: Job créé
+    """
+    return enqueue_job(CONTRACT_REDERIVATION_JOB, agency_id, {
+        'contract_types': sorted(set(contract_types)),
+        'rederive_records': rederive_records
+    })
+
+
+@job_handler(CONTRACT_REDERIVATION_JOB)
+def rederive_contract_records(job):
+    """
+    Handler du job CONTRACT_REDERIVATION_JOB: par tranches d'assignments, recalcul vectorisé
+    des valeurs journalières avec les règles actuelles, UPDATE groupé des records par clé
+    primaire, upsert des ContractCalculations (sommes des records enregistrés pour les noms
+    sans contrat), commit et progression; puis reconstruction
+    des rollups de l'agence et invalidation du cache de pages.
+
+    Args:
+        job: BackgroundJob (params: contract_types, rederive_records)
+
+    Returns:
+        dict: 'assignments', 'records' (records réécrits) et 'seconds'
+    """
+    from app.services.payroll_service import calculate_totals_with_aggregation
+    from app.services.response_cache import bump_data_version
+    from app.services.rollup_service import rebuild_daily_rollups
+
+    start = time_module.time()
+    params = job_params(job)
+    agency_id = job.agency_id
+    chunk_size = current_app.config.get('REDERIVATION_CHUNK_SIZE', 200)
+
+    contract_types = dict(db.session.query(Assignment.id, Assignment.contract_type).filter(
+        Assignment.agency_id == agency_id,
+        Assignment.contract_type.in_(params['contract_types'])
+    ))
+    assignment_ids = sorted(contract_types)
+    job.progress_total = len(assignment_ids)
+    db.session.commit()
+
+    rules = build_rule_table(AgencyContract.query.filter_by(agency_id=agency_id).all())
+    records_updated = 0
+    for offset in range(0, len(assignment_ids), chunk_size):
+        chunk = assignment_ids[offset:offset + chunk_size]
+        # Seuls les records des contrats qui existent encore sont réécrits: après un renommage
+        # ou une suppression, les assignments de l'ancien nom gardent leurs valeurs journalières
+        # (les reprendre avec NO_CONTRACT remplacerait le salaire du jour par le salaire de base)
+        rederive_ids = [assignment_id for assignment_id in chunk
+                        if contract_types[assignment_id] in rules['index']] \
+            if params.get('rederive_records', True) else []
+        if rederive_ids:
+            columns = load_agency_columns(agency_id, assignment_ids=rederive_ids)
+            daily = compute_daily_values(columns, rules)
+            rows = [
+                {'id': int(record_id), 'lateness_penalty': float(penalty),
+                 'daily_salary': float(salary), 'daily_profit': float(profit)}
+                for record_id, penalty, salary, profit in zip(
+                    columns['record_ids'], daily['lateness_penalty'], daily['daily_salary'], daily['daily_profit']
+                )
+            ]
+            if rows:
+                db.session.execute(update(PerformanceRecord), rows)
+            records_updated += len(rows)
+
+        # Totaux recalculés avec les règles pour les records réécrits, sommés depuis les
+        # valeurs journalières enregistrées pour les autres
+        if rederive_ids:
+            contract_rows, _, _ = compute_contract_rows(agency_id, rederive_ids)
+            write_contract_rows(contract_rows, commit=False)
+        kept_ids = sorted(set(chunk) - set(rederive_ids))
+        if kept_ids:
+            calculate_totals_with_aggregation(kept_ids)
+        job.progress_done = offset + len(chunk)
+        db.session.commit()
+
+    rebuild_daily_rollups(agency_id)
+    bump_data_version(agency_id)
+
+    seconds = time_module.time() - start
+    current_app.logger.info(
+        f"[PERF] Contract re-derivation agency {agency_id} ({', '.join(params['contract_types'])}): "
+        f"{len(assignment_ids)} assignments, {records_updated} records in {seconds:.3f}s"
+    )
+    return {'assignments': len(assignment_ids), 'records': records_updated, 'seconds': seconds}
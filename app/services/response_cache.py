@@ -0,0 +1,209 @@
+# app/services/response_cache.py
+
+import threading
+import time as time_module
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, request, session, g, make_response
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+from sqlalchemy import insert, update
+
+from app.models import db, DataVersion
+
+
+# Remplace le jeton CSRF dans les pages en cache: il est propre à chaque session
+CSRF_PLACEHOLDER = '\x00csrf-token\x00'
+
+# Ligne de DataVersion qui invalide toutes les agences
+ALL_AGENCIES = 0
+
+# Cache par processus (app.extensions['response_cache']):
+# 'entries' = clé -> (expire à, corps HTML, statut, content-type), dans l'ordre LRU.
+# Les versions des données sont en base (DataVersion), partagées par tous les processus:
+# une écriture dans un worker, un job ou une commande CLI invalide les pages de tous les autres.
+_cache_lock = threading.Lock()
+
+
+def _response_cache():
+    return current_app.extensions.setdefault('response_cache', {
+        'entries': OrderedDict(), 'hits': 0, 'misses': 0
+    })
+
+
+def _request_agency_id():
+    """Agence courante de la requête (session pour webdev), None si anonyme ou sans agence."""
+    if not current_user.is_authenticated:
+        return None
+    if current_user.role == 'webdev':
+        return session.get('current_agency_id', current_user.agency_id)
+    return current_user.agency_id
+
+
+def data_version(agency_id):
+    """
+    Version des données d'une agence, incluse dans les clés du cache (une requête
+    sur la clé primaire de DataVersion).
+
+    Args:
+        agency_id (int): ID de l'agence
+
+    Returns:
+        tuple: (version de toutes les agences, version de l'agence)
+    """
+    versions = dict(db.session.query(DataVersion.agency_id, DataVersion.version)
+                    .filter(DataVersion.agency_id.in_((ALL_AGENCIES, agency_id))))
+    return versions.get(ALL_AGENCIES, 0), versions.get(agency_id, 0)
+
+
+def _increment_version(agency_id):
+    """Incrémente la version d'une agence en une instruction atomique (ligne créée au besoin)."""
+    table = DataVersion.__table__
+    now = datetime.utcnow()
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql', 'mysql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        elif dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(table).values(agency_id=agency_id, version=1, updated_at=now)
+        changes = {'version': table.c.version + 1, 'updated_at': now}
+        if dialect == 'mysql':
+            stmt = stmt.on_duplicate_key_update(changes)
+        else:
+            stmt = stmt.on_conflict_do_update(index_elements=['agency_id'], set_=changes)
+        db.session.execute(stmt)
+        return
+
+    # Fallback générique: UPDATE, puis INSERT si l'agence n'a pas encore de ligne
+    result = db.session.execute(
+        update(table).where(table.c.agency_id == agency_id).values(version=table.c.version + 1, updated_at=now)
+    )
+    if not result.rowcount:
+        db.session.execute(insert(table).values(agency_id=agency_id, version=1, updated_at=now))
+
+
+def bump_data_version(agency_id=None, commit=True):
+    """
+    Invalide les pages en cache d'une agence (ou de toutes les agences) dans tous les
+    processus en changeant sa version de données en base; les entrées locales de
+    l'ancienne version sont libérées, celles des autres processus ne sont plus lues.
+
+    Args:
+        agency_id (int, optional): ID de l'agence, None pour toutes les agences
+        commit (bool): Valider la transaction (False pour incrémenter dans la transaction
+            d'écriture de l'appelant, qui la valide)
+    """
+    _increment_version(ALL_AGENCIES if agency_id is None else agency_id)
+    if commit:
+        db.session.commit()
+
+    cache = _response_cache()
+    with _cache_lock:
+        if agency_id is None:
+            cache['entries'].clear()
+            return
+        for key in [key for key in cache['entries'] if key[1] == agency_id]:
+            del cache['entries'][key]
+
+
+def normalized_args(args):
+    """Arguments de requête triés, sans les valeurs vides (?venue_id=&status=all == ?status=all)."""
+    return tuple(sorted((name, value) for name in args for value in args.getlist(name) if value != ''))
+
+
+def cached_page(view):
+    """
+    Met en cache la page HTML rendue par une vue GET, par agence, arguments normalisés
+    et version des données de l'agence (plus l'utilisateur, affiché dans l'en-tête).
+    Éviction LRU au-delà de RESPONSE_CACHE_MAX_ENTRIES, expiration après
+    RESPONSE_CACHE_TTL secondes (filet de sécurité pour les écritures faites hors de l'application).
+    Une page dont la vue a émis un message flash (filtre invalide) n'est pas mise en cache.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        max_entries = current_app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 256)
+        agency_id = _request_agency_id()
+        if not max_entries or agency_id is None or request.method != 'GET':
+            return view(*args, **kwargs)
+
+        cache = _response_cache()
+        key = (request.endpoint, agency_id, current_user.id, normalized_args(request.args),
+               tuple(sorted(kwargs.items())), data_version(agency_id))
+        now = time_module.monotonic()
+
+        with _cache_lock:
+            entry = cache['entries'].get(key)
+            if entry and entry[0] > now:
+                cache['entries'].move_to_end(key)
+                cache['hits'] += 1
+            else:
+                if entry:
+                    del cache['entries'][key]
+                entry = None
+                cache['misses'] += 1
+            hits, misses = cache['hits'], cache['misses']
+
+        if entry:
+            current_app.logger.info(
+                f"[PERF] Response cache hit {request.endpoint} (agency {agency_id}): hits={hits} misses={misses}"
+            )
+            response = make_response(entry[1].replace(CSRF_PLACEHOLDER, generate_csrf()), entry[2])
+            response.content_type = entry[3]
+            return response
+
+        start = time_module.time()
+        flashes_before = len(session.get('_flashes', []))
+        response = make_response(view(*args, **kwargs))
+        current_app.logger.info(
+            f"[PERF] Response cache miss {request.endpoint} (agency {agency_id}): rendered in "
+            f"{time_module.time() - start:.3f}s, hits={hits} misses={misses}"
+        )
+
+        if (response.status_code != 200 or response.mimetype != 'text/html'
+                or len(session.get('_flashes', [])) != flashes_before):
+            return response
+
+        body = response.get_data(as_text=True)
+        token = g.get('csrf_token')
+        if token:
+            body = body.replace(token, CSRF_PLACEHOLDER)
+        ttl = current_app.config.get('RESPONSE_CACHE_TTL', 120)
+        with _cache_lock:
+            cache['entries'][key] = (now + ttl, body, response.status_code, response.content_type)
+            cache['entries'].move_to_end(key)
+            while len(cache['entries']) > max_entries:
+                cache['entries'].popitem(last=False)
+        return response
+
+    return wrapper
+
+
+def read_only(view):
+    """Marque une vue POST qui n'écrit rien (prévisualisation, simulation): pas d'invalidation du cache."""
+    view.read_only = True
+    return view
+
+
+def register_data_version_hook(blueprint, all_agencies=False):
+    """
+    Change la version des données de l'agence courante après chaque écriture réussie
+    (POST, PUT, PATCH, DELETE) sur un blueprint, sauf pour les vues marquées read_only.
+
+    Args:
+        blueprint: Blueprint dont les écritures invalident le cache
+        all_agencies (bool): Invalider toutes les agences (écritures d'administration)
+    """
+    @blueprint.after_request
+    def _bump_data_version(response):
+        if (request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and response.status_code < 400
+                and current_user.is_authenticated
+                and not getattr(current_app.view_functions.get(request.endpoint), 'read_only', False)):
+            # Sans agence courante (webdev), toutes les agences sont invalidées
+            bump_data_version(None if all_agencies else _request_agency_id())
+        return response
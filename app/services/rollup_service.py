@@ -0,0 +1,245 @@
+# app/services/rollup_service.py
+
+import time as time_module
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, tuple_
+
+from app import db
+from app.models import Assignment, PerformanceRecord, DailyRollup
+from app.services.contract_rules import compile_contract, get_agency_rules
+from app.services.db_utils import bulk_upsert
+
+
+# Totaux de DailyRollup alimentés par chaque PerformanceRecord
+ROLLUP_FIELDS = ('drinks', 'special_commissions', 'salary', 'commission', 'profit',
+                 'headcount', 'lateness_minutes')
+
+# venue_id stocké pour les assignments sans venue
+NO_VENUE = 0
+
+
+def rollup_key(venue_id, record_date):
+    """Clé (venue_id, record_date) d'une ligne DailyRollup (venue absente -> NO_VENUE)."""
+    return (venue_id or NO_VENUE, record_date)
+
+
+def rollup_contribution(record, agency_contract):
+    """
+    Calcule la contribution d'un PerformanceRecord à la ligne DailyRollup de son jour.
+    Mêmes règles que performance_contribution (commission nulle sans contrat).
+
+    Args:
+        record: PerformanceRecord ou ligne ayant les mêmes colonnes (ou None)
+        agency_contract: AgencyContract ou CompiledContract de l'assignment (ou None)
+
+    Returns:
+        dict: {champ: valeur} pour chaque champ de ROLLUP_FIELDS
+    """
+    if record is None:
+        return dict.fromkeys(ROLLUP_FIELDS, 0)
+
+    drinks = record.drinks_sold or 0
+    commission = 0.0
+    lateness_minutes = 0
+    if agency_contract:
+        if drinks > 0:
+            commission = drinks * agency_contract.staff_commission
+        lateness_minutes = compile_contract(agency_contract).late_minutes(record.arrival_time)
+
+    return {
+        'drinks': drinks,
+        'special_commissions': record.special_commissions or 0.0,
+        'salary': record.daily_salary or 0.0,
+        'commission': commission,
+        'profit': record.daily_profit or 0.0,
+        'headcount': 1,
+        'lateness_minutes': lateness_minutes
+    }
+
+
+def apply_rollup_deltas(agency_id, deltas):
+    """
+    Répercute des modifications de PerformanceRecord sur DailyRollup, dans la
+    transaction en cours (pas de commit ici). Comme apply_performance_delta, la mise
+    à jour est faite en SQL (colonne = colonne + delta); une ligne absente est
+    recalculée à partir des records du jour.
+
+    Args:
+        agency_id (int): ID de l'agence
+        deltas (dict): {(venue_id, record_date): (contribution avant, contribution après)}
+    """
+    # Les records modifiés doivent être visibles par les requêtes qui suivent
+    db.session.flush()
+
+    now = datetime.utcnow()
+    missing = []
+    for (venue_id, record_date), (previous, current) in deltas.items():
+        changes = {field: current[field] - previous[field] for field in ROLLUP_FIELDS}
+        values = {getattr(DailyRollup, field): getattr(DailyRollup, field) + change for field, change in changes.items()}
+        values[DailyRollup.updated_at] = now
+
+        updated = DailyRollup.query.filter_by(
+            agency_id=agency_id, venue_id=venue_id or NO_VENUE, record_date=record_date
+        ).update(values, synchronize_session=False)
+        if not updated:
+            missing.append((venue_id, record_date))
+
+    if missing:
+        refresh_rollup_keys(agency_id, missing)
+
+
+def _rollup_records_query(agency_id):
+    """Records d'une agence en colonnes, avec la venue et le contrat de leur assignment."""
+    return db.session.query(
+        func.coalesce(Assignment.venue_id, NO_VENUE).label('venue_id'),
+        Assignment.contract_type,
+        PerformanceRecord.record_date,
+        PerformanceRecord.arrival_time,
+        PerformanceRecord.drinks_sold,
+        PerformanceRecord.special_commissions,
+        PerformanceRecord.daily_salary,
+        PerformanceRecord.daily_profit
+    ).join(Assignment, Assignment.id == PerformanceRecord.assignment_id).filter(Assignment.agency_id == agency_id)
+
+
+def _aggregate_rollups(agency_id, records):
+    """Somme les contributions des records par (venue_id, record_date); retourne (lignes, nombre de records)."""
+    rules = get_agency_rules(agency_id)
+    totals = {}
+    count = 0
+    for record in records:
+        count += 1
+        contribution = rollup_contribution(record, rules.get(record.contract_type))
+        key = (record.venue_id, record.record_date)
+        if key not in totals:
+            totals[key] = dict.fromkeys(ROLLUP_FIELDS, 0)
+        for field in ROLLUP_FIELDS:
+            totals[key][field] += contribution[field]
+
+    now = datetime.utcnow()
+    rows = [
+        dict(values, agency_id=agency_id, venue_id=venue_id, record_date=record_date, updated_at=now)
+        for (venue_id, record_date), values in totals.items()
+    ]
+    return rows, count
+
+
+def refresh_rollup_keys(agency_id, keys):
+    """
+    Recalcule les lignes DailyRollup de quelques (venue_id, record_date) à partir des
+    records, dans la transaction en cours (pas de commit ici). Les lignes qui n'ont
+    plus de records sont supprimées.
+
+    Args:
+        agency_id (int): ID de l'agence
+        keys (iterable): Couples (venue_id, record_date), venue_id None accepté
+    """
+    keys = {rollup_key(venue_id, record_date) for venue_id, record_date in keys}
+    if not keys:
+        return
+
+    db.session.flush()
+    venue_ids = {venue_id for venue_id, _ in keys}
+    record_dates = {record_date for _, record_date in keys}
+    records = _rollup_records_query(agency_id).filter(
+        func.coalesce(Assignment.venue_id, NO_VENUE).in_(venue_ids),
+        PerformanceRecord.record_date.in_(record_dates)
+    ).all()
+    rows, _ = _aggregate_rollups(agency_id, [r for r in records if (r.venue_id, r.record_date) in keys])
+
+    empty = keys - {(row['venue_id'], row['record_date']) for row in rows}
+    if empty:
+        DailyRollup.query.filter(
+            DailyRollup.agency_id == agency_id,
+            tuple_(DailyRollup.venue_id, DailyRollup.record_date).in_(list(empty))
+        ).delete(synchronize_session=False)
+    bulk_upsert(DailyRollup, rows, ['agency_id', 'venue_id', 'record_date'], list(ROLLUP_FIELDS) + ['updated_at'])
+
+
+def record_keys_for_assignments(assignment_ids):
+    """
+    Liste les (venue_id, record_date) touchés par les records de ces assignments,
+    à relever avant une suppression ou un changement de venue.
+
+    Args:
+        assignment_ids (list): IDs d'assignment
+
+    Returns:
+        set: Couples (venue_id, record_date)
+    """
+    if not assignment_ids:
+        return set()
+    return {
+        rollup_key(row.venue_id, row.record_date)
+        for row in db.session.query(Assignment.venue_id, PerformanceRecord.record_date)
+        .join(PerformanceRecord, PerformanceRecord.assignment_id == Assignment.id)
+        .filter(Assignment.id.in_(assignment_ids)).distinct()
+    }
+
+
+def rebuild_daily_rollups(agency_id):
+    """
+    Reconstruit toutes les lignes DailyRollup d'une agence (backfill, changement de
+    règles de contrat): une lecture en colonnes des records, agrégation en mémoire,
+    puis un seul upsert groupé. Commit à la fin.
+
+    Args:
+        agency_id (int): ID de l'agence
+
+    Returns:
+        dict: Rapport avec 'records', 'rows' et 'seconds'
+    """
+    start = time_module.time()
+    try:
+        rows, record_count = _aggregate_rollups(agency_id, _rollup_records_query(agency_id).yield_per(5000))
+        DailyRollup.query.filter_by(agency_id=agency_id).delete(synchronize_session=False)
+        bulk_upsert(DailyRollup, rows, ['agency_id', 'venue_id', 'record_date'], list(ROLLUP_FIELDS) + ['updated_at'])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    seconds = time_module.time() - start
+    current_app.logger.info(
+        f"[PERF] Daily rollups agency {agency_id}: {record_count} records -> {len(rows)} rows in {seconds:.3f}s"
+    )
+    return {'records': record_count, 'rows': len(rows), 'seconds': seconds}
+
+
+def get_venue_rollups(agency_id, start_date=None, end_date=None, venue_id=None):
+    """
+    Totaux par venue sur une période, lus dans DailyRollup (une requête groupée,
+    une ligne par venue et par jour au lieu d'une par record).
+
+    Args:
+        agency_id (int): ID de l'agence
+        start_date (date, optional): Premier jour inclus
+        end_date (date, optional): Dernier jour inclus
+        venue_id (int, optional): Restreindre à cette venue (0 = sans venue)
+
+    Returns:
+        list: Dictionnaires {venue_id, days, drinks, special_commissions, salary,
+              commission, profit, headcount, lateness_minutes}, par venue_id
+    """
+    query = db.session.query(
+        DailyRollup.venue_id,
+        func.count(DailyRollup.id).label('days'),
+        *[func.sum(getattr(DailyRollup, field)).label(field) for field in ROLLUP_FIELDS]
+    ).filter(DailyRollup.agency_id == agency_id, DailyRollup.headcount > 0)
+    if start_date:
+        query = query.filter(DailyRollup.record_date >= start_date)
+    if end_date:
+        query = query.filter(DailyRollup.record_date <= end_date)
+    if venue_id is not None:
+        query = query.filter(DailyRollup.venue_id == venue_id)
+
+    return [
+        dict(
+            venue_id=row.venue_id or None,
+            days=row.days,
+            **{field: getattr(row, field) or 0 for field in ROLLUP_FIELDS}
+        )
+        for row in query.group_by(DailyRollup.venue_id).order_by(DailyRollup.venue_id).all()
+    ]
@@ -0,0 +1,146 @@
+# app/services/staff_listing.py
+
+import base64
+import json
+import time as time_module
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from app.models import db, StaffProfile
+from app.services.staff_search import staff_search_ids
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+# Clés de tri de la liste du staff: nom -> (expression SQL, ordre inversé, type de la valeur
+# dans le curseur). 'age' trie sur la date de naissance dans l'ordre inverse.
+STAFF_SORT_KEYS = {
+    'nickname': (db.func.lower(StaffProfile.nickname), False, str),
+    'age': (StaffProfile.dob, True, date),
+    'dob': (StaffProfile.dob, False, date),
+    'status': (StaffProfile.status, False, str),
+    'created_at': (StaffProfile.created_at, False, datetime),
+    'staff_id': (StaffProfile.staff_id, False, str),
+    'preferred_position': (StaffProfile.preferred_position, False, str),
+}
+
+
+def staff_sort(sort_by, sort_order):
+    """
+    Tri effectif d'une demande de la liste (clé inconnue -> created_at).
+
+    Args:
+        sort_by (str): Clé de tri
+        sort_order (str): 'asc' ou 'desc'
+
+    Returns:
+        tuple: (clé retenue, expression SQL, descendant, type de la valeur)
+    """
+    if sort_by not in STAFF_SORT_KEYS:
+        sort_by = 'created_at'
+    expression, reversed_order, value_type = STAFF_SORT_KEYS[sort_by]
+    return sort_by, expression, (sort_order == 'desc') != reversed_order, value_type
+
+
+def encode_staff_cursor(sort_value, profile_id):
+    """Curseur keyset (valeur de tri, id) du dernier profil d'une page, sûr dans une URL."""
+    if isinstance(sort_value, (date, datetime)):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps([sort_value, profile_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_staff_cursor(cursor, value_type):
+    """
+    Lit un curseur de encode_staff_cursor.
+
+    Raises:
+        ValueError: Curseur malformé
+    """
+    try:
+        sort_value, profile_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid staff list cursor: {cursor}") from e
+    if sort_value is not None:
+        if value_type is date:
+            sort_value = date.fromisoformat(sort_value)
+        elif value_type is datetime:
+            sort_value = datetime.fromisoformat(sort_value)
+        elif not isinstance(sort_value, str):
+            raise ValueError(f"Invalid staff list cursor: {cursor}")
+    if not isinstance(profile_id, int):
+        raise ValueError(f"Invalid staff list cursor: {cursor}")
+    return sort_value, profile_id
+
+
+def _after(expression, descending, sort_value, profile_id):
+    """
+    Condition "après (sort_value, profile_id)" dans l'ordre de la page. Les NULL sont
+    en tête en ordre croissant et en queue en ordre décroissant (ordre par défaut de
+    SQLite, rendu explicite pour Postgres), sans COALESCE qui empêcherait les index.
+    """
+    if descending:
+        if sort_value is None:
+            return and_(expression.is_(None), StaffProfile.id < profile_id)
+        return or_(expression < sort_value, and_(expression == sort_value, StaffProfile.id < profile_id),
+                   expression.is_(None))
+    if sort_value is None:
+        return or_(and_(expression.is_(None), StaffProfile.id > profile_id), expression.isnot(None))
+    return or_(expression > sort_value, and_(expression == sort_value, StaffProfile.id > profile_id))
+
+
+def list_staff_page(agency_id, sort_by='created_at', sort_order='desc', statuses=None, search=None,
+                    page_size=DEFAULT_PAGE_SIZE, after=None):
+    """
+    Une page de la liste du staff d'une agence, en pagination keyset sur (clé de tri, id):
+    le coût d'une page ne dépend pas du nombre de profils de l'agence ni de sa position.
+    Filtres de statut et de recherche (index staff_search) appliqués en SQL.
+
+    Args:
+        agency_id (int): Agence
+        sort_by (str): Clé de STAFF_SORT_KEYS
+        sort_order (str): 'asc' ou 'desc'
+        statuses (list, optional): Statuts retenus, tous si vide
+        search (str, optional): Recherche multi-champs (staff_search_ids)
+        page_size (int): Nombre de profils par page
+        after (str, optional): Curseur de la page précédente (encode_staff_cursor)
+
+    Returns:
+        dict: 'profiles' (StaffProfile), 'next_cursor' (None à la dernière page), 'total_count'
+
+    Raises:
+        ValueError: Curseur malformé
+    """
+    page_start = time_module.time()
+    sort_by, expression, descending, value_type = staff_sort(sort_by, sort_order)
+    keyset = decode_staff_cursor(after, value_type) if after else None
+
+    query = db.session.query(StaffProfile, expression.label('sort_value')).filter(StaffProfile.agency_id == agency_id)
+    if statuses:
+        query = query.filter(StaffProfile.status.in_(statuses))
+    matching_staff = staff_search_ids(agency_id, search)
+    if matching_staff is not None:
+        query = query.filter(StaffProfile.id.in_(matching_staff))
+    total_count = query.order_by(None).with_entities(db.func.count(StaffProfile.id)).scalar()
+
+    if keyset:
+        query = query.filter(_after(expression, descending, *keyset))
+    if descending:
+        query = query.order_by(expression.desc().nulls_last(), StaffProfile.id.desc())
+    else:
+        query = query.order_by(expression.asc().nulls_first(), StaffProfile.id.asc())
+
+    rows = query.limit(page_size + 1).all()
+    next_cursor = encode_staff_cursor(rows[page_size - 1].sort_value, rows[page_size - 1][0].id) \
+        if len(rows) > page_size else None
+    profiles = [profile for profile, _ in rows[:page_size]]
+
+    current_app.logger.info(
+        f"[PERF] Staff list page: {len(profiles)}/{total_count} profiles sorted by {sort_by} "
+        f"in {time_module.time() - page_start:.3f}s"
+    )
+    return {'profiles': profiles, 'next_cursor': next_cursor, 'total_count': total_count}
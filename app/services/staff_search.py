@@ -0,0 +1,212 @@
+# app/services/staff_search.py
+
+import re
+
+from sqlalchemy import DDL, event
+
+from app.models import db, StaffProfile
+
+
+# Champs cherchés, avec leur poids dans le classement (bm25 sur SQLite)
+SEARCH_FIELDS = {
+    'nickname': 10.0,
+    'staff_id': 8.0,
+    'first_name': 4.0,
+    'last_name': 4.0,
+    'phone': 2.0,
+    'line_id': 2.0,
+    'instagram': 2.0,
+}
+
+# Les trigrammes ne trouvent que les termes d'au moins 3 caractères, les plus courts sont cherchés par LIKE
+MIN_TRIGRAM_LENGTH = 3
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Téléphone réduit à ses chiffres, dans l'index comme dans la requête ('081-234 5678' -> '0812345678')
+_SQLITE_PHONE_DIGITS = "replace(replace(replace(replace(replace(replace(coalesce({}, ''), ' ', ''), '-', ''), " \
+                       "'+', ''), '(', ''), ')', ''), '.', '')"
+
+
+def _sqlite_values(prefix):
+    """Valeurs indexées d'un profil ('new' dans un trigger, nom de table dans un INSERT ... SELECT)."""
+    values = [_SQLITE_PHONE_DIGITS.format(f"{prefix}.phone") if field == 'phone' else f"{prefix}.{field}"
+              for field in SEARCH_FIELDS]
+    return ', '.join([f"{prefix}.id"] + values + [f"{prefix}.agency_id"])
+
+
+_SQLITE_COLUMNS = ', '.join(['rowid'] + list(SEARCH_FIELDS) + ['agency_id'])
+
+# SQLite: table FTS5 (tokenizer trigram: recherche de sous-chaînes) tenue à jour par des triggers
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS staff_search USING fts5("
+    + ', '.join(SEARCH_FIELDS) + ", agency_id UNINDEXED, tokenize = 'trigram')",
+    "CREATE TRIGGER IF NOT EXISTS staff_search_insert AFTER INSERT ON staff_profile BEGIN "
+    f"INSERT INTO staff_search({_SQLITE_COLUMNS}) VALUES ({_sqlite_values('new')}); END",
+    "CREATE TRIGGER IF NOT EXISTS staff_search_delete AFTER DELETE ON staff_profile BEGIN "
+    "DELETE FROM staff_search WHERE rowid = old.id; END",
+    f"CREATE TRIGGER IF NOT EXISTS staff_search_update AFTER UPDATE OF {', '.join(SEARCH_FIELDS)}, agency_id "
+    "ON staff_profile BEGIN DELETE FROM staff_search WHERE rowid = old.id; "
+    f"INSERT INTO staff_search({_SQLITE_COLUMNS}) VALUES ({_sqlite_values('new')}); END",
+]
+
+# Postgres: index GIN pg_trgm sur un document texte des champs, même expression dans l'index et les requêtes
+PG_SEARCH_DOCUMENT = "lower(" + " || ' ' || ".join(
+    "regexp_replace(coalesce(phone, ''), '[^0-9]', '', 'g')" if field == 'phone' else f"coalesce({field}, '')"
+    for field in SEARCH_FIELDS
+) + ")"
+
+PG_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_staff_profile_search_trgm ON staff_profile USING gin (({PG_SEARCH_DOCUMENT}) gin_trgm_ops)",
+]
+
+for _statement in SQLITE_SEARCH_DDL:
+    event.listen(StaffProfile.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+for _statement in PG_SEARCH_DDL:
+    event.listen(StaffProfile.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+event.listen(StaffProfile.__table__, 'before_drop',
+             DDL("DROP TABLE IF EXISTS staff_search").execute_if(dialect='sqlite'))
+
+_search_table = db.table('staff_search', db.column('rowid'), db.column('agency_id'),
+                         *(db.column(field) for field in SEARCH_FIELDS))
+
+
+def search_terms(query):
+    """
+    Termes d'une recherche: minuscules, '@' des comptes Instagram retiré, numéros de
+    téléphone réduits à leurs chiffres.
+
+    Args:
+        query (str): Texte saisi
+
+    Returns:
+        list: Termes non vides
+    """
+    terms = []
+    for term in (query or '').lower().split():
+        term = term.lstrip('@')
+        if re.fullmatch(r'[\d+().\-]+', term) and re.search(r'\d', term):
+            term = re.sub(r'\D', '', term)
+        if term:
+            terms.append(term)
+    return terms
+
+
+def _backend():
+    return db.engine.dialect.name
+
+
+def _sqlite_matches(agency_id, terms):
+    """(condition, rang) sur la table staff_search."""
+    conditions = [_search_table.c.agency_id == agency_id]
+    long_terms = [term for term in terms if len(term) >= MIN_TRIGRAM_LENGTH]
+    for term in terms:
+        if len(term) < MIN_TRIGRAM_LENGTH:
+            conditions.append(db.or_(*(_search_table.c[field].contains(term, autoescape=True)
+                                       for field in SEARCH_FIELDS)))
+    if not long_terms:
+        return db.and_(*conditions), db.func.lower(_search_table.c.nickname)
+    # Chaque terme entre guillemets: sous-chaîne littérale, tous les termes requis
+    match = ' '.join('"{}"'.format(term.replace('"', '""')) for term in long_terms)
+    conditions.append(db.literal_column('staff_search').op('MATCH')(match))
+    rank = db.func.bm25(db.literal_column('staff_search'), *SEARCH_FIELDS.values())
+    return db.and_(*conditions), rank
+
+
+def _document_condition(terms):
+    """Condition sur les champs de StaffProfile: document pg_trgm sur Postgres, LIKE ailleurs."""
+    if _backend() == 'postgresql':
+        document = db.literal_column(PG_SEARCH_DOCUMENT)
+        return db.and_(*(document.contains(term, autoescape=True) for term in terms))
+    return db.and_(*(
+        db.or_(*(db.func.lower(getattr(StaffProfile, field)).contains(term, autoescape=True)
+                 for field in SEARCH_FIELDS))
+        for term in terms
+    ))
+
+
+def _nickname_rank(column, terms):
+    """Rang du surnom: identique à la recherche (0), commençant par elle (1), autre (2).
+    bm25 ne départage pas un terme présent dans la plupart des profils."""
+    query_text = ' '.join(terms)
+    nickname = db.func.lower(column)
+    return db.case((nickname == query_text, 0), (nickname.startswith(query_text, autoescape=True), 1), else_=2)
+
+
+def staff_search_ids(agency_id, query):
+    """
+    Sous-requête des ids des profils de l'agence qui correspondent à la recherche, à
+    utiliser comme filtre (StaffProfile.id.in_(...), Assignment.staff_id.in_(...)).
+    Tous les termes doivent se trouver dans l'un des champs de SEARCH_FIELDS.
+
+    Args:
+        agency_id (int): Agence
+        query (str): Texte saisi
+
+    Returns:
+        Select: Sous-requête des ids, ou None si la recherche est vide
+    """
+    terms = search_terms(query)
+    if not terms:
+        return None
+    if _backend() == 'sqlite':
+        condition, _ = _sqlite_matches(agency_id, terms)
+        return db.select(_search_table.c.rowid).where(condition)
+    return db.select(StaffProfile.id).where(StaffProfile.agency_id == agency_id, _document_condition(terms))
+
+
+def search_staff(agency_id, query, limit=DEFAULT_LIMIT):
+    """
+    Profils de l'agence qui correspondent à la recherche, les plus pertinents d'abord:
+    surnom identique puis commençant par la recherche, puis rang bm25 des champs
+    pondérés (SQLite) ou similarité trigramme du surnom (Postgres).
+
+    Args:
+        agency_id (int): Agence
+        query (str): Texte saisi
+        limit (int): Nombre maximal de résultats
+
+    Returns:
+        list: StaffProfile classés
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    if _backend() == 'sqlite':
+        condition, rank = _sqlite_matches(agency_id, terms)
+        nickname_rank = _nickname_rank(_search_table.c.nickname, terms)
+        ranked = db.select(_search_table.c.rowid.label('id'), nickname_rank.label('nickname_rank'),
+                           rank.label('rank')) \
+            .where(condition).order_by(nickname_rank, rank).limit(limit).subquery()
+        return StaffProfile.query.join(ranked, StaffProfile.id == ranked.c.id) \
+            .order_by(ranked.c.nickname_rank, ranked.c.rank, StaffProfile.id).all()
+
+    if _backend() == 'postgresql':
+        rank = db.func.similarity(db.func.lower(StaffProfile.nickname), ' '.join(terms)).desc()
+    else:
+        rank = db.func.lower(StaffProfile.nickname)
+    return StaffProfile.query.filter(StaffProfile.agency_id == agency_id, _document_condition(terms)) \
+        .order_by(_nickname_rank(StaffProfile.nickname, terms), rank, StaffProfile.id).limit(limit).all()
+
+
+def rebuild_search_index():
+    """
+    Reconstruit l'index de recherche SQLite depuis staff_profile (base créée avant
+    l'index, ou modifiée sans les triggers). Sans effet sur les autres bases, où
+    l'index pg_trgm suit la table.
+
+    Returns:
+        int: Nombre de profils indexés, None hors SQLite
+    """
+    if _backend() != 'sqlite':
+        return None
+    with db.engine.begin() as connection:
+        for statement in SQLITE_SEARCH_DDL:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql("DELETE FROM staff_search")
+        connection.exec_driver_sql(
+            f"INSERT INTO staff_search({_SQLITE_COLUMNS}) SELECT {_sqlite_values('staff_profile')} FROM staff_profile"
+        )
+        return connection.exec_driver_sql("SELECT count(*) FROM staff_search").scalar()
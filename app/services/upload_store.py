@@ -0,0 +1,429 @@
+# app/services/upload_store.py
+
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import abort, current_app, request, send_file
+from sqlalchemy.exc import IntegrityError
+from werkzeug.utils import safe_join
+
+from app.models import db, Assignment, StaffProfile, UploadBlob, UploadReference, Venue
+from app.services.image_derivatives import (IMAGE_EXTENSIONS, create_derivatives, image_placeholder,
+                                            print_derivative_path, venue_logo_folder, web_derivative_paths)
+
+
+# Dossiers de stockage des fichiers uploadés
+PHOTO_STORE = 'photos'
+VENUE_LOGO_STORE = 'venue_logos'
+
+# Types de propriétaires dans UploadReference
+STAFF_PHOTO = 'staff_photo'
+VENUE_LOGO = 'venue_logo'
+
+# Venue.logo_url = préfixe + nom du fichier (servi par le dossier static)
+VENUE_LOGO_URL_PREFIX = '/static/uploads/venues/'
+
+# Nom d'un fichier stocké d'après son contenu: '<sha256>.<ext>'
+BLOB_FILENAME = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+
+# Fichier temporaire d'un upload en cours, dans le dossier de stockage (même système de fichiers)
+TMP_PREFIX = '.upload-'
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def store_folder(store):
+    """Dossier d'un stockage: UPLOAD_FOLDER pour les photos, static/uploads/venues pour les logos."""
+    if store == PHOTO_STORE:
+        return current_app.config['UPLOAD_FOLDER']
+    return venue_logo_folder()
+
+
+def blob_path(blob):
+    """Chemin du fichier d'un blob."""
+    return os.path.join(store_folder(blob.store), blob.filename)
+
+
+def _blob_extension(filename):
+    ext = os.path.splitext(filename or '')[1].lower()
+    return '.jpg' if ext == '.jpeg' else (ext or '.bin')
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_upload(file_storage, store):
+    """
+    Enregistre un fichier uploadé sous le hash de son contenu. Un contenu déjà stocké
+    n'est pas réécrit: le blob existant est réutilisé.
+
+    Args:
+        file_storage (FileStorage): Fichier de request.files
+        store (str): PHOTO_STORE ou VENUE_LOGO_STORE
+
+    Returns:
+        tuple: (UploadBlob ajouté à la session, True si le fichier vient d'être écrit)
+    """
+    folder = store_folder(store)
+    os.makedirs(folder, exist_ok=True)
+
+    # Hash calculé pendant l'écriture, sans garder le fichier en mémoire
+    tmp_path = os.path.join(folder, f"{TMP_PREFIX}{uuid.uuid4().hex}.tmp")
+    digest = hashlib.sha256()
+    size = 0
+    with open(tmp_path, 'wb') as target:
+        for chunk in iter(lambda: file_storage.stream.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            target.write(chunk)
+            size += len(chunk)
+    sha256 = digest.hexdigest()
+
+    blob = UploadBlob.query.filter_by(store=store, sha256=sha256).first()
+    if blob is not None and os.path.exists(blob_path(blob)):
+        os.remove(tmp_path)
+        return blob, False
+
+    filename = blob.filename if blob is not None else f"{sha256}{_blob_extension(file_storage.filename)}"
+    os.replace(tmp_path, os.path.join(folder, filename))
+    if blob is None:
+        blob = UploadBlob(store=store, sha256=sha256, filename=filename, size=size)
+        try:
+            with db.session.begin_nested():
+                db.session.add(blob)
+        except IntegrityError:
+            # Même contenu enregistré en parallèle par une autre requête
+            blob = UploadBlob.query.filter_by(store=store, sha256=sha256).one()
+    return blob, True
+
+
+def store_image_upload(file_storage, store):
+    """
+    Enregistre une image uploadée (save_upload) et ses dérivées, créées seulement pour
+    un contenu nouveau.
+
+    Args:
+        file_storage (FileStorage): Fichier de request.files
+        store (str): PHOTO_STORE ou VENUE_LOGO_STORE
+
+    Returns:
+        tuple: (UploadBlob, aperçu de l'image en data URI ou None)
+    """
+    blob, created = save_upload(file_storage, store)
+    path = blob_path(blob)
+    return blob, create_derivatives(path) if created else image_placeholder(path)
+
+
+def set_reference(owner_type, owner_id, blob):
+    """
+    Fait pointer un propriétaire (photo d'un profil, logo d'une venue) vers un blob.
+    L'ancien blob du propriétaire, s'il n'est plus référencé, sera supprimé par
+    collect_garbage.
+    """
+    reference = UploadReference.query.filter_by(owner_type=owner_type, owner_id=owner_id).first()
+    if reference is None:
+        db.session.add(UploadReference(owner_type=owner_type, owner_id=owner_id, blob=blob))
+    else:
+        reference.blob = blob
+
+
+def drop_reference(owner_type, owner_id):
+    """Supprime la référence d'un propriétaire supprimé."""
+    UploadReference.query.filter_by(owner_type=owner_type, owner_id=owner_id).delete(synchronize_session=False)
+
+
+def content_etag(filename, variant=None):
+    """
+    ETag fort d'un fichier nommé par son contenu: le hash du nom, suivi de la dérivée
+    ('thumb.webp'...) pour une dérivée. None pour un ancien nom, qui ne dit rien du contenu.
+    """
+    if not BLOB_FILENAME.match(filename):
+        return None
+    sha256 = filename.split('.', 1)[0]
+    return f"{sha256}-{variant}" if variant else sha256
+
+
+def send_upload(folder, filename, etag=None):
+    """
+    Sert un fichier uploadé (original ou dérivée). Avec un ETag de contenu (content_etag)
+    la réponse est mise en cache UPLOAD_CACHE_MAX_AGE secondes sans revalidation
+    (immutable), sinon le navigateur revalide à chaque fois (304 sur ETag de Flask).
+    If-None-Match et Range sont gérés ici, ou par le proxy si UPLOAD_SENDFILE_MODE
+    lui confie l'envoi du fichier ('x-accel-redirect' pour nginx, 'x-sendfile' pour
+    Apache/lighttpd): le worker Flask est alors libéré sans lire le fichier.
+
+    Args:
+        folder (str): Dossier des uploads
+        filename (str): Chemin relatif du fichier dans ce dossier
+        etag (str, optional): ETag de contenu
+
+    Returns:
+        Response: Fichier, 206, 304 ou réponse vide déléguée au proxy
+    """
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mode = current_app.config.get('UPLOAD_SENDFILE_MODE')
+    if mode in ('x-accel-redirect', 'x-sendfile'):
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        )
+        if mode == 'x-accel-redirect':
+            # Location interne du proxy qui pointe sur le dossier des uploads
+            prefix = current_app.config['UPLOAD_ACCEL_PREFIX'].rstrip('/')
+            response.headers['X-Accel-Redirect'] = f"{prefix}/{os.path.relpath(path, folder).replace(os.sep, '/')}"
+        else:
+            response.headers['X-Sendfile'] = os.path.abspath(path)
+        if etag:
+            response.set_etag(etag)
+        else:
+            stat = os.stat(path)
+            response.set_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+        response.make_conditional(request)
+    else:
+        response = send_file(path, etag=etag or True, conditional=True)
+
+    if etag:
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config.get('UPLOAD_CACHE_MAX_AGE', 31536000)
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def _remove_file(path):
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except OSError:
+        return 0
+
+
+def _remove_with_derivatives(path):
+    derivatives = [print_derivative_path(path)] + web_derivative_paths(path)
+    return _remove_file(path) + sum(_remove_file(derivative) for derivative in derivatives)
+
+
+def _move_derivatives(old_path, new_path):
+    """Renomme les dérivées d'une image renommée (ou les supprime si la cible les a déjà)."""
+    pairs = [(print_derivative_path(old_path), print_derivative_path(new_path))]
+    pairs += zip(web_derivative_paths(old_path), web_derivative_paths(new_path))
+    for old, new in pairs:
+        if not os.path.exists(old):
+            continue
+        if os.path.exists(new):
+            os.remove(old)
+        else:
+            os.replace(old, new)
+
+
+def _urls_in_use(store, filenames):
+    """Noms de fichiers encore utilisés par une colonne d'URL (filet de sécurité du ramasse-miettes)."""
+    if not filenames:
+        return set()
+    if store == PHOTO_STORE:
+        in_use = {url for (url,) in db.session.query(StaffProfile.photo_url)
+                  .filter(StaffProfile.photo_url.in_(filenames))}
+        # Photo gardée par les assignments d'un profil supprimé
+        in_use |= {url for (url,) in db.session.query(Assignment.archived_staff_photo)
+                   .filter(Assignment.archived_staff_photo.in_(filenames))}
+        return in_use
+    urls = [VENUE_LOGO_URL_PREFIX + filename for filename in filenames]
+    return {url[len(VENUE_LOGO_URL_PREFIX):] for (url,) in db.session.query(Venue.logo_url)
+            .filter(Venue.logo_url.in_(urls))}
+
+
+def collect_garbage(grace=None, dry_run=False):
+    """
+    Supprime les fichiers uploadés qui ne sont plus utilisés:
+    - références dont le profil ou la venue n'existe plus,
+    - blobs sans référence (fichier, dérivées et ligne), sauf si une colonne d'URL
+      les nomme encore,
+    - fichiers nommés par hash sans blob et uploads temporaires abandonnés.
+    Les blobs et fichiers plus récents que grace secondes sont gardés: un upload
+    peut être écrit avant que sa référence soit enregistrée.
+
+    Args:
+        grace (int, optional): Âge minimal en secondes (défaut: UPLOAD_GC_GRACE)
+        dry_run (bool): Compter sans rien supprimer
+
+    Returns:
+        dict: Nombre de 'references', 'blobs' et 'files' supprimés, et 'bytes' libérés
+    """
+    grace = current_app.config.get('UPLOAD_GC_GRACE', 3600) if grace is None else grace
+    report = {'references': 0, 'blobs': 0, 'files': 0, 'bytes': 0}
+
+    stale_references = UploadReference.query.filter(db.or_(
+        db.and_(UploadReference.owner_type == STAFF_PHOTO,
+                UploadReference.owner_id.not_in(db.select(StaffProfile.id))),
+        db.and_(UploadReference.owner_type == VENUE_LOGO,
+                UploadReference.owner_id.not_in(db.select(Venue.id))),
+    ))
+    report['references'] = stale_references.count()
+    if not dry_run:
+        stale_references.delete(synchronize_session=False)
+        db.session.flush()
+
+    cutoff = datetime.utcnow() - timedelta(seconds=grace)
+    unreferenced = UploadBlob.query.filter(
+        ~UploadBlob.references.any(), UploadBlob.created_at < cutoff
+    ).all()
+    for store in (PHOTO_STORE, VENUE_LOGO_STORE):
+        blobs = [blob for blob in unreferenced if blob.store == store]
+        in_use = _urls_in_use(store, [blob.filename for blob in blobs])
+        for blob in blobs:
+            if blob.filename in in_use:
+                continue
+            report['blobs'] += 1
+            if dry_run:
+                report['bytes'] += blob.size
+                continue
+            report['bytes'] += _remove_with_derivatives(blob_path(blob))
+            db.session.delete(blob)
+    if not dry_run:
+        db.session.commit()
+
+    # Fichiers sans blob: upload interrompu avant le commit, ou doublon d'un upload concurrent
+    known = {(store, filename) for store, filename in db.session.query(UploadBlob.store, UploadBlob.filename)}
+    cutoff_ts = time.time() - grace
+    for store in (PHOTO_STORE, VENUE_LOGO_STORE):
+        folder = store_folder(store)
+        if not os.path.isdir(folder):
+            continue
+        for filename in os.listdir(folder):
+            orphan = (BLOB_FILENAME.match(filename) and (store, filename) not in known) \
+                or filename.startswith(TMP_PREFIX)
+            path = os.path.join(folder, filename)
+            if not orphan or not os.path.isfile(path) or os.path.getmtime(path) > cutoff_ts:
+                continue
+            report['files'] += 1
+            report['bytes'] += os.path.getsize(path) if dry_run else _remove_with_derivatives(path)
+
+    current_app.logger.info(
+        f"[PERF] Upload GC{' (dry run)' if dry_run else ''}: {report['references']} references, "
+        f"{report['blobs']} blobs, {report['files']} orphan files, {report['bytes']} bytes"
+    )
+    return report
+
+
+def rekey_uploads():
+    """
+    Migre les dossiers d'uploads vers le stockage par contenu: chaque image est
+    renommée '<sha256>.<ext>' (ses dérivées suivent), les copies identiques sont
+    supprimées, les URLs des profils, assignments archivés et venues sont mises à jour
+    et les références reconstruites. Les anciens fichiers ne sont supprimés qu'après
+    le commit; la commande peut être relancée.
+
+    Returns:
+        dict: Nombre de 'files' examinés, 'renamed', 'duplicates' supprimés,
+              'references' créées et 'bytes_freed'
+    """
+    report = {'files': 0, 'renamed': 0, 'duplicates': 0, 'references': 0, 'bytes_freed': 0}
+    to_remove = []
+    to_move = []
+
+    for store in (PHOTO_STORE, VENUE_LOGO_STORE):
+        folder = store_folder(store)
+        if not os.path.isdir(folder):
+            continue
+        blobs = {blob.sha256: blob for blob in UploadBlob.query.filter_by(store=store)}
+        by_filename = {blob.filename for blob in blobs.values()}
+        renames = {}
+
+        for filename in sorted(os.listdir(folder)):
+            path = os.path.join(folder, filename)
+            if (not os.path.isfile(path) or filename.startswith(TMP_PREFIX)
+                    or os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS):
+                continue
+            if filename in by_filename:
+                continue
+            report['files'] += 1
+            sha256 = _hash_file(path)
+            blob = blobs.get(sha256)
+            if blob is None:
+                blob = UploadBlob(store=store, sha256=sha256, size=os.path.getsize(path),
+                                  filename=f"{sha256}{_blob_extension(filename)}")
+                db.session.add(blob)
+                blobs[sha256] = blob
+                by_filename.add(blob.filename)
+                if blob.filename != filename:
+                    # Copie sous le nouveau nom, l'original est supprimé après le commit
+                    target = os.path.join(folder, blob.filename)
+                    try:
+                        os.link(path, target)
+                    except OSError:
+                        shutil.copy2(path, target)
+                    to_move.append((path, target))
+                    report['renamed'] += 1
+                    renames[filename] = blob.filename
+                continue
+            report['duplicates'] += 1
+            to_remove.append(path)
+            renames[filename] = blob.filename
+
+        _apply_renames(store, renames)
+    db.session.flush()
+    report['references'] = _rebuild_references()
+    db.session.commit()
+
+    for old_path, new_path in to_move:
+        _move_derivatives(old_path, new_path)
+        _remove_file(old_path)
+    for path in to_remove:
+        report['bytes_freed'] += _remove_with_derivatives(path)
+    return report
+
+
+def _apply_renames(store, renames):
+    if not renames:
+        return
+    params = [{'old_url': old, 'new_url': new} for old, new in renames.items()]
+    if store == PHOTO_STORE:
+        columns = (StaffProfile.__table__.c.photo_url, Assignment.__table__.c.archived_staff_photo)
+    else:
+        columns = (Venue.__table__.c.logo_url,)
+        params = [{'old_url': VENUE_LOGO_URL_PREFIX + p['old_url'], 'new_url': VENUE_LOGO_URL_PREFIX + p['new_url']}
+                  for p in params]
+    for column in columns:
+        db.session.execute(
+            db.update(column.table).where(column == db.bindparam('old_url'))
+            .values({column.name: db.bindparam('new_url')}),
+            params
+        )
+
+
+def _rebuild_references():
+    """Recrée les références des profils et venues dont l'URL désigne un blob. Retourne le nombre créé."""
+    blobs = {(blob.store, blob.filename): blob for blob in UploadBlob.query}
+    existing = {(ref.owner_type, ref.owner_id): ref for ref in UploadReference.query}
+    owners = [(STAFF_PHOTO, profile_id, (PHOTO_STORE, url))
+              for profile_id, url in db.session.query(StaffProfile.id, StaffProfile.photo_url)]
+    owners += [(VENUE_LOGO, venue_id, (VENUE_LOGO_STORE, url[len(VENUE_LOGO_URL_PREFIX):]))
+               for venue_id, url in db.session.query(Venue.id, Venue.logo_url)
+               if url and url.startswith(VENUE_LOGO_URL_PREFIX)]
+
+    created = 0
+    for owner_type, owner_id, key in owners:
+        blob = blobs.get(key)
+        if blob is None:
+            continue
+        reference = existing.get((owner_type, owner_id))
+        if reference is None:
+            db.session.add(UploadReference(owner_type=owner_type, owner_id=owner_id, blob=blob))
+            created += 1
+        elif reference.blob_id != blob.id:
+            reference.blob = blob
+    return created
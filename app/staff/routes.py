@@ -1,15 +1,20 @@
 # app/staff/routes.py
 
 from flask import (Blueprint, render_template, request, jsonify, redirect,
-                   url_for, current_app, Response, send_from_directory, abort)
+                   url_for, current_app, Response, abort)
 from flask_login import login_required, current_user
 from app.models import db, StaffProfile, Assignment, User, PerformanceRecord, Venue
 from app.decorators import admin_required, manager_required, super_admin_required, webdev_required, staff_management_required
-from werkzeug.utils import secure_filename
+from app.services.response_cache import cached_page, register_data_version_hook
+from werkzeug.utils import safe_join
 from datetime import datetime, date
 import os
-import uuid
-from weasyprint import HTML
+from app.services.pdf_queue import pdf_response
+from app.services.image_derivatives import print_image_path, web_image_path, WEB_DERIVATIVES, WEB_FORMATS
+from app.services.staff_listing import list_staff_page, MAX_PAGE_SIZE as MAX_STAFF_PAGE_SIZE
+from app.services.staff_search import search_staff, DEFAULT_LIMIT, MAX_LIMIT
+from app.services.upload_store import (PHOTO_STORE, STAFF_PHOTO, content_etag, drop_reference, send_upload,
+                                       set_reference, store_image_upload)
 import pathlib
 
 # Helper function to get current agency ID
@@ -51,6 +56,7 @@ def get_current_agency_id():
 
 # Blueprint definition
 staff_bp = Blueprint('staff', __name__, template_folder='../templates', url_prefix='/staff')
+register_data_version_hook(staff_bp)
 
 # --- Constants (to be moved later) ---
 CONTRACT_TYPES = {"1day": 1, "10days": 10, "1month": 30}
@@ -68,45 +74,32 @@ def allowed_file(filename):
 @staff_bp.route('/')
 @login_required
 @admin_required
+@cached_page
 def staff_list():
-    """Displays the list of staff with sorting and searching, scoped by agency."""
+    """Displays the first page of the staff list (sorting, status and search filters), scoped by agency."""
     agency_id = get_current_agency_id()
 
     search_nickname = request.args.get('search_nickname', '').strip()
     sort_by = request.args.get('sort_by', 'created_at')
     sort_order = request.args.get('sort_order', 'desc')
+    status = request.args.get('status', '')
+    if status not in ALLOWED_STATUSES:
+        status = ''
+
+    # Premier écran seulement, les pages suivantes sont chargées au défilement par staff_list_api
+    page = list_staff_page(agency_id, sort_by, sort_order, statuses=[status] if status else None,
+                           search=search_nickname, page_size=current_app.config.get('STAFF_LIST_PAGE_SIZE', 50))
+    filters = {'search_nickname': search_nickname, 'sort_by': sort_by, 'sort_order': sort_order, 'status': status}
+    next_url = None
+    if page['next_cursor']:
+        next_url = url_for('staff.staff_list_api', **{name: value for name, value in filters.items() if value},
+                           after=page['next_cursor'])
 
-    query = StaffProfile.query.filter_by(agency_id=agency_id)
-
-    if search_nickname:
-        query = query.filter(StaffProfile.nickname.ilike(f'%{search_nickname}%'))
-
-    sort_column_map = {
-        'nickname': db.func.lower(StaffProfile.nickname),
-        'age': StaffProfile.dob,
-        'status': StaffProfile.status,
-        'created_at': StaffProfile.created_at,
-        'staff_id': StaffProfile.staff_id,
-        'preferred_position': StaffProfile.preferred_position
-    }
-    sort_column = sort_column_map.get(sort_by, StaffProfile.created_at)
-
-    effective_sort_order = sort_order
-    if sort_by == 'age':
-        effective_sort_order = 'asc' if sort_order == 'desc' else 'desc'
-
-    if effective_sort_order == 'desc':
-        query = query.order_by(sort_column.desc())
-    else:
-        query = query.order_by(sort_column.asc())
-
-    all_profiles = query.all()
-    
     # Get venues for the current agency
     venues = Venue.query.filter_by(agency_id=agency_id).order_by(Venue.name).all()
     
-    return render_template('staff_list.html', profiles=all_profiles, statuses=ALLOWED_STATUSES,
-        venues=venues, current_filters={'search_nickname': search_nickname, 'sort_by': sort_by, 'sort_order': sort_order})
+    return render_template('staff_list.html', profiles=page['profiles'], total_count=page['total_count'],
+        next_url=next_url, statuses=ALLOWED_STATUSES, venues=venues, current_filters=filters)
 
 @staff_bp.route('/profile/new', methods=['GET'])
 @staff_bp.route('/profile/<int:profile_id>/edit', methods=['GET'])
@@ -169,9 +162,7 @@ def profile_detail(profile_id):
     
     agency_id = get_current_agency_id()
 
-    profile = StaffProfile.query.filter_by(id=profile_id, agency_id=agency_id).options(
-        db.joinedload(StaffProfile.assignments).subqueryload(Assignment.performance_records)
-    ).first_or_404()
+    profile = StaffProfile.query.filter_by(id=profile_id, agency_id=agency_id).first_or_404()
     
     start_date_str = request.args.get('start_date')
     end_date_str = request.args.get('end_date')
@@ -183,11 +174,13 @@ def profile_detail(profile_id):
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
 
     # Utiliser le service de paie pour obtenir les statistiques de performance
+    # (il charge aussi les assignments filtrés, réutilisés pour l'affichage)
     try:
-        performance_summary = get_staff_performance_summary(profile_id, start_date, end_date)
+        performance_summary = get_staff_performance_summary(profile_id, start_date, end_date, staff=profile)
         history_stats = performance_summary['summary_totals']
         detailed_history = performance_summary['detailed_history']
         contract_calculations = performance_summary['contract_calculations']
+        filtered_assignments = performance_summary['assignments']
     except Exception as e:
         # Fallback en cas d'erreur
         history_stats = {
@@ -200,18 +193,11 @@ def profile_detail(profile_id):
         }
         detailed_history = []
         contract_calculations = []
+        filtered_assignments = []
         print(f"Erreur lors du calcul des statistiques de performance: {str(e)}")
 
-    # Filtrer les assignments pour l'affichage
-    all_assignments = sorted(profile.assignments, key=lambda a: a.start_date, reverse=True)
-    
-    assignments_to_process = all_assignments
-    if start_date or end_date:
-        assignments_to_process = [
-            a for a in all_assignments
-            if (not end_date or a.start_date <= end_date) and \
-               (not start_date or a.end_date >= start_date)
-        ]
+    # Assignments déjà filtrés par période, du plus récent au plus ancien
+    assignments_to_process = sorted(filtered_assignments, key=lambda a: a.start_date, reverse=True)
     
     return render_template('profile_detail.html', profile=profile, assignments=assignments_to_process, 
                            history_stats=history_stats, filter_start_date=start_date, filter_end_date=end_date,
@@ -251,16 +237,18 @@ def create_profile():
         if hasattr(new_profile, key) and value:
             setattr(new_profile, key, value)
             
+    photo_blob = None
     if 'photo' in request.files:
         file = request.files['photo']
         if file and file.filename and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            unique_filename = f"{uuid.uuid4().hex}_{filename}"
-            save_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(save_path)
-            new_profile.photo_url = unique_filename
+            # Stockée sous le hash de son contenu: une photo déjà uploadée n'est pas dupliquée
+            photo_blob, new_profile.photo_placeholder = store_image_upload(file, PHOTO_STORE)
+            new_profile.photo_url = photo_blob.filename
             
     db.session.add(new_profile)
+    if photo_blob is not None:
+        db.session.flush()
+        set_reference(STAFF_PHOTO, new_profile.id, photo_blob)
     db.session.commit()
     return jsonify({'status': 'success', 'message': 'Profile created successfully!', 'profile_id': new_profile.id}), 201
 
@@ -290,11 +278,10 @@ def update_profile(profile_id):
     if 'photo' in request.files:
         file = request.files['photo']
         if file and file.filename and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            unique_filename = f"{uuid.uuid4().hex}_{filename}"
-            save_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(save_path)
-            profile.photo_url = unique_filename
+            # L'ancienne photo, si plus aucun profil ne l'utilise, est supprimée par 'flask gc-uploads'
+            photo_blob, profile.photo_placeholder = store_image_upload(file, PHOTO_STORE)
+            profile.photo_url = photo_blob.filename
+            set_reference(STAFF_PHOTO, profile.id, photo_blob)
             
     db.session.commit()
     return jsonify({'status': 'success', 'message': 'Profile updated successfully!'}), 200
@@ -331,7 +318,8 @@ def delete_staff_profile(profile_id):
         # 3. Delete contract calculations (they will be deleted automatically due to cascade)
         # This is handled by the cascade="all, delete-orphan" in the Assignment model
         
-        # Delete the profile
+        # Delete the profile (the photo stays while archived assignments show it)
+        drop_reference(STAFF_PHOTO, profile_id)
         db.session.delete(profile_to_delete)
         db.session.commit()
         
@@ -369,12 +357,108 @@ def update_staff_status(profile_id):
     db.session.commit()
     return jsonify({'status': 'success', 'message': f'Status for {profile.nickname} updated to {new_status}.'})
 
+def _staff_summary(profile):
+    """JSON fields of a profile for the staff APIs (thumbnail derivative as photo)."""
+    return {
+        'id': profile.id,
+        'nickname': profile.nickname,
+        'first_name': profile.first_name,
+        'last_name': profile.last_name,
+        'staff_id': profile.staff_id,
+        'status': profile.status,
+        'photo_url': url_for('staff.photo_derivative', size='thumb', ext='webp',
+                             filename=profile.photo_url.split('/')[-1])
+                     if profile.photo_url and 'default' not in profile.photo_url else None,
+    }
+
+@staff_bp.route('/api/search')
+@login_required
+def search_staff_api():
+    """
+    Ranked staff search of the current agency over nickname, names, staff ID, phone
+    digits, LINE and Instagram, shared by the staff list, payroll filters and dispatch board.
+    """
+    agency_id = get_current_agency_id()
+    if not agency_id:
+        return jsonify({'status': 'error', 'message': 'User not associated with an agency.'}), 403
+
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
+    profiles = search_staff(agency_id, query, limit=limit)
+    return jsonify({'query': query, 'results': [_staff_summary(profile) for profile in profiles]})
+
+@staff_bp.route('/api/profiles')
+@login_required
+@admin_required
+def staff_list_api():
+    """
+    One page of the staff list as JSON, with keyset pagination (?after=<next_cursor>) on the
+    list's sort keys and the same status and search filters. Also returns the page's grid
+    cards and table rows rendered by the list's templates, appended on scroll by the list page.
+    """
+    agency_id = get_current_agency_id()
+
+    search_nickname = request.args.get('search_nickname', '').strip()
+    sort_by = request.args.get('sort_by', 'created_at')
+    sort_order = request.args.get('sort_order', 'desc')
+    statuses = [status for status in request.args.getlist('status') if status]
+    if any(status not in ALLOWED_STATUSES for status in statuses):
+        return jsonify({'status': 'error', 'message': f'Invalid status. Allowed: {", ".join(ALLOWED_STATUSES)}'}), 400
+    page_size = min(max(request.args.get('page_size', current_app.config.get('STAFF_LIST_PAGE_SIZE', 50), type=int), 1),
+                    MAX_STAFF_PAGE_SIZE)
+
+    try:
+        page = list_staff_page(agency_id, sort_by, sort_order, statuses=statuses, search=search_nickname,
+                               page_size=page_size, after=request.args.get('after'))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid page cursor.'}), 400
+
+    page_args = request.args.to_dict(flat=False)
+    page_args.pop('after', None)
+    return jsonify({
+        'profiles': [dict(_staff_summary(profile), preferred_position=profile.preferred_position, age=profile.age)
+                     for profile in page['profiles']],
+        'total_count': page['total_count'],
+        'next_cursor': page['next_cursor'],
+        'next_url': url_for('staff.staff_list_api', **page_args, after=page['next_cursor'])
+                    if page['next_cursor'] else None,
+        'html': {
+            view: render_template('_staff_list_items.html', profiles=page['profiles'], statuses=ALLOWED_STATUSES,
+                                  view=view)
+            for view in ('grid', 'list')
+        },
+    })
+
 # --- PDF & FILES ---
 
 @staff_bp.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    """Serves uploaded files."""
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+    """Serves uploaded files, cached for good when named by their content hash."""
+    return send_upload(current_app.config['UPLOAD_FOLDER'], filename, etag=content_etag(filename))
+
+@staff_bp.app_template_global()
+def photo_srcset(filename, ext):
+    """srcset of the web derivatives of an uploaded photo ('<url> 80w, <url> 240w, <url> 400w')."""
+    return ', '.join(
+        f"{url_for('staff.photo_derivative', size=size, ext=ext, filename=filename)} {side}w"
+        for size, side in WEB_DERIVATIVES.items()
+    )
+
+@staff_bp.route('/uploads/derivatives/<size>/<ext>/<filename>')
+def photo_derivative(size, ext, filename):
+    """Serves a resized WebP/JPEG derivative of an uploaded photo, created on first request if missing."""
+    if size not in WEB_DERIVATIVES or ext not in WEB_FORMATS:
+        abort(404)
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    source_path = safe_join(upload_folder, filename)
+    if source_path is None:
+        abort(404)
+    path = web_image_path(source_path, size, ext)
+    if path is None:
+        # Original absent (404) ou illisible par Pillow: servi tel quel
+        return send_upload(upload_folder, filename, etag=content_etag(filename))
+    return send_upload(upload_folder, os.path.relpath(path, upload_folder),
+                       etag=content_etag(filename, f"{size}.{ext}"))
 
 @staff_bp.route('/profile/<int:profile_id>/pdf')
 @login_required
@@ -396,7 +480,8 @@ def profile_pdf(profile_id):
         if profile.photo_url and 'default' not in profile.photo_url:
             photo_path = os.path.join(current_app.config['UPLOAD_FOLDER'], profile.photo_url)
             if os.path.exists(photo_path):
-                photo_url_for_pdf = pathlib.Path(photo_path).as_uri()
+                # Dérivée d'impression plutôt que l'original (parfois plusieurs mégapixels)
+                photo_url_for_pdf = pathlib.Path(print_image_path(photo_path)).as_uri()
         
         # Récupérer les paramètres de filtre de date depuis la requête
         start_date_str = request.args.get('start_date')
@@ -410,10 +495,11 @@ def profile_pdf(profile_id):
             
         # Utiliser le service de paie pour obtenir les statistiques de performance
         try:
-            performance_summary = get_staff_performance_summary(profile_id, start_date, end_date)
+            performance_summary = get_staff_performance_summary(profile_id, start_date, end_date, staff=profile)
             history_stats = performance_summary['summary_totals']
             detailed_history = performance_summary.get('detailed_history', [])
             contract_calculations = performance_summary['contract_calculations']
+            filtered_assignments = performance_summary['assignments']
         except Exception as e:
             # Fallback en cas d'erreur
             history_stats = {
@@ -426,25 +512,19 @@ def profile_pdf(profile_id):
             }
             detailed_history = []
             contract_calculations = []
+            filtered_assignments = []
             current_app.logger.error(f"Erreur lors du calcul des statistiques de performance pour le PDF: {str(e)}")
 
         # Préparer les assignments avec leurs statistiques pour le PDF
         assignments_with_stats = []
+        calculations_by_assignment = {calc['assignment_id']: calc for calc in contract_calculations}
         
-        # Trier les assignements par date de début (du plus récent au plus ancien)
-        sorted_assignments = sorted(profile.assignments, key=lambda a: a.start_date, reverse=True)
-        
-        # Filtrer les assignements en fonction des dates de filtre
-        if start_date or end_date:
-            sorted_assignments = [
-                a for a in sorted_assignments
-                if (start_date is None or a.end_date >= start_date) and \
-                   (end_date is None or a.start_date <= end_date)
-            ]
+        # Assignments déjà filtrés par période (avec venue chargé), du plus récent au plus ancien
+        sorted_assignments = sorted(filtered_assignments, key=lambda a: a.start_date, reverse=True)
         
         for assignment in sorted_assignments:
             # Chercher les calculs de contrat pour cet assignment
-            assignment_calc = next((calc for calc in contract_calculations if calc['assignment_id'] == assignment.id), None)
+            assignment_calc = calculations_by_assignment.get(assignment.id)
             
             if assignment_calc:
                 assignment_stats = {
@@ -488,20 +568,15 @@ def profile_pdf(profile_id):
                                       filter_start_date=start_date,
                                       filter_end_date=end_date)
         
+        filename = f"profile_{secure_filename(profile.nickname)}_{date.today()}.pdf"
+        
         # Generate PDF with better error handling
         try:
-            pdf = HTML(string=rendered_html).write_pdf()
+            return pdf_response(rendered_html, filename, 'profile', disposition='inline', agency_id=agency_id)
         except Exception as pdf_error:
             current_app.logger.error(f"PDF generation error for profile {profile_id}: {pdf_error}")
             return jsonify({'status': 'error', 'message': 'PDF generation failed. Please try again.'}), 500
         
-        filename = f"profile_{secure_filename(profile.nickname)}_{date.today()}.pdf"
-        
-        response = Response(pdf, mimetype='application/pdf')
-        response.headers['Content-Disposition'] = f'inline; filename="{filename}"'
-        response.headers['Content-Length'] = len(pdf)
-        return response
-        
     except Exception as e:
         current_app.logger.error(f"Error generating PDF for profile {profile_id}: {e}")
         return jsonify({'status': 'error', 'message': 'Failed to generate PDF. Please try again.'}), 500
\ No newline at end of file
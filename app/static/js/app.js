@@ -167,55 +167,154 @@
     }
 
     // -----------------------------
-    // Dispatch Page - Status Filter
+    // Dispatch Page - Status Filter & Staff Search
     // -----------------------------
     const statusFilter = document.getElementById('statusFilter');
     if (statusFilter) {
       const availableList = document.querySelector('.dispatch-list[data-venue="available"]');
       const staffCountSpan = document.getElementById('available-staff-count');
+      const dispatchSearch = document.getElementById('dispatchStaffSearch');
+      // Ids returned by the staff search API, null when the search box is empty
+      let matchingIds = null;
+
+      const applyDispatchFilters = () => {
+        const selectedStatus = statusFilter.value;
+        const staffCards = availableList.querySelectorAll('.dispatch-card');
+        let visibleCount = 0;
+
+        staffCards.forEach(card => {
+          const cardStatus = card.dataset.status;
+          const statusMatch = selectedStatus === 'all' || cardStatus === selectedStatus;
+          const searchMatch = matchingIds === null || matchingIds.has(card.dataset.id);
+          if (statusMatch && searchMatch) {
+            card.style.display = 'flex';
+            visibleCount++;
+          } else {
+            card.style.display = 'none';
+          }
+        });
+
+        staffCountSpan.textContent = visibleCount;
+      };
 
       if (availableList && staffCountSpan) {
-        statusFilter.addEventListener('change', () => {
-          const selectedStatus = statusFilter.value;
-          const staffCards = availableList.querySelectorAll('.dispatch-card');
-          let visibleCount = 0;
-
-          staffCards.forEach(card => {
-            const cardStatus = card.dataset.status;
-            if (selectedStatus === 'all' || cardStatus === selectedStatus) {
-              card.style.display = 'flex';
-              visibleCount++;
-            } else {
-              card.style.display = 'none';
-            }
+        statusFilter.addEventListener('change', applyDispatchFilters);
+
+        if (dispatchSearch) {
+          let searchTimer = null;
+          dispatchSearch.addEventListener('input', () => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => {
+              const query = dispatchSearch.value.trim();
+              if (!query) {
+                matchingIds = null;
+                applyDispatchFilters();
+                return;
+              }
+              fetch(`${dispatchSearch.dataset.searchUrl}?limit=100&q=${encodeURIComponent(query)}`)
+                .then(response => response.json())
+                .then(data => {
+                  // Ignore answers to an outdated query
+                  if (dispatchSearch.value.trim() !== query) return;
+                  matchingIds = new Set((data.results || []).map(staff => String(staff.id)));
+                  applyDispatchFilters();
+                })
+                .catch(error => console.error('Staff search failed:', error));
+            }, 200);
           });
-
-          staffCountSpan.textContent = visibleCount;
-        });
+        }
       }
     }
 
     // -----------------------------
-    // Staff List Page - Status Filter (NEW)
+    // Staff Search Suggestions (staff list, payroll filters)
+    // -----------------------------
+    document.querySelectorAll('input[data-staff-search]').forEach(input => {
+      const suggestions = input.list;
+      let suggestTimer = null;
+      input.addEventListener('input', () => {
+        clearTimeout(suggestTimer);
+        const query = input.value.trim();
+        if (!query || !suggestions) return;
+        suggestTimer = setTimeout(() => {
+          fetch(`${input.dataset.staffSearch}?limit=8&q=${encodeURIComponent(query)}`)
+            .then(response => response.json())
+            .then(data => {
+              suggestions.innerHTML = '';
+              (data.results || []).forEach(staff => {
+                const option = document.createElement('option');
+                option.value = staff.nickname;
+                option.label = [staff.staff_id ? `#${staff.staff_id}` : '', staff.first_name, staff.last_name]
+                  .filter(Boolean).join(' ');
+                suggestions.appendChild(option);
+              });
+            })
+            .catch(error => console.error('Staff search failed:', error));
+        }, 200);
+      });
+    });
+
+    // -----------------------------
+    // Staff List Page - Status Filter (filtered in SQL by the server)
     // -----------------------------
     const staffStatusFilter = document.getElementById('staffStatusFilter');
-    if (staffStatusFilter) {
-        staffStatusFilter.addEventListener('change', () => {
-            const selectedStatus = staffStatusFilter.value;
-
-            // Filter both grid cards and list rows
-            const staffItems = document.querySelectorAll('#staff-grid-view .staff-card, #staff-list-view tr[data-id]');
-
-            staffItems.forEach(item => {
-                const itemStatus = item.dataset.status;
-                if (selectedStatus === 'all' || itemStatus === selectedStatus) {
-                    // Restore original display style (flex for cards, table-row for rows)
-                    item.style.display = ''; 
-                } else {
-                    item.style.display = 'none';
-                }
-            });
-        });
+    if (staffStatusFilter && staffStatusFilter.form) {
+        staffStatusFilter.addEventListener('change', () => staffStatusFilter.form.submit());
+    }
+
+    // -----------------------------
+    // Staff List: Next Pages on Scroll (keyset pages from /staff/api/profiles)
+    // -----------------------------
+    const staffListSentinel = document.getElementById('staffListSentinel');
+    if (staffListSentinel) {
+        const gridView = document.getElementById('staff-grid-view');
+        const listBody = document.querySelector('#staff-list-view .staff-list-table tbody');
+        const countLabel = staffListSentinel.querySelector('span');
+        const loadMoreBtn = staffListSentinel.querySelector('button');
+        let loadingPage = false;
+        let staffObserver = null;
+
+        const loadNextPage = () => {
+            const nextUrl = staffListSentinel.dataset.nextUrl;
+            if (loadingPage || !nextUrl) return;
+            loadingPage = true;
+            loadMoreBtn.disabled = true;
+            fetch(nextUrl)
+                .then(response => {
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                    return response.json();
+                })
+                .then(data => {
+                    gridView.insertAdjacentHTML('beforeend', data.html.grid);
+                    listBody.insertAdjacentHTML('beforeend', data.html.list);
+                    const shown = listBody.querySelectorAll('tr[data-id]').length;
+                    countLabel.textContent = `Showing ${shown} of ${data.total_count} profiles`;
+                    if (data.next_url) {
+                        staffListSentinel.dataset.nextUrl = data.next_url;
+                        // Toujours visible (page courte): observer à nouveau pour enchaîner la page suivante
+                        if (staffObserver) {
+                            staffObserver.unobserve(staffListSentinel);
+                            staffObserver.observe(staffListSentinel);
+                        }
+                    } else {
+                        if (staffObserver) staffObserver.disconnect();
+                        staffListSentinel.remove();
+                    }
+                })
+                .catch(error => console.error('Error loading staff page:', error))
+                .finally(() => {
+                    loadingPage = false;
+                    loadMoreBtn.disabled = false;
+                });
+        };
+
+        loadMoreBtn.addEventListener('click', loadNextPage);
+        if ('IntersectionObserver' in window) {
+            staffObserver = new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) loadNextPage();
+            }, { rootMargin: '400px 0px' });
+            staffObserver.observe(staffListSentinel);
+        }
     }
 
     // -----------------------------
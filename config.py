@@ -11,6 +11,41 @@ class Config:
         'sqlite:///' + os.path.join(basedir, 'data', 'recruitment-dev.db')
     UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
     MAX_CONTENT_LENGTH = 2 * 1024 * 1024 # 2 Megabytes
+    # Durée de vie (s) du cache des règles de contrat compilées, filet de sécurité
+    # pour les autres processus qui ne reçoivent pas l'invalidation
+    CONTRACT_RULES_CACHE_TTL = int(os.environ.get('CONTRACT_RULES_CACHE_TTL', 300))
+    # Cache des pages paie/dashboard/staff: nombre maximum de pages (0 pour désactiver)
+    # et durée de vie maximale (s), invalidé par les écritures de l'agence (version partagée en base)
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 256))
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 120))
+    # Jobs en arrière-plan (recalcul après modification de contrat): threads du processus,
+    # taille des tranches d'assignments, exécution immédiate dans la requête (tests)
+    BACKGROUND_JOB_WORKERS = int(os.environ.get('BACKGROUND_JOB_WORKERS', 1))
+    REDERIVATION_CHUNK_SIZE = int(os.environ.get('REDERIVATION_CHUNK_SIZE', 200))
+    BACKGROUND_JOBS_INLINE = os.environ.get('BACKGROUND_JOBS_INLINE', '').lower() in ('1', 'true')
+    # File de rendu PDF: processus WeasyPrint préchauffés (0 = rendu dans le thread du job),
+    # taille du HTML au-delà de laquelle un PDF passe par la file, dossier et durée de
+    # conservation (s) des PDF produits
+    PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', 2))
+    PDF_INLINE_MAX_BYTES = int(os.environ.get('PDF_INLINE_MAX_BYTES', 200 * 1024))
+    PDF_JOB_FOLDER = os.path.join(basedir, 'data', 'pdf_jobs')
+    PDF_JOB_RETENTION = int(os.environ.get('PDF_JOB_RETENTION', 3600))
+    # Cache disque des PDF rendus, par hash du HTML: dossier et taille maximale (0 pour désactiver)
+    PDF_CACHE_FOLDER = os.path.join(basedir, 'data', 'pdf_cache')
+    PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+    # Dérivées d'impression des photos et logos embarqués dans les PDF: plus petit côté (px) et qualité JPEG
+    PRINT_IMAGE_SIZE = int(os.environ.get('PRINT_IMAGE_SIZE', 400))
+    PRINT_IMAGE_QUALITY = int(os.environ.get('PRINT_IMAGE_QUALITY', 85))
+    # Uploads stockés par contenu: âge minimal (s) d'un fichier non référencé avant que 'flask gc-uploads' le supprime
+    UPLOAD_GC_GRACE = int(os.environ.get('UPLOAD_GC_GRACE', 3600))
+    # Service des uploads: durée de cache (s) des fichiers nommés par leur contenu, et envoi délégué
+    # au proxy ('x-accel-redirect' pour nginx, avec la location interne UPLOAD_ACCEL_PREFIX qui pointe
+    # sur UPLOAD_FOLDER, ou 'x-sendfile'); vide = fichier envoyé par Flask
+    UPLOAD_CACHE_MAX_AGE = int(os.environ.get('UPLOAD_CACHE_MAX_AGE', 365 * 24 * 3600))
+    UPLOAD_SENDFILE_MODE = os.environ.get('UPLOAD_SENDFILE_MODE') or None
+    UPLOAD_ACCEL_PREFIX = os.environ.get('UPLOAD_ACCEL_PREFIX', '/_uploads/')
+    # Liste du staff: profils rendus par le serveur au premier écran, puis par page chargée au défilement
+    STAFF_LIST_PAGE_SIZE = int(os.environ.get('STAFF_LIST_PAGE_SIZE', 50))
 
 class DevelopmentConfig(Config):
     """Configuration for development."""
@@ -45,6 +45,23 @@ target_db = current_app.extensions['migrate'].db
 # ... etc.
 
 
+# Objects of the staff search index (app/services/staff_search.py) are created by DDL
+# events and migration 3a9f5c2e8d14, not by the models: the SQLite FTS5 table with
+# its shadow tables (staff_search_data, _idx, _config, ...) and the pg_trgm index.
+# Autogenerate and 'flask db check' must not see them as tables to drop.
+UNMANAGED_OBJECT_PREFIXES = {
+    'table': ('staff_search',),
+    'index': ('ix_staff_profile_search_trgm',),
+}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if reflected and compare_to is None and name and \
+            name.startswith(UNMANAGED_OBJECT_PREFIXES.get(type_, ())):
+        return False
+    return True
+
+
 def get_metadata():
     if hasattr(target_db, 'metadatas'):
         return target_db.metadatas[None]
@@ -65,7 +82,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -93,6 +111,8 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
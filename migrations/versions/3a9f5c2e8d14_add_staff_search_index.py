@@ -0,0 +1,61 @@
+"""add staff search index
+
+Revision ID: 3a9f5c2e8d14
+Revises: e41a8d6c7b25
+Create Date: 2026-10-17 22:31:54.640218
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3a9f5c2e8d14'
+down_revision = 'e41a8d6c7b25'
+branch_labels = None
+depends_on = None
+
+
+FIELDS = ['nickname', 'staff_id', 'first_name', 'last_name', 'phone', 'line_id', 'instagram']
+COLUMNS = ', '.join(['rowid'] + FIELDS + ['agency_id'])
+
+
+def sqlite_values(prefix):
+    phone = (f"replace(replace(replace(replace(replace(replace(coalesce({prefix}.phone, ''), ' ', ''), '-', ''), "
+             "'+', ''), '(', ''), ')', ''), '.', '')")
+    values = [phone if field == 'phone' else f"{prefix}.{field}" for field in FIELDS]
+    return ', '.join([f"{prefix}.id"] + values + [f"{prefix}.agency_id"])
+
+
+PG_DOCUMENT = "lower(" + " || ' ' || ".join(
+    "regexp_replace(coalesce(phone, ''), '[^0-9]', '', 'g')" if field == 'phone' else f"coalesce({field}, '')"
+    for field in FIELDS
+) + ")"
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS staff_search USING fts5({', '.join(FIELDS)}, "
+                   "agency_id UNINDEXED, tokenize = 'trigram')")
+        op.execute("CREATE TRIGGER IF NOT EXISTS staff_search_insert AFTER INSERT ON staff_profile BEGIN "
+                   f"INSERT INTO staff_search({COLUMNS}) VALUES ({sqlite_values('new')}); END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS staff_search_delete AFTER DELETE ON staff_profile BEGIN "
+                   "DELETE FROM staff_search WHERE rowid = old.id; END")
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS staff_search_update AFTER UPDATE OF {', '.join(FIELDS)}, agency_id "
+                   "ON staff_profile BEGIN DELETE FROM staff_search WHERE rowid = old.id; "
+                   f"INSERT INTO staff_search({COLUMNS}) VALUES ({sqlite_values('new')}); END")
+        op.execute(f"INSERT INTO staff_search({COLUMNS}) SELECT {sqlite_values('staff_profile')} FROM staff_profile")
+    elif dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_staff_profile_search_trgm ON staff_profile "
+                   f"USING gin (({PG_DOCUMENT}) gin_trgm_ops)")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for trigger in ('staff_search_insert', 'staff_search_delete', 'staff_search_update'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS staff_search")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_staff_profile_search_trgm")
@@ -0,0 +1,42 @@
+"""add daily_rollup
+
+Revision ID: 5c1e9a7d2f40
+Revises: 80715a7f439c
+Create Date: 2026-10-17 14:05:12.381904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e9a7d2f40'
+down_revision = '80715a7f439c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # La table est vide après la migration: la remplir avec 'flask rebuild-rollups'
+    op.create_table(
+        'daily_rollup',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('agency_id', sa.Integer(), nullable=False),
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('record_date', sa.Date(), nullable=False),
+        sa.Column('drinks', sa.Integer(), nullable=False),
+        sa.Column('special_commissions', sa.Float(), nullable=False),
+        sa.Column('salary', sa.Float(), nullable=False),
+        sa.Column('commission', sa.Float(), nullable=False),
+        sa.Column('profit', sa.Float(), nullable=False),
+        sa.Column('headcount', sa.Integer(), nullable=False),
+        sa.Column('lateness_minutes', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['agency_id'], ['agency.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('agency_id', 'venue_id', 'record_date', name='uq_rollup_agency_venue_date')
+    )
+
+
+def downgrade():
+    op.drop_table('daily_rollup')
@@ -0,0 +1,38 @@
+"""add is_stale to contract_calculations
+
+Revision ID: 80715a7f439c
+Revises: 2b5d6a264236
+Create Date: 2026-10-17 09:12:41.507112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '80715a7f439c'
+down_revision = '2b5d6a264236'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Les lignes existantes sont considérées comme périmées: elles seront recalculées
+    # une fois au premier affichage de la paie, puis maintenues à jour.
+    with op.batch_alter_table('contract_calculations', schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column('is_stale', sa.Boolean(), nullable=False, server_default=sa.text('true'))
+        )
+
+    with op.batch_alter_table('contract_calculations', schema=None) as batch_op:
+        batch_op.alter_column(
+            'is_stale',
+            server_default=sa.text('false'),
+            existing_type=sa.Boolean(),
+            existing_nullable=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('contract_calculations', schema=None) as batch_op:
+        batch_op.drop_column('is_stale')
@@ -0,0 +1,32 @@
+"""add image placeholders
+
+Revision ID: b7e2c4a91f3d
+Revises: 9d3f6b81c2a7
+Create Date: 2026-10-17 19:05:41.207334
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2c4a91f3d'
+down_revision = '9d3f6b81c2a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('staff_profile', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('photo_placeholder', sa.Text(), nullable=True))
+
+    with op.batch_alter_table('venue', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('logo_placeholder', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('venue', schema=None) as batch_op:
+        batch_op.drop_column('logo_placeholder')
+
+    with op.batch_alter_table('staff_profile', schema=None) as batch_op:
+        batch_op.drop_column('photo_placeholder')
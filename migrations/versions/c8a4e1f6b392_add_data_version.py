@@ -0,0 +1,31 @@
+"""add data_version
+
+Revision ID: c8a4e1f6b392
+Revises: f2c7d93a5e18
+Create Date: 2026-10-18 10:12:37.504218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8a4e1f6b392'
+down_revision = 'f2c7d93a5e18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Table vide après la migration: une agence sans ligne est à la version 0
+    op.create_table(
+        'data_version',
+        sa.Column('agency_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('agency_id')
+    )
+
+
+def downgrade():
+    op.drop_table('data_version')
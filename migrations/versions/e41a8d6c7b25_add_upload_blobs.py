@@ -0,0 +1,50 @@
+"""add upload blobs
+
+Revision ID: e41a8d6c7b25
+Revises: b7e2c4a91f3d
+Create Date: 2026-10-17 21:12:09.583611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41a8d6c7b25'
+down_revision = 'b7e2c4a91f3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'upload_blob',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('store', sa.String(length=20), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('filename', sa.String(length=80), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('store', 'sha256', name='uq_upload_blob_store_sha256')
+    )
+    op.create_table(
+        'upload_reference',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('blob_id', sa.Integer(), nullable=False),
+        sa.Column('owner_type', sa.String(length=30), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['blob_id'], ['upload_blob.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('owner_type', 'owner_id', name='uq_upload_reference_owner')
+    )
+    with op.batch_alter_table('upload_reference', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_upload_reference_blob_id'), ['blob_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('upload_reference', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_upload_reference_blob_id'))
+
+    op.drop_table('upload_reference')
+    op.drop_table('upload_blob')
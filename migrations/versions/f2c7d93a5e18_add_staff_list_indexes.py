@@ -0,0 +1,29 @@
+"""add staff list indexes
+
+Revision ID: f2c7d93a5e18
+Revises: 3a9f5c2e8d14
+Create Date: 2026-10-17 23:48:12.906531
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c7d93a5e18'
+down_revision = '3a9f5c2e8d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('staff_profile', schema=None) as batch_op:
+        batch_op.create_index('ix_staff_profile_agency_created_at', ['agency_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_staff_profile_agency_status', ['agency_id', 'status'], unique=False)
+        batch_op.create_index('ix_staff_profile_agency_dob', ['agency_id', 'dob'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('staff_profile', schema=None) as batch_op:
+        batch_op.drop_index('ix_staff_profile_agency_dob')
+        batch_op.drop_index('ix_staff_profile_agency_status')
+        batch_op.drop_index('ix_staff_profile_agency_created_at')
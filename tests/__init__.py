@@ -1,2 +1,9 @@
 # tests/__init__.py
 # Package de tests pour l'application
+
+import os
+
+# Base des tests choisie avant l'import de config.py: Flask-SQLAlchemy crée le moteur dans
+# create_app(), modifier SQLALCHEMY_DATABASE_URI ensuite n'a plus d'effet (les tests
+# tourneraient sur data/recruitment-dev.db)
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
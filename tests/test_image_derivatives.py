@@ -0,0 +1,87 @@
+# tests/test_image_derivatives.py
+
+import os
+import shutil
+import tempfile
+import unittest
+from PIL import Image
+from app import create_app
+from app.services.image_derivatives import (backfill_derivatives, create_derivatives, derivative_path,
+                                            print_derivative_path, print_image_path)
+
+
+class TestImageDerivatives(unittest.TestCase):
+
+    def setUp(self):
+        """Configuration initiale pour chaque test"""
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+
+    def _image(self, filename, size, mode='RGB'):
+        path = os.path.join(self.folder, filename)
+        Image.new(mode, size, (200, 30, 30) if mode == 'RGB' else (200, 30, 30, 0)).save(path)
+        return path
+
+    def test_print_derivatives(self):
+        """Les images sont réduites en JPEG d'impression, à l'upload, à la demande ou par backfill"""
+        with self.app.app_context():
+            photo = self._image('photo.jpg', (4000, 6000))
+            create_derivatives(photo)
+            with Image.open(print_derivative_path(photo)) as derivative:
+                self.assertEqual((derivative.format, derivative.size), ('JPEG', (400, 600)))
+
+            # Logo transparent plus petit que la taille d'impression: aplati, pas agrandi
+            logo = self._image('logo.png', (120, 80), mode='RGBA')
+            with Image.open(print_image_path(logo)) as derivative:
+                self.assertEqual((derivative.mode, derivative.size), ('RGB', (120, 80)))
+
+            with open(os.path.join(self.folder, 'notes.txt'), 'w') as text_file:
+                text_file.write('not an image')
+            broken = os.path.join(self.folder, 'broken.jpg')
+            with open(broken, 'wb') as broken_file:
+                broken_file.write(b'not a jpeg')
+            self.assertEqual(print_image_path(broken), broken)
+
+            # Le logo n'a que sa dérivée d'impression: le backfill crée ses dérivées web
+            report = backfill_derivatives(self.folder, workers=1)
+            self.assertEqual((report['created'], report['skipped'], report['failed']), (1, 1, 1))
+            report = backfill_derivatives(self.folder, force=True, workers=1)
+            self.assertEqual((report['created'], report['skipped'], report['failed']), (2, 0, 1))
+
+    def test_web_derivatives(self):
+        """Dérivées web WebP/JPEG carrées et aperçu à l'upload, servies via srcset, backfill parallèle"""
+        self.app.config['UPLOAD_FOLDER'] = self.folder
+        with self.app.app_context():
+            photo = self._image('photo.jpg', (3000, 4000))
+            placeholder = create_derivatives(photo)
+            self.assertTrue(placeholder.startswith('data:image/webp;base64,'))
+            self.assertLess(len(placeholder), 400)
+            for name, side in (('thumb', 80), ('card', 240), ('detail', 400)):
+                for ext, image_format in (('webp', 'WEBP'), ('jpg', 'JPEG')):
+                    with Image.open(derivative_path(photo, name, ext)) as derivative:
+                        self.assertEqual((derivative.format, derivative.size), (image_format, (side, side)))
+
+            # Original antérieur au pipeline: dérivée créée à la première requête
+            self._image('old.jpg', (1000, 800))
+            with self.app.test_request_context():
+                from app.staff.routes import photo_srcset
+                srcset = photo_srcset('old.jpg', 'webp')
+            self.assertIn('/staff/uploads/derivatives/thumb/webp/old.jpg 80w', srcset)
+            client = self.app.test_client()
+            response = client.get('/staff/uploads/derivatives/thumb/webp/old.jpg')
+            self.assertEqual((response.status_code, response.mimetype), (200, 'image/webp'))
+            response.close()
+            self.assertEqual(client.get('/staff/uploads/derivatives/huge/webp/old.jpg').status_code, 404)
+
+            for index in range(4):
+                self._image(f'staff_{index}.png', (900, 600))
+            report = backfill_derivatives(self.folder, workers=2)
+            self.assertEqual((report['created'], report['skipped'], report['failed']), (4, 2, 0))
+            self.assertEqual(len(report['placeholders']), 6)
+            self.assertTrue(os.path.exists(derivative_path(os.path.join(self.folder, 'staff_3.png'), 'card', 'webp')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,27 @@
 # tests/test_payroll_service.py
 
+import io
+import os
+import shutil
+import tempfile
 import unittest
+import zipfile
+from unittest.mock import patch
+from sqlalchemy import event
 from datetime import date, datetime, time
 from app import create_app, db
-from app.models import Agency, User, StaffProfile, Venue, AgencyContract, Assignment, PerformanceRecord, ContractCalculations, UserRole
-from app.services.payroll_service import update_or_create_contract_calculations
+from app.models import Agency, User, StaffProfile, Venue, AgencyContract, Assignment, PerformanceRecord, ContractCalculations, UserRole, DailyRollup, DataVersion
+from app.services.payroll_service import (update_or_create_contract_calculations, process_assignments_batch,
+                                          calculate_totals_with_aggregation,
+                                          performance_contribution, apply_performance_delta,
+                                          refresh_stale_calculations, mark_contract_calculations_stale,
+                                          calculate_lateness_penalty, upsert_performance_batch,
+                                          get_staff_performance_summary, generate_performance_stats,
+                                          get_performance_trend, list_payroll_page)
+from app.services.contract_rules import get_contract_rules, invalidate_contract_rules
+from app.services.rollup_service import rebuild_daily_rollups, get_venue_rollups
+from app.services import pdf_renderer
+from app.services.pdf_cache import store_pdf, cached_pdf_path, pdf_cache_key
 
 
 class TestPayrollService(unittest.TestCase):
@@ -14,6 +31,11 @@ class TestPayrollService(unittest.TestCase):
         self.app = create_app()
         self.app.config['TESTING'] = True
         self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        # PDF rendus et fichiers de la file dans un dossier temporaire, jamais dans data/
+        pdf_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pdf_folder)
+        self.app.config.update(PDF_CACHE_FOLDER=os.path.join(pdf_folder, 'cache'),
+                               PDF_JOB_FOLDER=os.path.join(pdf_folder, 'jobs'))
         self.client = self.app.test_client()
         
         with self.app.app_context():
@@ -170,5 +192,529 @@ class TestPayrollService(unittest.TestCase):
             self.assertEqual(db_calc.days_worked, expected_days_worked)
 
 
+    def test_incremental_delta_matches_batch(self):
+        """Les deltas appliqués à chaque écriture donnent les mêmes totaux que le recalcul batch"""
+        with self.app.app_context():
+            assignment = Assignment.query.first()
+            contract = AgencyContract.query.first()
+
+            # Premier record: la ligne ContractCalculations n'existe pas encore, elle est initialisée
+            record1 = PerformanceRecord(assignment_id=assignment.id, record_date=date(2024, 1, 1),
+                                        drinks_sold=5, special_commissions=50.0,
+                                        daily_salary=120.0, daily_profit=700.0)
+            db.session.add(record1)
+            applied = apply_performance_delta(assignment.id, performance_contribution(None, contract),
+                                              performance_contribution(record1, contract), contract)
+            self.assertFalse(applied)
+            db.session.commit()
+
+            # Deuxième record puis modification du premier: deltas SQL
+            record2 = PerformanceRecord(assignment_id=assignment.id, record_date=date(2024, 1, 2),
+                                        drinks_sold=3, special_commissions=30.0,
+                                        daily_salary=20.0, daily_profit=200.0)
+            db.session.add(record2)
+            self.assertTrue(apply_performance_delta(assignment.id, performance_contribution(None, contract),
+                                                    performance_contribution(record2, contract), contract))
+            previous = performance_contribution(record1, contract)
+            record1.drinks_sold = 7
+            record1.daily_profit = 900.0
+            self.assertTrue(apply_performance_delta(assignment.id, previous,
+                                                    performance_contribution(record1, contract), contract))
+            db.session.commit()
+
+            calc = ContractCalculations.query.filter_by(assignment_id=assignment.id).first()
+            incremental = {field: getattr(calc, field) for field in
+                           ('days_worked', 'total_drinks', 'total_special_comm', 'total_salary', 'total_commission', 'total_profit')}
+
+            batch_calc = process_assignments_batch([Assignment.query.get(assignment.id)])[assignment.id]
+            for field, value in incremental.items():
+                self.assertEqual(value, getattr(batch_calc, field), field)
+            self.assertEqual(incremental['total_drinks'], 10)
+            self.assertEqual(incremental['total_commission'], 1000.0)
+            self.assertEqual(incremental['total_profit'], 1100.0)
+
+    def test_aggregation_matches_batch(self):
+        """L'agrégation SQL (commission comprise) donne les mêmes totaux que le calcul batch"""
+        with self.app.app_context():
+            assignment = Assignment.query.first()
+            db.session.add_all([
+                PerformanceRecord(assignment_id=assignment.id, record_date=date(2024, 1, 1),
+                                  drinks_sold=6, special_commissions=40.0, daily_salary=100.0, daily_profit=660.0),
+                PerformanceRecord(assignment_id=assignment.id, record_date=date(2024, 1, 2),
+                                  drinks_sold=0, daily_salary=90.0, daily_profit=-90.0),
+            ])
+            db.session.commit()
+
+            batch = {field: getattr(process_assignments_batch([assignment])[assignment.id], field) for field in
+                     ('days_worked', 'total_drinks', 'total_special_comm', 'total_salary', 'total_commission', 'total_profit')}
+            calc = calculate_totals_with_aggregation([assignment.id])[assignment.id]
+            for field, value in batch.items():
+                self.assertEqual(getattr(calc, field), value, field)
+            self.assertEqual(calc.total_commission, 600.0)
+            self.assertFalse(calc.is_stale)
+
+    def test_compiled_contract_rules_cache(self):
+        """Les règles compilées sont mises en cache et rechargées après invalidation"""
+        with self.app.app_context():
+            rules = get_contract_rules(1, "Test Contract Payroll")
+            self.assertEqual(rules.cutoff_minutes, 19 * 60 + 30)
+            record = PerformanceRecord(arrival_time=time(19, 40))
+            self.assertEqual(rules.lateness_penalty(record.arrival_time), 45.0)
+            self.assertEqual(calculate_lateness_penalty(record, AgencyContract.query.first()), 45.0)
+
+            AgencyContract.query.first().additional_minute_penalty = 10.0
+            db.session.commit()
+            self.assertIs(get_contract_rules(1, "Test Contract Payroll"), rules)
+
+            invalidate_contract_rules(1)
+            self.assertEqual(get_contract_rules(1, "Test Contract Payroll").lateness_penalty(record.arrival_time), 90.0)
+            self.assertIsNone(get_contract_rules(1, "Unknown"))
+
+    def test_bulk_performance_upsert(self):
+        """La saisie groupée insère et met à jour en une transaction et maintient les totaux"""
+        with self.app.app_context():
+            assignment = Assignment.query.first()
+            assignment.status = 'active'
+            db.session.commit()
+
+            # Une entrée invalide: rien n'est écrit
+            result = upsert_performance_batch(1, [
+                {'assignment_id': assignment.id, 'record_date': '2024-01-01', 'drinks_sold': 2},
+                {'assignment_id': assignment.id, 'record_date': '2024-02-01', 'drinks_sold': 2},
+            ])
+            self.assertEqual([error['index'] for error in result['errors']], [1])
+            self.assertEqual(PerformanceRecord.query.count(), 0)
+
+            result = upsert_performance_batch(1, [
+                {'assignment_id': assignment.id, 'record_date': '2024-01-01', 'drinks_sold': 2, 'arrival_time': '19:40'},
+                {'assignment_id': assignment.id, 'record_date': '2024-01-02', 'drinks_sold': 4},
+            ])
+            self.assertEqual((result['created'], result['updated']), (2, 0))
+            self.assertEqual(result['records'][0].lateness_penalty, 45.0)
+            self.assertEqual(result['records'][0].daily_salary, 55.0)
+
+            result = upsert_performance_batch(1, [
+                {'assignment_id': assignment.id, 'record_date': '2024-01-02', 'drinks_sold': 6, 'bonus': 20},
+            ])
+            self.assertEqual((result['created'], result['updated']), (0, 1))
+            self.assertEqual(PerformanceRecord.query.count(), 2)
+
+            calc = ContractCalculations.query.filter_by(assignment_id=assignment.id).first()
+            incremental = {field: getattr(calc, field) for field in
+                           ('days_worked', 'total_drinks', 'total_salary', 'total_commission', 'total_profit')}
+            db.session.expire_all()
+            batch_calc = process_assignments_batch([Assignment.query.get(assignment.id)])[assignment.id]
+            for field, value in incremental.items():
+                self.assertEqual(value, getattr(batch_calc, field), field)
+            self.assertEqual(incremental['total_drinks'], 8)
+
+    def test_daily_rollups_incremental(self):
+        """Les rollups maintenus par delta sont identiques à une reconstruction complète"""
+        with self.app.app_context():
+            assignment = Assignment.query.first()
+            assignment.status = 'active'
+            db.session.commit()
+
+            upsert_performance_batch(1, [
+                {'assignment_id': assignment.id, 'record_date': '2024-01-01', 'drinks_sold': 2, 'arrival_time': '19:40'},
+                {'assignment_id': assignment.id, 'record_date': '2024-01-02', 'drinks_sold': 4},
+            ])
+            upsert_performance_batch(1, [
+                {'assignment_id': assignment.id, 'record_date': '2024-01-01', 'drinks_sold': 3, 'arrival_time': '19:35'},
+            ])
+
+            def snapshot():
+                return {
+                    (row.venue_id, row.record_date): (row.drinks, row.salary, row.commission, row.profit,
+                                                      row.headcount, row.lateness_minutes)
+                    for row in DailyRollup.query.all()
+                }
+
+            incremental = snapshot()
+            self.assertEqual(incremental[(1, date(2024, 1, 1))][0], 3)
+            self.assertEqual(incremental[(1, date(2024, 1, 1))][4:], (1, 5))
+
+            report = rebuild_daily_rollups(1)
+            self.assertEqual((report['records'], report['rows']), (2, 2))
+            self.assertEqual(snapshot(), incremental)
+
+            totals = get_venue_rollups(1, start_date=date(2024, 1, 1), end_date=date(2024, 1, 31))
+            self.assertEqual(len(totals), 1)
+            self.assertEqual((totals[0]['days'], totals[0]['drinks'], totals[0]['commission']), (2, 7, 700.0))
+
+    def test_staff_summary_fixed_query_count(self):
+        """Le résumé d'un staff fait un nombre fixe de requêtes, quelle que soit la longueur de l'historique"""
+        with self.app.app_context():
+            for month in range(2, 6):
+                assignment = Assignment(agency_id=1, staff_id=1, venue_id=1, contract_role="Dancer",
+                                        contract_type="Test Contract Payroll", start_date=date(2024, month, 1),
+                                        end_date=date(2024, month, 10), base_salary=1000.0, status="ended")
+                db.session.add(assignment)
+                db.session.flush()
+                for day in range(1, 11):
+                    db.session.add(PerformanceRecord(assignment_id=assignment.id, record_date=date(2024, month, day),
+                                                     drinks_sold=day, daily_profit=10.0))
+                db.session.add(ContractCalculations(assignment_id=assignment.id, days_worked=10))
+            db.session.commit()
+            db.session.expire_all()
+
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                summary = get_staff_performance_summary(1, start_date=date(2024, 3, 1))
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+
+            self.assertLessEqual(len(statements), 4)
+            self.assertEqual(len(summary['assignments']), 3)
+            self.assertEqual(summary['summary_totals']['total_days_worked'], 30)
+            self.assertEqual(summary['summary_totals']['total_drinks_sold'], 165)
+            self.assertEqual(len(summary['contract_calculations']), 3)
+            self.assertEqual(summary['detailed_history'][0]['venue_name'], "Test Venue Payroll")
+
+    def test_payroll_pdf_fixed_query_count(self):
+        """Le PDF de paie charge staff, venue, manager et totaux avec les assignments (pas de N+1)"""
+        self.app.config.update(PDF_CACHE_MAX_BYTES=0, PDF_INLINE_MAX_BYTES=10 * 1024 * 1024)
+        with self.app.app_context():
+            for day in range(1, 9):
+                staff = StaffProfile(agency_id=1, nickname=f"PDF Staff {day}", dob=date(1995, 1, 1), status="Working")
+                db.session.add(staff)
+                db.session.flush()
+                db.session.add(Assignment(agency_id=1, staff_id=staff.id, managed_by_user_id=1, venue_id=1,
+                                          contract_type="Test Contract Payroll", start_date=date(2024, 2, day),
+                                          end_date=date(2024, 2, day + 9), base_salary=1000.0, status="active"))
+            db.session.commit()
+            engine = db.engine
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = '1'
+        self.assertEqual(self.client.get('/payroll/pdf').status_code, 200)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            response = self.client.get('/payroll/pdf')
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+
+        self.assertEqual(response.mimetype, 'application/pdf')
+        self.assertLessEqual(len(statements), 4)
+
+    def test_payroll_listing_does_not_load_records(self):
+        """La liste complète de la paie lit days_worked dans les totaux, sans charger les records"""
+        self.app.config['RESPONSE_CACHE_MAX_ENTRIES'] = 0
+        with self.app.app_context():
+            for day in range(1, 4):
+                db.session.add(PerformanceRecord(assignment_id=1, record_date=date(2024, 1, day), drinks_sold=1,
+                                                 daily_salary=100.0, daily_profit=20.0))
+            db.session.commit()
+            engine = db.engine
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = '1'
+        self.assertEqual(self.client.get('/payroll/?status=all').status_code, 200)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            response = self.client.get('/payroll/?status=all')
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+
+        self.assertIn(b'data-days-worked="3"', response.data)
+        self.assertFalse([statement for statement in statements if 'performance_record' in statement])
+
+    def test_performance_stats_grouped_queries(self):
+        """Les statistiques du dashboard sont produites en deux requêtes groupées"""
+        with self.app.app_context():
+            db.session.add(Assignment(agency_id=1, staff_id=None, archived_staff_name="Gone", venue_id=1,
+                                      contract_type="Test Contract Payroll", start_date=date(2024, 2, 1),
+                                      end_date=date(2024, 2, 10), base_salary=1000.0, status="ended"))
+            db.session.add(Assignment(agency_id=1, staff_id=1, venue_id=1, contract_type="1day",
+                                      start_date=date(2024, 3, 1), end_date=date(2024, 3, 1),
+                                      base_salary=100.0, status="ended"))
+            db.session.flush()
+            db.session.add_all([
+                ContractCalculations(assignment_id=1, days_worked=4, total_profit=500.0),
+                ContractCalculations(assignment_id=2, days_worked=10, total_profit=-50.0),
+                ContractCalculations(assignment_id=3, days_worked=1, total_profit=20.0),
+            ])
+            db.session.commit()
+
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                stats = generate_performance_stats(Assignment.query.filter_by(agency_id=1))
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+
+            self.assertEqual(len(statements), 2)
+            self.assertEqual(stats['total_profit'], 470.0)
+            self.assertEqual(stats['total_days_worked'], 15)
+            self.assertEqual(stats['total_contracts'], 3)
+            self.assertEqual(stats['unique_staff_count'], 2)
+            # Contrat de 10 jours: 4 jours incomplet, 10 jours complet; "1day" inconnu: 1 jour attendu
+            self.assertEqual(stats['contract_breakdown']['by_status'], {'complete': 2, 'incomplete': 1})
+            self.assertEqual(stats['contract_breakdown']['by_type']['Test Contract Payroll'],
+                             {'count': 2, 'total_profit': 450.0, 'total_days': 14})
+
+    def test_performance_trend_buckets(self):
+        """La tendance est agrégée en SQL par jour, semaine ISO ou mois"""
+        with self.app.app_context():
+            db.session.add(Assignment(agency_id=1, staff_id=1, venue_id=1, contract_type="Test Contract Payroll",
+                                      start_date=date(2024, 1, 25), end_date=date(2024, 2, 3),
+                                      base_salary=1000.0, status="ended"))
+            for assignment_id, day, drinks, penalty in ((1, date(2024, 1, 1), 2, 0.0), (1, date(2024, 1, 7), 3, 45.0),
+                                                        (1, date(2024, 1, 8), 1, 0.0), (2, date(2024, 2, 1), 4, 10.0)):
+                db.session.add(PerformanceRecord(assignment_id=assignment_id, record_date=day, drinks_sold=drinks,
+                                                 lateness_penalty=penalty, daily_profit=100.0))
+            db.session.commit()
+
+            query = Assignment.query.filter_by(agency_id=1)
+            weeks = get_performance_trend(query, 'week')
+            # Le dimanche 7 janvier appartient à la semaine ISO du lundi 1er
+            self.assertEqual([(w['period_start'], w['label'], w['drinks'], w['late_days']) for w in weeks],
+                             [('2024-01-01', '2024-W01', 5, 1), ('2024-01-08', '2024-W02', 1, 0),
+                              ('2024-01-29', '2024-W05', 4, 1)])
+
+            months = get_performance_trend(query, 'month', end_date=date(2024, 1, 31))
+            self.assertEqual([(m['label'], m['days_worked'], m['profit']) for m in months], [('2024-01', 3, 300.0)])
+
+            days = get_performance_trend(query.filter(Assignment.id == 2), 'day')
+            self.assertEqual([(d['period_start'], d['lateness_penalty']) for d in days], [('2024-02-01', 10.0)])
+
+    def test_payroll_keyset_pagination(self):
+        """Le listing paginé parcourt toute la sélection dans l'ordre, avec les totaux de la sélection"""
+        with self.app.app_context():
+            for day, status in ((5, "active"), (1, "ended"), (1, "active"), (3, "archived")):
+                db.session.add(Assignment(agency_id=1, staff_id=1, venue_id=1, contract_type="Test Contract Payroll",
+                                          start_date=date(2024, 3, day), end_date=date(2024, 3, 10),
+                                          base_salary=1000.0, status=status))
+            db.session.flush()
+            db.session.add(PerformanceRecord(assignment_id=2, record_date=date(2024, 3, 5), drinks_sold=2,
+                                             daily_salary=100.0, daily_profit=340.0))
+            db.session.commit()
+
+            query = Assignment.query.filter_by(agency_id=1)
+            seen, cursor = [], None
+            while True:
+                page = list_payroll_page(query, 2, cursor)
+                seen += [row.id for row in page['rows']]
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+
+            # active (4, 2), ended (3), archived (5), puis statut inconnu "ongoing" (1)
+            self.assertEqual(seen, [4, 2, 3, 5, 1])
+            self.assertEqual((page['total_count'], page['total_profit'], page['total_days_worked']), (5, 340.0, 1))
+            self.assertRaises(ValueError, list_payroll_page, query, 2, 'not-a-cursor')
+
+    def test_payroll_page_response_cache(self):
+        """La page de paie est servie depuis le cache jusqu'à la prochaine écriture de l'agence"""
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        with self.app.app_context():
+            Assignment.query.first().status = 'active'
+            db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = '1'
+
+        first = self.client.get('/payroll/?status=all&venue_id=')
+        second = self.client.get('/payroll/?status=all')
+        self.assertEqual(first.data, second.data)
+        cache = self.app.extensions['response_cache']
+        self.assertEqual((cache['hits'], cache['misses']), (1, 1))
+
+        response = self.client.post('/payroll/api/performance', json={
+            'assignment_id': 1, 'record_date': '2024-01-02', 'drinks_sold': 3
+        })
+        self.assertEqual(response.status_code, 200)
+
+        third = self.client.get('/payroll/?status=all')
+        self.assertEqual((cache['hits'], cache['misses']), (1, 2))
+        self.assertIn(b'data-days-worked="1"', third.data)
+
+        # Version partagée en base: l'écriture d'un autre processus invalide les pages de celui-ci
+        with self.app.app_context():
+            db.session.execute(db.update(DataVersion).where(DataVersion.agency_id == 1)
+                               .values(version=DataVersion.version + 1))
+            db.session.commit()
+        self.client.get('/payroll/?status=all')
+        self.client.get('/payroll/?status=all')
+        self.assertEqual((cache['hits'], cache['misses']), (2, 3))
+
+        # Les commandes CLI qui réécrivent les données invalident aussi toutes les agences recalculées
+        self.assertIn('Success!', self.app.test_cli_runner().invoke(args=['rebuild-rollups']).output)
+        self.client.get('/payroll/?status=all')
+        self.assertEqual((cache['hits'], cache['misses']), (2, 4))
+        with self.app.app_context():
+            self.assertEqual(db.session.get(DataVersion, 1).version, 3)
+
+    def test_contract_summary_reads_refresh_only_stale_totals(self):
+        """Résumé et rapport lisent ContractCalculations et ne recalculent que des totaux périmés"""
+        with self.app.app_context():
+            db.session.add(PerformanceRecord(assignment_id=1, record_date=date(2024, 1, 1), drinks_sold=2,
+                                             daily_salary=100.0, daily_profit=140.0))
+            db.session.add(ContractCalculations(assignment_id=1, total_salary=999.0, is_stale=True))
+            db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = '1'
+
+        with patch('app.services.payroll_service.update_or_create_contract_calculations',
+                   side_effect=AssertionError('deprecated writer')):
+            data = self.client.get('/payroll/api/assignment/1/summary').get_json()
+            self.assertEqual((data['total_salary'], data['total_commission'], data['days_worked']), (100.0, 200.0, 1))
+            with self.app.app_context():
+                calc = ContractCalculations.query.filter_by(assignment_id=1).one()
+                self.assertFalse(calc.is_stale)
+                calc.total_salary = 123.0
+                db.session.commit()
+
+            # Totaux à jour: lus tels quels, sans recalcul
+            self.assertEqual(self.client.get('/payroll/api/assignment/1/summary').get_json()['total_salary'], 123.0)
+            self.assertEqual(self.client.get('/payroll/report/view/1').status_code, 200)
+            with self.app.app_context():
+                self.assertEqual(ContractCalculations.query.filter_by(assignment_id=1).one().total_salary, 123.0)
+
+    def test_agency_import_marks_totals_stale(self):
+        """Les totaux importés sont marqués périmés puis recalculés depuis les records importés"""
+        from app.services.agency_management_service import AgencyManagementService
+        with self.app.app_context():
+            result = AgencyManagementService.import_agency_data({
+                'agency': {'name': 'Imported Payroll'},
+                'assignments': [{'id': 7, 'contract_type': 'none', 'start_date': '2024-01-01',
+                                 'end_date': '2024-01-10', 'base_salary': 1000.0, 'status': 'ended'}],
+                'performance_records': [{'assignment_id': 7, 'record_date': f'2024-01-0{day}', 'drinks_sold': 1,
+                                         'daily_salary': 100.0, 'daily_profit': 20.0} for day in (1, 2)],
+                'contract_calculations': [{'assignment_id': 7, 'total_salary': 100.0, 'days_worked': 1}],
+            })
+            self.assertTrue(result['success'])
+            assignment = Assignment.query.filter_by(agency_id=result['agency_id']).one()
+            self.assertTrue(assignment.contract_calculations.is_stale)
+
+            calc = refresh_stale_calculations([assignment])[assignment.id]
+            self.assertEqual((calc.total_salary, calc.days_worked, calc.is_stale), (200.0, 2, False))
+
+    def test_assignment_pdf_render_queue(self):
+        """Un PDF au-delà de PDF_INLINE_MAX_BYTES passe par la file: job, statut puis téléchargement"""
+        pdf_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pdf_folder)
+        self.app.config.update(BACKGROUND_JOBS_INLINE=True, PDF_RENDER_WORKERS=0, PDF_INLINE_MAX_BYTES=0,
+                               PDF_JOB_FOLDER=pdf_folder, PDF_CACHE_MAX_BYTES=0)
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = '1'
+
+        response = self.client.get('/payroll/assignment/1/pdf', headers={'Accept': 'application/json'})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['job_id']
+
+        status = self.client.get(f'/pdf/jobs/{job_id}').get_json()
+        self.assertEqual((status['status'], status['progress_done']), ('done', 1))
+        download = self.client.get(status['download_url'])
+        self.assertEqual(download.status_code, 200)
+        self.assertTrue(download.data.startswith(b'%PDF'))
+        # Seul le PDF reste dans le dossier (le HTML de spool est supprimé)
+        self.assertEqual(os.listdir(pdf_folder), [f'job_{job_id}.pdf'])
+
+        # Petit document: rendu directement dans la requête
+        self.app.config['PDF_INLINE_MAX_BYTES'] = 10 * 1024 * 1024
+        self.assertEqual(self.client.get('/payroll/assignment/1/pdf').mimetype, 'application/pdf')
+
+    def test_pdf_render_cache(self):
+        """Un PDF déjà rendu pour le même HTML est servi depuis le disque, avec ETag et 304"""
+        cache_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_folder)
+        self.app.config.update(PDF_CACHE_FOLDER=cache_folder, PDF_CACHE_MAX_BYTES=1024 * 1024)
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = '1'
+
+        with patch('app.services.pdf_queue.render_pdf', return_value=b'%PDF-1.7 report') as render_pdf:
+            first = self.client.get('/payroll/assignment/1/pdf')
+            second = self.client.get('/payroll/assignment/1/pdf')
+            self.assertEqual(render_pdf.call_count, 1)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second.headers['ETag'], first.headers['ETag'])
+        self.assertIn('attachment', second.headers['Content-Disposition'])
+
+        revalidated = self.client.get('/payroll/assignment/1/pdf', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+
+        # Éviction LRU: le fichier le moins récemment utilisé part en premier
+        with self.app.test_request_context():
+            self.app.config['PDF_CACHE_MAX_BYTES'] = 2500
+            old_key = first.headers['ETag'].strip('"')
+            os.utime(os.path.join(cache_folder, f'{old_key}.pdf'), (0, 0))
+            store_pdf('a' * 64, b'x' * 1000)
+            store_pdf('b' * 64, b'x' * 1000)
+            os.utime(os.path.join(cache_folder, 'a' * 64 + '.pdf'), (100, 100))
+            os.utime(os.path.join(cache_folder, 'b' * 64 + '.pdf'), (50, 50))
+            store_pdf('c' * 64, b'x' * 1000)
+            self.assertIsNone(cached_pdf_path(old_key))
+            self.assertIsNone(cached_pdf_path('b' * 64))
+            self.assertIsNotNone(cached_pdf_path('a' * 64))
+
+    def test_assignment_pdf_batch_zip(self):
+        """L'export ZIP contient un rapport par assignment filtré et suit sa progression"""
+        self.app.config.update(PDF_RENDER_WORKERS=0, PDF_CACHE_MAX_BYTES=0)
+        with self.app.app_context():
+            db.session.add(Assignment(agency_id=1, staff_id=1, managed_by_user_id=1, venue_id=1,
+                                      contract_type="Test Contract Payroll", start_date=date(2024, 2, 1),
+                                      end_date=date(2024, 2, 10), base_salary=1000.0, status="ended"))
+            db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = '1'
+
+        response = self.client.get('/payroll/pdf/batch?status=ended')
+        self.assertEqual(response.mimetype, 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+            self.assertEqual(archive.namelist(), ['2_report_Test Staff Payroll_2024-02-01.pdf'])
+            self.assertTrue(archive.read(archive.namelist()[0]).startswith(b'%PDF'))
+
+        progress = self.client.get(response.headers['X-Progress-Url']).get_json()
+        self.assertEqual((progress['status'], progress['progress_done'], progress['progress_total']), ('done', 1, 1))
+
+    def test_pdf_renderer_shares_parsed_stylesheets(self):
+        """Les feuilles de style des PDF sont analysées une fois par processus et appliquées à chaque rendu"""
+        with patch('app.services.pdf_renderer.CSS') as css_class, patch('app.services.pdf_renderer.HTML') as html_class, \
+                patch.dict(pdf_renderer._stylesheets, clear=True):
+            pdf_renderer.render_pdf('<p>1</p>', 'assignment')
+            pdf_renderer.render_pdf('<p>2</p>', 'assignment')
+            self.assertEqual(css_class.call_count, 1)
+            self.assertEqual(html_class.return_value.write_pdf.call_args.kwargs,
+                             {'stylesheets': [css_class.return_value], 'font_config': pdf_renderer.font_config()})
+
+        for filename in pdf_renderer.PDF_STYLESHEETS.values():
+            self.assertTrue(os.path.exists(os.path.join(pdf_renderer.STYLESHEET_FOLDER, filename)))
+        # La clé du cache des PDF suit la feuille de style appliquée
+        self.assertNotEqual(pdf_cache_key('<p></p>', 'assignment'), pdf_cache_key('<p></p>', 'profile'))
+
+    def test_refresh_only_recomputes_stale(self):
+        """Seuls les totaux marqués is_stale sont recalculés après un changement de règles"""
+        with self.app.app_context():
+            assignment = Assignment.query.first()
+            db.session.add(PerformanceRecord(assignment_id=assignment.id, record_date=date(2024, 1, 1),
+                                             drinks_sold=4, daily_salary=100.0, daily_profit=380.0))
+            db.session.commit()
+            process_assignments_batch([assignment])
+
+            # Totaux à jour: rien à recalculer
+            calc = refresh_stale_calculations([assignment])[assignment.id]
+            self.assertFalse(calc.is_stale)
+            self.assertEqual(calc.total_commission, 400.0)
+
+            # Changement de commission dans le contrat -> totaux périmés puis recalculés
+            AgencyContract.query.first().staff_commission = 50.0
+            self.assertEqual(mark_contract_calculations_stale(assignment.agency_id, contract_types=[assignment.contract_type]), 1)
+            db.session.commit()
+            db.session.expire_all()
+
+            assignment = Assignment.query.first()
+            self.assertTrue(assignment.contract_calculations.is_stale)
+            calc = refresh_stale_calculations([assignment])[assignment.id]
+            self.assertFalse(calc.is_stale)
+            self.assertEqual(calc.total_commission, 200.0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,250 @@
+# tests/test_recalculation_engine.py
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, time
+from unittest.mock import patch
+from app import create_app, db
+from config import Config
+from app.models import (Agency, StaffProfile, Venue, AgencyContract, Assignment, PerformanceRecord, ContractCalculations,
+                        BackgroundJob, User)
+from app.services.payroll_service import calculate_daily_performance, update_or_create_contract_calculations
+from app.services.contract_rules import get_contract_rules
+from app.services.recalculation_engine import (recalculate_agency_contracts, partition_assignments, recalculate_parallel,
+                                              simulate_contract_rules, enqueue_contract_rederivation,
+                                              load_agency_columns, build_rule_table, compute_daily_values)
+
+
+class TestRecalculationEngine(unittest.TestCase):
+
+    def setUp(self):
+        """Configuration initiale pour chaque test"""
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+
+        with self.app.app_context():
+            db.create_all()
+            self._create_test_data()
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _create_test_data(self):
+        """Deux contrats aux règles différentes, dont un assignment sans contrat ni records"""
+        db.session.add(Agency(name="Test Agency Engine"))
+        db.session.add(StaffProfile(agency_id=1, nickname="Engine Staff", dob=date(1995, 5, 5)))
+        db.session.add(Venue(name="Engine Venue", agency_id=1))
+        db.session.add(AgencyContract(name="10days", days=10, agency_id=1, late_cutoff_time="19:30",
+                                      first_minute_penalty=50.0, additional_minute_penalty=5.0,
+                                      drink_price=220.0, staff_commission=100.0))
+        db.session.add(AgencyContract(name="1month", days=30, agency_id=1, late_cutoff_time="20:00",
+                                      first_minute_penalty=0.0, additional_minute_penalty=10.0,
+                                      drink_price=250.0, staff_commission=120.0))
+        for contract_type, base_salary in (("10days", 1000.0), ("1month", 9000.0), ("unknown", 300.0)):
+            db.session.add(Assignment(agency_id=1, staff_id=1, venue_id=1, contract_type=contract_type,
+                                      start_date=date(2024, 1, 1), end_date=date(2024, 1, 30),
+                                      base_salary=base_salary, status="active"))
+        db.session.flush()
+
+        arrivals = [time(19, 0), time(19, 31), time(20, 15), None]
+        for assignment_id in (1, 2):
+            for day, arrival in enumerate(arrivals, start=1):
+                db.session.add(PerformanceRecord(assignment_id=assignment_id, record_date=date(2024, 1, day),
+                                                 arrival_time=arrival, drinks_sold=day, special_commissions=10.0 * day,
+                                                 bonus=5.0, malus=2.0))
+        db.session.commit()
+
+    def test_bulk_matches_per_assignment_calculation(self):
+        """Le moteur vectorisé produit les mêmes totaux que update_or_create_contract_calculations"""
+        with self.app.app_context():
+            expected = {}
+            for assignment in Assignment.query.all():
+                calc = update_or_create_contract_calculations(assignment.id)
+                expected[assignment.id] = (calc.total_salary, calc.total_commission, calc.total_profit,
+                                           calc.days_worked, calc.total_drinks, calc.total_special_comm)
+            ContractCalculations.query.delete()
+            db.session.commit()
+
+            report = recalculate_agency_contracts(1)
+            self.assertEqual(report['assignments'], 3)
+            self.assertEqual(report['records'], 8)
+
+            for calc in ContractCalculations.query.all():
+                actual = (calc.total_salary, calc.total_commission, calc.total_profit,
+                          calc.days_worked, calc.total_drinks, calc.total_special_comm)
+                for value, expected_value in zip(actual, expected[calc.assignment_id]):
+                    self.assertAlmostEqual(value, expected_value, places=6)
+                self.assertFalse(calc.is_stale)
+
+            # Deuxième passage: upsert sur les lignes existantes
+            self.assertEqual(recalculate_agency_contracts(1)['assignments'], 3)
+            self.assertEqual(ContractCalculations.query.count(), 3)
+
+    def test_partitioned_recalculation(self):
+        """Le recalcul par tranches d'IDs couvre tous les assignments avec les mêmes totaux"""
+        with self.app.app_context():
+            self.assertEqual(partition_assignments(chunk_size=2), [(1, 1, 2), (1, 3, 3)])
+
+            recalculate_agency_contracts(1)
+            expected = {calc.assignment_id: (calc.total_salary, calc.total_profit) for calc in ContractCalculations.query.all()}
+            ContractCalculations.query.delete()
+            db.session.commit()
+
+            # Base en mémoire: exécuté dans le processus courant
+            report = recalculate_parallel(chunk_size=2, workers=4)
+            self.assertEqual((report['partitions'], report['workers']), (2, 1))
+            self.assertEqual((report['assignments'], report['records']), (3, 8))
+            actual = {calc.assignment_id: (calc.total_salary, calc.total_profit) for calc in ContractCalculations.query.all()}
+            self.assertEqual(actual, expected)
+
+        # Base SQLite dans un fichier temporaire: les workers forkés la partagent (URI posée sur la
+        # classe de configuration avant create_app, relue par create_app dans chaque worker)
+        db_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, db_folder)
+        with patch.object(Config, 'SQLALCHEMY_DATABASE_URI', 'sqlite:///' + os.path.join(db_folder, 'engine.db')):
+            file_app = create_app()
+            with file_app.app_context():
+                db.create_all()
+                self._create_test_data()
+                report = recalculate_parallel(chunk_size=2, workers=4)
+                self.assertEqual((report['partitions'], report['workers'], report['serialized_writer']), (2, 2, True))
+                self.assertEqual((report['assignments'], report['records']), (3, 8))
+                actual = {calc.assignment_id: (calc.total_salary, calc.total_profit)
+                          for calc in ContractCalculations.query.all()}
+                self.assertEqual(actual, expected)
+                db.session.remove()
+                db.engine.dispose()
+
+
+    def test_simulation_reprices_without_writing(self):
+        """La simulation compare règles actuelles et proposées par type de contrat et venue, sans écrire"""
+        with self.app.app_context():
+            recalculate_agency_contracts(1)
+            expected_profit = sum(calc.total_profit for calc in ContractCalculations.query.all())
+
+            report = simulate_contract_rules(1, {"10days": {"drink_price": 250.0, "late_cutoff_time": "20:00"}})
+            self.assertEqual(report['records'], 8)
+            self.assertAlmostEqual(report['totals']['profit']['current'], expected_profit, places=6)
+
+            by_type = {row['contract_type']: row for row in report['by_contract_type']}
+            self.assertEqual(set(by_type), {"10days", "1month"})
+            # 10 drinks à +30; arrivées 19:31 et 20:15: pénalités 50 + 270 -> 0 + 120
+            self.assertAlmostEqual(by_type["10days"]['revenue']['delta'], 300.0)
+            self.assertAlmostEqual(by_type["10days"]['lateness_penalty']['delta'], -200.0)
+            self.assertAlmostEqual(by_type["1month"]['profit']['delta'], 0.0)
+            self.assertEqual(report['by_venue'][0]['venue_id'], 1)
+
+            self.assertEqual(AgencyContract.query.filter_by(name="10days").first().drink_price, 220.0)
+            self.assertRaises(ValueError, simulate_contract_rules, 1, {"unknown": {"days": 5}})
+
+    def test_contract_rederivation_job(self):
+        """Le job de recalcul réécrit les records et les totaux des contrats modifiés, par tranches"""
+        self.app.config['BACKGROUND_JOBS_INLINE'] = True
+        self.app.config['REDERIVATION_CHUNK_SIZE'] = 1
+        with self.app.app_context():
+            recalculate_agency_contracts(1)
+            AgencyContract.query.filter_by(name="10days").first().late_cutoff_time = "20:00"
+            db.session.commit()
+
+            job = enqueue_contract_rederivation(1, ["10days", "unknown"])
+            self.assertEqual(job.status, 'done')
+            self.assertEqual((job.progress_done, job.progress_total), (2, 2))
+            self.assertEqual(job.to_dict()['result']['records'], 4)
+
+            # 19:31 n'est plus en retard, 20:15 coûte 50 + 14 * 5
+            record = PerformanceRecord.query.filter_by(assignment_id=1, record_date=date(2024, 1, 3)).first()
+            self.assertAlmostEqual(record.lateness_penalty, 120.0)
+            self.assertAlmostEqual(record.daily_salary, 100.0 + 5.0 - 2.0 - 120.0)
+            calc = ContractCalculations.query.filter_by(assignment_id=1).first()
+            self.assertAlmostEqual(calc.total_salary, sum(r.daily_salary for r in
+                                   PerformanceRecord.query.filter_by(assignment_id=1)))
+            self.assertEqual(BackgroundJob.query.count(), 1)
+
+    def test_vectorized_values_match_live_entry(self):
+        """Sans contrat ou avec days=0, le moteur vectorisé calcule comme la saisie unitaire"""
+        self.app.config['BACKGROUND_JOBS_INLINE'] = True
+        with self.app.app_context():
+            db.session.add(AgencyContract(name="zero", days=0, agency_id=1, late_cutoff_time="19:30",
+                                          first_minute_penalty=50.0, additional_minute_penalty=5.0,
+                                          drink_price=200.0, staff_commission=80.0))
+            db.session.add(Assignment(agency_id=1, staff_id=1, venue_id=1, contract_type="zero",
+                                      start_date=date(2024, 1, 1), end_date=date(2024, 1, 30),
+                                      base_salary=500.0, status="active"))
+            for assignment_id in (3, 4):
+                for day, arrival in enumerate([time(19, 45), None], start=1):
+                    db.session.add(PerformanceRecord(assignment_id=assignment_id, record_date=date(2024, 1, day),
+                                                     arrival_time=arrival, drinks_sold=3, special_commissions=15.0,
+                                                     bonus=5.0, malus=2.0))
+            db.session.commit()
+
+            def live_values(record):
+                assignment = db.session.get(Assignment, record.assignment_id)
+                return calculate_daily_performance(
+                    assignment.base_salary, get_contract_rules(1, assignment.contract_type), record.arrival_time,
+                    record.drinks_sold, record.special_commissions, record.bonus, record.malus
+                )
+
+            records = PerformanceRecord.query.filter(PerformanceRecord.assignment_id.in_([3, 4])) \
+                .order_by(PerformanceRecord.assignment_id, PerformanceRecord.record_date).all()
+            expected = {record.id: live_values(record) for record in records}
+            # Sans contrat: 300 / 1 jour, commission de 100 par boisson; days=0: pas de salaire de base
+            self.assertAlmostEqual(expected[records[0].id]['daily_salary'], 300.0 + 5.0 - 2.0)
+            self.assertAlmostEqual(expected[records[0].id]['daily_profit'], 3 * 220.0 + 15.0 - 303.0 - 3 * 100.0)
+            self.assertAlmostEqual(expected[records[2].id]['daily_salary'], 5.0 - 2.0 - 120.0)
+
+            columns = load_agency_columns(1, assignment_ids=[3, 4])
+            daily = compute_daily_values(columns, build_rule_table(AgencyContract.query.filter_by(agency_id=1).all()))
+            for index, record_id in enumerate(columns['record_ids']):
+                for key in ('lateness_penalty', 'daily_salary', 'daily_commission', 'daily_profit'):
+                    self.assertAlmostEqual(float(daily[key][index]), expected[int(record_id)][key])
+
+            # Le job de recalcul réécrit les records avec les mêmes valeurs, sauf ceux d'un nom
+            # sans contrat qu'il laisse tels quels
+            stored = {record.id: record.daily_salary for record in records}
+            enqueue_contract_rederivation(1, ["unknown", "zero"])
+            for record in records:
+                db.session.refresh(record)
+                for key in ('lateness_penalty', 'daily_salary', 'daily_profit'):
+                    if record.assignment_id == 4:
+                        self.assertAlmostEqual(getattr(record, key), expected[record.id][key])
+                self.assertEqual(record.daily_salary != stored[record.id], record.assignment_id == 4)
+
+    def test_contract_rename_keeps_record_values(self):
+        """Renommer un contrat ne reprend pas les records de l'ancien nom sans règles"""
+        self.app.config.update(BACKGROUND_JOBS_INLINE=True, WTF_CSRF_ENABLED=False)
+        with self.app.app_context():
+            enqueue_contract_rederivation(1, ["10days", "1month"])
+            user = User(username="engine_admin", role="super_admin", agency_id=1)
+            user.set_password("x")
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+            contract_id = AgencyContract.query.filter_by(name="1month").one().id
+            record = PerformanceRecord.query.filter_by(assignment_id=2, record_date=date(2024, 1, 1)).one()
+            self.assertAlmostEqual(record.daily_salary, 9000.0 / 30 + 5.0 - 2.0)
+            salaries = {r.id: r.daily_salary for r in PerformanceRecord.query.filter_by(assignment_id=2)}
+            total_salary = ContractCalculations.query.filter_by(assignment_id=2).one().total_salary
+
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+        response = client.put('/auth/api/contracts', json={'id': contract_id, 'name': 'Monthly'})
+        self.assertEqual(response.status_code, 200)
+
+        with self.app.app_context():
+            self.assertEqual(db.session.get(BackgroundJob, response.get_json()['job_id']).status, 'done')
+            self.assertEqual({r.id: r.daily_salary for r in PerformanceRecord.query.filter_by(assignment_id=2)},
+                             salaries)
+            calc = ContractCalculations.query.filter_by(assignment_id=2).one()
+            self.assertAlmostEqual(calc.total_salary, total_salary)
+            self.assertFalse(calc.is_stale)
+
+
+if __name__ == '__main__':
+    unittest.main()
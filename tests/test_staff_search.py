@@ -0,0 +1,125 @@
+# tests/test_staff_search.py
+
+import re
+import unittest
+from datetime import date
+from app import create_app, db
+from app.models import Agency, Assignment, StaffProfile, User
+from app.services.staff_listing import list_staff_page
+from app.services.staff_search import rebuild_search_index, search_staff, search_terms, staff_search_ids
+
+
+class TestStaffSearch(unittest.TestCase):
+
+    def setUp(self):
+        """Configuration initiale pour chaque test"""
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+
+        with self.app.app_context():
+            db.create_all()
+            db.session.add_all([Agency(name="Search Agency"), Agency(name="Other Agency")])
+            db.session.flush()
+            db.session.add_all([
+                StaffProfile(agency_id=1, nickname='Mai', first_name='Somchai', staff_id='A17',
+                             phone='081-234-5678', instagram='mai.official', dob=date(1998, 1, 1)),
+                StaffProfile(agency_id=1, nickname='Maiko', line_id='maiko_line', phone='+66 89 000 1111',
+                             dob=date(1998, 1, 1)),
+                StaffProfile(agency_id=1, nickname='Ploy', last_name='Maitree', dob=date(1998, 1, 1)),
+                StaffProfile(agency_id=2, nickname='Mai', dob=date(1998, 1, 1)),
+            ])
+            db.session.commit()
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _nicknames(self, query, agency_id=1):
+        return [profile.nickname for profile in search_staff(agency_id, query)]
+
+    def test_indexed_multi_field_search(self):
+        """Recherche classée sur tous les champs, index FTS5 tenu à jour par les écritures"""
+        with self.app.app_context():
+            self.assertEqual(search_terms(' @Mai.Official 081-234 '), ['mai.official', '081234'])
+            self.assertEqual(self._nicknames('mai')[0], 'Mai')
+            self.assertEqual(sorted(self._nicknames('mai')), ['Mai', 'Maiko', 'Ploy'])
+            self.assertEqual(self._nicknames('0812345678'), ['Mai'])
+            self.assertEqual(self._nicknames('89 000'), ['Maiko'])
+            self.assertEqual(self._nicknames('@mai.official'), ['Mai'])
+            self.assertEqual(self._nicknames('maiko_line'), ['Maiko'])
+            self.assertEqual(self._nicknames('somchai a17'), ['Mai'])
+            self.assertEqual(self._nicknames('a1'), ['Mai'])
+            self.assertEqual(self._nicknames('50%'), [])
+            self.assertEqual(self._nicknames('mai', agency_id=2), ['Mai'])
+
+            # Index synchronisé par les triggers sur insert, update et delete
+            ploy = StaffProfile.query.filter_by(nickname='Ploy').one()
+            ploy.nickname, ploy.last_name = 'Fern', None
+            db.session.commit()
+            self.assertEqual(self._nicknames('fern'), ['Fern'])
+            self.assertNotIn('Fern', self._nicknames('mai'))
+            db.session.delete(StaffProfile.query.filter_by(nickname='Maiko').one())
+            db.session.commit()
+            self.assertEqual(self._nicknames('mai'), ['Mai'])
+            self.assertEqual(rebuild_search_index(), 3)
+
+            # Même sous-requête pour filtrer les assignments (filtres de la paie)
+            mai = StaffProfile.query.filter_by(agency_id=1, nickname='Mai').one()
+            db.session.add(Assignment(agency_id=1, staff_id=mai.id, contract_type='1day',
+                                      start_date=date(2024, 1, 1), end_date=date(2024, 1, 1), base_salary=0))
+            db.session.commit()
+            self.assertEqual(Assignment.query.filter(Assignment.staff_id.in_(staff_search_ids(1, 'A17'))).count(), 1)
+            self.assertIsNone(staff_search_ids(1, '   '))
+
+    def test_staff_list_keyset_pages(self):
+        """Pages keyset sans doublon ni trou (NULL compris), statut filtré en SQL, API paginée"""
+        with self.app.app_context():
+            db.session.add_all([StaffProfile(agency_id=1, nickname=f'Extra{i}', dob=date(1998, 1, 1),
+                                             status='Rejected' if i % 2 else 'Active',
+                                             preferred_position=None if i % 3 else 'Dancer') for i in range(5)])
+            user = User(username='lister', role='super_admin', agency_id=1)
+            user.set_password('x')
+            db.session.add(user)
+            db.session.commit()
+            expected = sorted(profile.id for profile in StaffProfile.query.filter_by(agency_id=1))
+
+            for sort_by, sort_order in (('preferred_position', 'asc'), ('preferred_position', 'desc'),
+                                        ('nickname', 'asc'), ('age', 'desc')):
+                seen, cursor = [], None
+                while True:
+                    page = list_staff_page(1, sort_by, sort_order, page_size=3, after=cursor)
+                    seen += [profile.id for profile in page['profiles']]
+                    cursor = page['next_cursor']
+                    if cursor is None:
+                        break
+                self.assertEqual(sorted(seen), expected)
+                self.assertEqual(page['total_count'], len(expected))
+
+            page = list_staff_page(1, 'nickname', 'asc', page_size=3)
+            self.assertEqual([profile.nickname for profile in page['profiles']], ['Extra0', 'Extra1', 'Extra2'])
+            page = list_staff_page(1, 'nickname', 'asc', statuses=['Rejected'], search='extra', page_size=10)
+            self.assertEqual([profile.nickname for profile in page['profiles']], ['Extra1', 'Extra3'])
+            self.assertRaises(ValueError, list_staff_page, 1, after='not-a-cursor')
+            user_id = user.id
+
+        self.app.config['STAFF_LIST_PAGE_SIZE'] = 6
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+        first = client.get('/staff/?sort_by=nickname&sort_order=asc').get_data(as_text=True)
+        self.assertEqual(first.count('<tr data-id'), 6)
+        data = client.get(re.search(r'data-next-url="([^"]+)"', first).group(1).replace('&amp;', '&')).get_json()
+        self.assertEqual(([profile['nickname'] for profile in data['profiles']], data['next_url']),
+                         (['Maiko', 'Ploy'], None))
+        data = client.get('/staff/api/profiles?sort_by=nickname&sort_order=asc&page_size=6').get_json()
+        self.assertEqual(len(data['profiles']), 6)
+        self.assertEqual(data['html']['list'].count('<tr data-id'), 6)
+        self.assertEqual(client.get(data['next_url']).get_json()['profiles'][0]['nickname'], 'Maiko')
+        self.assertEqual(client.get('/staff/api/profiles?status=Nope').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
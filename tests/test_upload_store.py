@@ -0,0 +1,143 @@
+# tests/test_upload_store.py
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from app import create_app, db
+from app.models import Agency, StaffProfile, UploadBlob, UploadReference
+from app.services.image_derivatives import derivative_path
+from app.services.upload_store import (PHOTO_STORE, STAFF_PHOTO, collect_garbage, rekey_uploads, set_reference,
+                                       store_image_upload)
+
+
+class TestUploadStore(unittest.TestCase):
+
+    def setUp(self):
+        """Configuration initiale pour chaque test"""
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.app.config['UPLOAD_FOLDER'] = self.folder
+
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(Agency(name="Test Agency Uploads"))
+            db.session.commit()
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _jpeg(self, color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 800), color).save(buffer, 'JPEG')
+        return buffer.getvalue()
+
+    def _upload(self, profile, data, filename):
+        blob, profile.photo_placeholder = store_image_upload(FileStorage(io.BytesIO(data), filename), PHOTO_STORE)
+        profile.photo_url = blob.filename
+        db.session.flush()
+        set_reference(STAFF_PHOTO, profile.id, blob)
+        db.session.commit()
+        return blob
+
+    def test_content_addressed_uploads(self):
+        """Contenu identique stocké une fois, ancien fichier ramassé, dossier existant migré"""
+        with self.app.app_context():
+            red, blue = self._jpeg((200, 30, 30)), self._jpeg((30, 30, 200))
+            first = StaffProfile(agency_id=1, nickname='first', dob=date(1995, 1, 1))
+            second = StaffProfile(agency_id=1, nickname='second', dob=date(1995, 1, 1))
+            db.session.add_all([first, second])
+            db.session.flush()
+
+            blob = self._upload(first, red, 'IMG_0001.JPEG')
+            self.assertRegex(blob.filename, r'^[0-9a-f]{64}\.jpg$')
+            self.assertEqual(self._upload(second, red, 'copy.jpg').id, blob.id)
+            self.assertEqual((UploadBlob.query.count(), UploadReference.query.count()), (1, 2))
+            self.assertTrue(second.photo_placeholder)
+
+            # Les deux profils changent de photo: l'ancienne n'est plus référencée
+            self._upload(first, blue, 'new.jpg')
+            self._upload(second, blue, 'new.jpg')
+            old_path = os.path.join(self.folder, blob.filename)
+            self.assertEqual(collect_garbage(grace=0, dry_run=True)['blobs'], 1)
+            self.assertTrue(os.path.exists(old_path))
+            report = collect_garbage(grace=0)
+            self.assertEqual(report['blobs'], 1)
+            self.assertFalse(os.path.exists(old_path) or os.path.exists(derivative_path(old_path, 'thumb', 'webp')))
+            self.assertEqual(UploadBlob.query.count(), 1)
+
+            # Ancien dossier: la même image sous deux préfixes uuid
+            for name in ('aaa_photo.jpg', 'bbb_photo.jpg'):
+                with open(os.path.join(self.folder, name), 'wb') as legacy:
+                    legacy.write(red)
+            legacy_profile = StaffProfile(agency_id=1, nickname='legacy', dob=date(1995, 1, 1),
+                                          photo_url='bbb_photo.jpg')
+            db.session.add(legacy_profile)
+            db.session.commit()
+
+            report = rekey_uploads()
+            self.assertEqual((report['files'], report['renamed'], report['duplicates'], report['references']),
+                             (2, 1, 1, 1))
+            db.session.refresh(legacy_profile)
+            self.assertEqual(legacy_profile.photo_url, blob.filename)
+            self.assertEqual(sorted(name for name in os.listdir(self.folder) if name.endswith('.jpg')),
+                             sorted([blob.filename, first.photo_url]))
+            self.assertEqual(rekey_uploads()['files'], 0)
+
+    def test_upload_serving_headers(self):
+        """ETag de contenu et cache immutable, Range, 304 et envoi délégué au proxy"""
+        with self.app.app_context():
+            blob, _ = store_image_upload(FileStorage(io.BytesIO(self._jpeg((200, 30, 30))), 'a.jpg'), PHOTO_STORE)
+            db.session.commit()
+            filename, sha256 = blob.filename, blob.sha256
+        with open(os.path.join(self.folder, 'legacy_photo.jpg'), 'wb') as legacy:
+            legacy.write(self._jpeg((30, 30, 200)))
+        client = self.app.test_client()
+
+        response = client.get(f'/staff/uploads/{filename}')
+        self.assertEqual(response.get_etag(), (sha256, False))
+        self.assertTrue(response.cache_control.immutable)
+        self.assertEqual(response.cache_control.max_age, 365 * 24 * 3600)
+        self.assertEqual(client.get(f'/staff/uploads/{filename}',
+                                    headers={'If-None-Match': f'"{sha256}"'}).status_code, 304)
+        partial = client.get(f'/staff/uploads/{filename}', headers={'Range': 'bytes=0-9'})
+        self.assertEqual((partial.status_code, len(partial.data)), (206, 10))
+        response.close()
+        partial.close()
+
+        derivative = client.get(f'/staff/uploads/derivatives/thumb/webp/{filename}')
+        self.assertEqual(derivative.get_etag(), (f'{sha256}-thumb.webp', False))
+        self.assertTrue(derivative.cache_control.immutable)
+        derivative.close()
+
+        # Ancien nom: pas de cache long, revalidation par ETag
+        legacy_response = client.get('/staff/uploads/legacy_photo.jpg')
+        self.assertTrue(legacy_response.cache_control.no_cache)
+        self.assertFalse(legacy_response.cache_control.immutable)
+        self.assertEqual(client.get('/staff/uploads/legacy_photo.jpg',
+                                    headers={'If-None-Match': legacy_response.headers['ETag']}).status_code, 304)
+        legacy_response.close()
+
+        self.app.config['UPLOAD_SENDFILE_MODE'] = 'x-accel-redirect'
+        offloaded = client.get(f'/staff/uploads/derivatives/card/jpg/{filename}')
+        self.assertEqual(offloaded.headers['X-Accel-Redirect'],
+                         f'/_uploads/derivatives/card/{sha256}.jpg')
+        self.assertEqual((offloaded.data, offloaded.mimetype), (b'', 'image/jpeg'))
+        self.app.config['UPLOAD_SENDFILE_MODE'] = 'x-sendfile'
+        offloaded = client.get(f'/staff/uploads/{filename}')
+        self.assertEqual(offloaded.headers['X-Sendfile'], os.path.join(self.folder, filename))
+        self.assertEqual(client.get('/staff/uploads/missing.jpg').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()